@@ -3,32 +3,39 @@ import sys
 import traceback
 import mariadb
 import shutil
+import threading
 from pathlib import Path
 from datetime import datetime # Import datetime for footer year
 
 from flask import (
     Flask, render_template, request, jsonify,
-    url_for, send_from_directory, abort, current_app # Make sure send_from_directory is imported
+    url_for, send_from_directory, abort, current_app, g # Make sure send_from_directory is imported
 )
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
+from settings import load_settings
+from db_pool import ConnectionPool
+
 # --- Configuration ---
+# Settings come from the environment or the file named by GAPFILL_CONFIG (see settings.py).
+# Importing this module neither connects to the database nor touches the filesystem (see prepare_worker).
+settings = load_settings()
 
 BASE_DIR = Path(__file__).parent.resolve()
 # Store uploads in an 'uploads' folder next to app.py
-UPLOAD_FOLDER = BASE_DIR / "uploads"
-UPLOAD_FOLDER.mkdir(exist_ok=True, parents=True) # Create uploads folder if it doesn't exist
+UPLOAD_FOLDER = Path(settings.get("UPLOAD_FOLDER", BASE_DIR / "uploads")).resolve()
 ALLOWED_EXTENSIONS = {".xml"}
 
 # --- Hardcoded Database Credentials ---
 # WARNING: Hardcoding credentials is NOT recommended for production environments.
+# DB_HOST / DB_PORT / DB_USER / DB_PASSWORD / DB_NAME override them.
 DB_CONFIG = {
-    "host":     "bioed-new.bu.edu",
-    "port":     4253,
-    "user":     "npetruni", # Using credentials from the first app
-    "password": "moesIsgooD1125##", # Using credentials from the first app
-    "database": "Team11",
+    "host":     settings.get("DB_HOST", "bioed-new.bu.edu"),
+    "port":     int(settings.get("DB_PORT", 4253)),
+    "user":     settings.get("DB_USER", "npetruni"), # Using credentials from the first app
+    "password": settings.get("DB_PASSWORD", "moesIsgooD1125##"), # Using credentials from the first app
+    "database": settings.get("DB_NAME", "Team11"),
 }
 
 # --- App & DB Initialization ---
@@ -39,59 +46,27 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER) # Store path string in config if needed elsewhere
 CORS(app)
 
-# Establish Database Connection
-conn = None # Initialize conn to None
-try:
-    conn = mariadb.connect(**DB_CONFIG)
-    conn.autocommit = False # Start with autocommit off for transaction control
-    print("Successfully connected to MariaDB.")
-except mariadb.Error as e:
-    print(f"FATAL: Could not connect to MariaDB: {e}", file=sys.stderr)
-    sys.exit(1) # Exit if DB connection fails on startup
+# --- Database Connection Pool ---
+# Each request checks out its own connection (see get_db) and returns it in the
+# teardown hook, so concurrent requests never share a connection or transaction.
+app.config['DB_POOL_SIZE'] = int(settings.get("DB_POOL_SIZE", 5))
+app.config['DB_POOL_TIMEOUT'] = float(settings.get("DB_POOL_TIMEOUT", 10))
+app.config['DB_POOL_HEALTH_CHECK_INTERVAL'] = float(settings.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=app.config['DB_POOL_SIZE'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'],
+)
 
 # --- Database Helper Functions ---
 
-def get_db_cursor():
-    """ Returns a new cursor for the existing connection. Handles potential disconnects. """
-    global conn # Need to modify the global connection object if reconnecting
-    try:
-        if conn is None:
-            print("Connection is None, attempting to establish initial connection.")
-            conn = mariadb.connect(**DB_CONFIG)
-            conn.autocommit = False
-            print("Successfully connected to MariaDB.")
-            return conn.cursor()
-
-        # Ping the connection to ensure it's still alive
-        # Call ping() without arguments for mariadb version 1.1.11
-        conn.ping()
-        return conn.cursor()
-    except mariadb.Error as e:
-        print(f"Error getting DB cursor or connection lost: {e}", file=sys.stderr)
-        # Attempt to reconnect if ping fails or other connection error occurs
-        print("Attempting to reconnect to DB...")
-        try:
-            # Close the potentially broken connection first, if it exists
-            if conn:
-                try:
-                    conn.close()
-                    print("Closed potentially broken DB connection.")
-                except mariadb.Error as close_e:
-                    print(f"Error closing broken connection: {close_e}", file=sys.stderr)
-            # Establish a new connection
-            conn = mariadb.connect(**DB_CONFIG) # Use connect method to re-establish
-            conn.autocommit = False # Reset autocommit
-            print("Successfully reconnected to MariaDB.")
-            return conn.cursor()
-        except mariadb.Error as reconn_e:
-             print(f"FATAL: Reconnection failed: {reconn_e}", file=sys.stderr)
-             conn = None # Set conn back to None if reconnection fails
-             # If reconnection fails, re-raise the original error or a new one
-             raise e # Re-raise the original error that caused the ping failure
-    except Exception as e:
-        # Catch other potential errors during cursor creation
-        print(f"Unexpected error getting cursor: {e}", file=sys.stderr)
-        raise
+def get_db():
+    """ Returns the pooled connection checked out for the current request (checked out on first use). """
+    if "db_conn" not in g:
+        g.db_conn = db_pool.acquire()
+    return g.db_conn
 
 def dict_rows(cur):
     """ Converts cursor fetch results into a list of dictionaries. """
@@ -125,14 +100,42 @@ def insert_gapfill_row(cur, meta):
 # --- Teardown Function ---
 @app.teardown_appcontext
 def close_db_connection(exception=None):
-    """ Closes the database cursor and connection if needed (for robust cleanup). """
-    # While the global `conn` exists, explicitly closing isn't strictly necessary
-    # if the app runs continuously. However, in Flask, it's better practice
-    # to manage resources within the app context if possible, although
-    # reconnect logic complicates this slightly for a single global `conn`.
-    # For now, we'll keep the global connection alive as intended by the original code.
-    # If you were using Flask-SQLAlchemy or connection pooling, cleanup would happen here.
-    pass
+    """ Returns the request's pooled connection (if one was checked out) to the pool. """
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        # Connections that hit a connection-level error are dropped instead of reused
+        broken = isinstance(exception, (mariadb.InterfaceError, mariadb.OperationalError))
+        db_pool.release(conn, discard=broken)
+
+
+# --- Worker Startup ---
+worker_pid = None
+
+@app.before_request
+def prepare_worker():
+    """
+    Runs once per worker process, with its first request (after any fork): creates the uploads
+    folder and opens the first pooled connection on a background thread, so a bad config shows up
+    in the logs early without holding up the request. A failed connection is reported, not fatal;
+    requests that need the database return errors.
+    """
+    global worker_pid
+    if worker_pid == os.getpid():
+        return
+    worker_pid = os.getpid()
+    try:
+        UPLOAD_FOLDER.mkdir(exist_ok=True, parents=True) # Create uploads folder if it doesn't exist
+    except OSError as e:
+        print(f"WARNING: Could not create UPLOAD_FOLDER '{UPLOAD_FOLDER}': {e}", file=sys.stderr)
+    threading.Thread(target=warm_db_pool, name="db-pool-warm", daemon=True).start()
+
+
+def warm_db_pool():
+    try:
+        db_pool.warm(1)
+        print(f"Successfully connected to MariaDB (worker pid {os.getpid()}).")
+    except mariadb.Error as e:
+        print(f"ERROR: Could not connect to MariaDB: {e}", file=sys.stderr)
 
 
 # --- Health check ---
@@ -142,6 +145,12 @@ def ping():
     return "pong", 200
 
 
+@app.route("/api/db/pool")
+def api_pool_stats():
+    """ Reports connection pool statistics (open/idle/in-use connections, waits, health checks). """
+    return jsonify(db_pool.stats())
+
+
 # --- Web UI Routes ---
 
 @app.route("/")
@@ -151,7 +160,7 @@ def index():
     error_message = None
     cur = None
     try:
-        cur = get_db_cursor() # Get cursor (handles connection logic)
+        cur = get_db().cursor() # Cursor on this request's pooled connection
         cur.execute("SELECT * FROM gapfill_models ORDER BY id DESC")
         models = dict_rows(cur)
     except mariadb.Error as e:
@@ -180,7 +189,7 @@ def search():
     error_message = None
     cur = None
     try:
-        cur = get_db_cursor()
+        cur = get_db().cursor()
         # Use parameter binding to prevent SQL injection
         cur.execute(
             "SELECT * FROM gapfill_models WHERE growth_media LIKE ? ORDER BY id DESC",
@@ -207,12 +216,6 @@ def search():
 
 # --- File Download Route ---
 
-# Make sure UPLOAD_FOLDER is defined correctly *before* this route
-if not UPLOAD_FOLDER or not os.path.isdir(UPLOAD_FOLDER):
-     print(f"WARNING: UPLOAD_FOLDER '{UPLOAD_FOLDER}' is not configured or does not exist.", file=sys.stderr)
-     # Depending on your needs, you might want to exit or handle this differently
-     # For now, we'll let it proceed, but downloads will fail.
-
 @app.route("/download/<path:filename>")
 def download(filename):
     """ Serves uploaded files for download. """
@@ -255,7 +258,7 @@ def api_list_models():
     models = []
     cur = None
     try:
-        cur = get_db_cursor()
+        cur = get_db().cursor()
         cur.execute("SELECT * FROM gapfill_models ORDER BY id DESC")
         models = dict_rows(cur)
         return jsonify(models)
@@ -357,16 +360,16 @@ def api_create_model():
 
         cur = None
         try:
-            cur = get_db_cursor()
+            cur = get_db().cursor()
             new_id = insert_gapfill_row(cur, meta)
-            conn.commit() # Commit the transaction
+            get_db().commit() # Commit the transaction
             meta["id"] = new_id # Add the new ID to the response
             current_app.logger.info(f"Successfully inserted model ID {new_id} for file '{filename}'.")
             # Return the full metadata including the ID and relative link
             return jsonify(meta), 201 # 201 Created status
 
         except mariadb.Error as db_e:
-            if conn: conn.rollback() # Rollback on database error
+            get_db().rollback() # Rollback on database error
             if dest and dest.exists():
                  dest.unlink(missing_ok=True)
                  current_app.logger.info(f"Deleted file '{filename}' due to DB error.")
@@ -378,7 +381,8 @@ def api_create_model():
 
     except Exception as e:
         # General catch-all
-        if conn:
+        conn = g.get("db_conn")
+        if conn is not None:
             try:
                 conn.rollback()
             except mariadb.Error as rb_e:
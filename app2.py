@@ -1,37 +1,92 @@
+import io
 import os
+import json
 import sys
+import hashlib
+import hmac
+import mimetypes
 import traceback
 import mariadb
 import shutil
+import time
+import tempfile
+import threading
 import logging # Make sure logging is imported
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime
 
 from flask import (
     Flask, render_template, request, jsonify,
-    url_for, send_from_directory, abort, current_app
+    url_for, send_from_directory, send_file, abort, current_app, g,
+    Response, stream_with_context
 )
 from flask_cors import CORS
+import click
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.http import parse_content_range_header
 # Import specific exceptions for better handling (optional but good practice)
-from werkzeug.exceptions import NotFound, BadRequest, InternalServerError
+from werkzeug.exceptions import NotFound, BadRequest, InternalServerError, RequestedRangeNotSatisfiable
+
+from settings import load_settings
+from db_pool import ConnectionPool, PoolTimeoutError
+from db_migrate import apply_migrations
+from model_search import SEARCH_FIELDS, parse_search_args, build_search, describe_search
+from query_cache import QueryCache, LocalGeneration, RedisGeneration
+from http_cache import not_modified, add_validators, apply_cache_control
+from http_ranges import OFFLOAD_MODES, requested_ranges, range_response, offload_response
+from blob_store import BlobStore, ENCODING_SUFFIXES, make_link, parse_link, store_blob_delta
+from chunked_upload import UploadSessions, UploadError
+from sbml_metadata import (
+    META_COLUMNS, SORT_COLUMNS, build_meta_query, parse_meta_cursor, extract_sbml_metadata, empty_summary,
+    ENTITY_TYPES, parse_entity_args, build_entity_where
+)
+from tsv_columns import TableCache, TableError, STATS, parse_filters, merge_stats, finish_stats
+from job_queue import JobQueue, JobRunner, JobHandler, JobError
+from fba import run_fba_job, run_fba_blob_job, FBAError
+from model_versions import SnapshotCache, diff_snapshots, reverse_diff, DIFF_COUNTS
+from batch_upload import (
+    BatchError, MANIFEST_NAMES, FILE_KEYS, META_KEYS, normalize_member_name, read_manifest, resolve_items, iter_archive
+)
+from bundle_stream import BUNDLE_FORMATS, stream_archive
+from upload_jobs import UPLOAD_JOB_KIND, process_upload, cleanup_staging
+from metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, statement_observer
+from query_log import QueryLog, traced_connect
+from row_fragments import RowFragments
+from row_format import parse_row_format, cursor_columns, records, encode_rows, dumps as row_json_dumps
+from model_facets import (
+    FACET_COLUMNS, count_new_models, recount_model, rebuild_facets, load_facet_combinations, summarize_facets
+)
 
 # --- Configuration ---
+# Every setting below is read from the environment or from the file named by GAPFILL_CONFIG (settings.py).
+# Nothing here connects to the database or touches the filesystem: that happens per worker process,
+# after any fork, in prepare_worker() and on the first connection checkout.
+settings = load_settings()
 
 BASE_DIR = Path(__file__).parent.resolve()
-UPLOAD_FOLDER = BASE_DIR / "uploads"
-UPLOAD_FOLDER.mkdir(exist_ok=True, parents=True)
+UPLOAD_FOLDER = Path(settings.get("UPLOAD_FOLDER", BASE_DIR / "uploads")).resolve()
 # Allow XML and TSV uploads
 ALLOWED_EXTENSIONS = {".xml", ".tsv"}
+# Optional associated TSV uploads: form input name -> gapfill_models column
+OPTIONAL_FILE_INPUTS = {
+    'growth_file_upload':  'growth_file',
+    'biomass_5mM_upload':  'biomass_file_5mM',
+    'biomass_20mM_upload': 'biomass_file_20mM',
+}
 
 # --- Hardcoded Database Credentials ---
 # WARNING: Hardcoding credentials is NOT recommended for production. Use environment variables or config files.
+# DB_HOST / DB_PORT / DB_USER / DB_PASSWORD / DB_NAME override them (e.g. for benchmarks/bench_app.py).
 DB_CONFIG = {
-    "host":     "bioed-new.bu.edu",
-    "port":     4253,
-    "user":     "npetruni",
-    "password": "moesIsgooD1125##",
-    "database": "Team11",
+    "host":     settings.get("DB_HOST", "bioed-new.bu.edu"),
+    "port":     int(settings.get("DB_PORT", 4253)),
+    "user":     settings.get("DB_USER", "npetruni"),
+    "password": settings.get("DB_PASSWORD", "moesIsgooD1125##"),
+    "database": settings.get("DB_NAME", "Team11"),
 }
 
 # --- App & DB Initialization ---
@@ -39,8 +94,89 @@ DB_CONFIG = {
 app = Flask(__name__)
 # Set the name of the script here if it's not 'app' or 'wsgi' for cleaner logs
 # app.name = 'students_25.Team11.web_application2.app2'
+# Per-request body limit. Larger files go through the chunked upload API (/api/uploads),
+# where every chunk must fit this limit and the whole file is capped by MAX_UPLOAD_SIZE.
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_UPLOAD_SIZE'] = int(settings.get("MAX_UPLOAD_SIZE", 1024 * 1024 * 1024))
+app.config['UPLOAD_SESSION_TTL'] = int(settings.get("UPLOAD_SESSION_TTL", 24 * 3600))
 app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
+# POST /api/models/batch: request body limit (archive or all files together) and models per batch
+app.config['BATCH_MAX_SIZE'] = int(settings.get("BATCH_MAX_SIZE", 1024 * 1024 * 1024))
+app.config['BATCH_MAX_ITEMS'] = int(settings.get("BATCH_MAX_ITEMS", 1000))
+# Keyset pagination page sizes (rows per page) for the HTML views and the JSON API
+app.config['INDEX_PAGE_SIZE'] = 5
+app.config['SEARCH_PAGE_SIZE'] = 50
+app.config['API_PAGE_SIZE'] = 100
+app.config['API_MAX_PAGE_SIZE'] = 1000
+# Rows pulled from the cursor per fetchmany() call by the streaming export
+app.config['EXPORT_BATCH_SIZE'] = 500
+# Most models one /api/models/bundle request may archive
+app.config['BUNDLE_MAX_MODELS'] = int(settings.get("BUNDLE_MAX_MODELS", 500))
+# 'fulltext' uses the indexes from migrations/001_search_indexes.sql (run `flask --app app2 db-migrate`);
+# 'like' is the old unindexed LIKE '%term%' search for databases that have not been migrated
+app.config['SEARCH_BACKEND'] = settings.get("SEARCH_BACKEND", "fulltext")
+# Uploads are written (and hashed) in chunks of this many bytes
+app.config['UPLOAD_CHUNK_SIZE'] = 1024 * 1024
+# Content-addressed store for every uploaded file (see blob_store.py). UPLOAD_COMPRESSION=gzip|zstd
+# stores new blobs compressed; `flask --app app2 compress-uploads` converts what is already stored.
+app.config['UPLOAD_COMPRESSION'] = settings.get("UPLOAD_COMPRESSION", "none").lower()
+BLOB_FOLDER = UPLOAD_FOLDER / "blobs"
+blob_store = BlobStore(
+    BLOB_FOLDER,
+    chunk_size=app.config['UPLOAD_CHUNK_SIZE'],
+    compression=None if app.config['UPLOAD_COMPRESSION'] == "none" else app.config['UPLOAD_COMPRESSION'],
+)
+# Downloads: DOWNLOAD_OFFLOAD=x-sendfile (Apache mod_xsendfile) or x-accel-redirect (nginx) lets the
+# front-end server send files stored uncompressed (zero-copy, ranges included) once the route has
+# validated the path. For nginx, map DOWNLOAD_ACCEL_PREFIX to UPLOAD_FOLDER in an `internal` location.
+app.config['DOWNLOAD_OFFLOAD'] = settings.get("DOWNLOAD_OFFLOAD", "none").lower()
+app.config['DOWNLOAD_ACCEL_PREFIX'] = settings.get("DOWNLOAD_ACCEL_PREFIX", "/_uploads/")
+if app.config['DOWNLOAD_OFFLOAD'] not in OFFLOAD_MODES:
+    raise RuntimeError(f"DOWNLOAD_OFFLOAD must be one of {', '.join(OFFLOAD_MODES)}.")
+# Staging area for resumable uploads; same filesystem as the blob store so finished files are linked, not copied
+upload_sessions = UploadSessions(
+    UPLOAD_FOLDER / ".staging",
+    max_size=app.config['MAX_UPLOAD_SIZE'],
+    chunk_size=app.config['UPLOAD_CHUNK_SIZE'],
+    ttl_seconds=app.config['UPLOAD_SESSION_TTL'],
+)
+# Columnar cache of uploaded TSVs (see tsv_columns.py), keyed by content digest like the blobs
+TABLE_FOLDER = UPLOAD_FOLDER / "columnar"
+table_cache = TableCache(TABLE_FOLDER)
+# /api/.../tables/<kind> -> gapfill_models column holding that TSV
+TABLE_KINDS = {
+    "growth":       "growth_file",
+    "biomass_5mM":  "biomass_file_5mM",
+    "biomass_20mM": "biomass_file_20mM",
+    "model":        "file_link", # Main file, when it was uploaded as a TSV
+}
+# Most rows one table request returns (page through larger tables with ?start=&stop=)
+app.config['TABLE_MAX_ROWS'] = int(settings.get("TABLE_MAX_ROWS", 10000))
+# Structural snapshots of SBML models for version diffs (see model_versions.py), keyed by content digest
+SNAPSHOT_FOLDER = UPLOAD_FOLDER / "structures"
+snapshot_cache = SnapshotCache(SNAPSHOT_FOLDER)
+# VERSION_DELTAS=1 re-stores the main file of each new version as a delta against its parent's
+# (in a background job; see BlobStore.store_delta). Files above DELTA_MAX_SIZE are kept in full.
+app.config['VERSION_DELTAS'] = settings.get("VERSION_DELTAS", "0") == "1"
+app.config['DELTA_MAX_SIZE'] = int(settings.get("DELTA_MAX_SIZE", 64 * 1024 * 1024))
+# Cache-Control policy per endpoint. Catalogue listings may be stored but must be revalidated
+# (cheap 304s via ETag); uploaded files are served with a stored content hash as ETag.
+app.config['CACHE_CONTROL'] = {
+    "api_list_models":   "no-cache",
+    "api_search_models": "no-cache",
+    "api_export_models": "no-cache",
+    "api_sbml_models":   "no-cache",
+    "api_model_sbml":    "no-cache",
+    "api_models_containing": "no-cache",
+    "api_model_entities": "no-cache",
+    "api_model_versions": "no-cache",
+    "api_model_diff":    "no-cache",
+    "api_model_bundle":  "no-cache",
+    "api_models_bundle": "no-cache",
+    "download":          "private, max-age=3600",
+    # Blob-store downloads never change (the URL contains the content hash)
+    "download_blob":     "private, max-age=31536000, immutable",
+}
 CORS(app)
 
 # Configure Logging
@@ -50,75 +186,112 @@ logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(asctime)s -
 app.logger.setLevel(logging.INFO) # Ensure Flask's logger also uses INFO level
 
 
-conn = None # Global connection object
+# --- Database Connection Pool ---
+# Each request checks out its own connection (see get_db) and returns it in the
+# teardown hook, so concurrent requests never share a connection or transaction.
+app.config['DB_POOL_SIZE'] = int(settings.get("DB_POOL_SIZE", 5))
+app.config['DB_POOL_TIMEOUT'] = float(settings.get("DB_POOL_TIMEOUT", 10))
+app.config['DB_POOL_HEALTH_CHECK_INTERVAL'] = float(settings.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+# Seconds clients are told to wait (Retry-After) when every pooled connection is busy
+app.config['DB_POOL_RETRY_AFTER'] = int(settings.get("DB_POOL_RETRY_AFTER", 5))
 
-# Function to establish DB connection
-def connect_db():
-    """Establishes or re-establishes the global DB connection."""
-    global conn
-    try:
-        # Close existing broken connection if it exists and isn't already closed
-        # Check _closed safely using getattr, default to True if None or attr missing
-        if conn and not getattr(conn, '_closed', True):
-             try:
-                 conn.close()
-                 app.logger.info("Closed previous potentially stale DB connection.")
-             except mariadb.Error as close_e:
-                 app.logger.warning(f"Error closing stale connection: {close_e}")
+# --- Metrics ---
+# METRICS_ENABLED=1 exposes Prometheus metrics at /metrics (see metrics.py). When it is off the
+# request hooks return immediately and pooled connections are not wrapped, so there is no timing cost.
+app.config['METRICS_ENABLED'] = settings.get("METRICS_ENABLED", "0") == "1"
+metrics = Metrics(enabled=app.config['METRICS_ENABLED'])
 
-        app.logger.info("Attempting to connect to MariaDB...")
-        conn = mariadb.connect(**DB_CONFIG)
-        conn.autocommit = False # Important: Keep autocommit off for transactions
-        app.logger.info("Successfully connected to MariaDB.")
-    except mariadb.Error as e:
-        app.logger.error(f"FATAL: Could not connect/reconnect to MariaDB: {e}", exc_info=True)
-        conn = None # Ensure conn is None if connection fails
+# --- Slow-Query Log ---
+# SLOW_QUERY_MS > 0 logs statements slower than that (execute + fetch + dict_rows conversion) with
+# their EXPLAIN plan; see query_log.py and GET /api/admin/slow-queries. Sampling keeps it bounded:
+# each slow statement is kept with probability SLOW_QUERY_SAMPLE_RATE, at most SLOW_QUERY_MAX_PER_MINUTE.
+app.config['SLOW_QUERY_MS'] = float(settings.get("SLOW_QUERY_MS", 0))
+app.config['SLOW_QUERY_SAMPLE_RATE'] = float(settings.get("SLOW_QUERY_SAMPLE_RATE", 1.0))
+app.config['SLOW_QUERY_MAX_PER_MINUTE'] = int(settings.get("SLOW_QUERY_MAX_PER_MINUTE", 30))
+app.config['SLOW_QUERY_MAX_ENTRIES'] = int(settings.get("SLOW_QUERY_MAX_ENTRIES", 200))
+# Admin endpoints require 'Authorization: Bearer <ADMIN_TOKEN>' and are disabled while it is unset. (The client
+# address is no substitute: behind a local reverse proxy every request comes from 127.0.0.1.)
+app.config['ADMIN_TOKEN'] = settings.get("ADMIN_TOKEN")
+query_log = None
+if app.config['SLOW_QUERY_MS'] > 0:
+    query_log = QueryLog(
+        threshold_ms=app.config['SLOW_QUERY_MS'],
+        sample_rate=app.config['SLOW_QUERY_SAMPLE_RATE'],
+        max_per_minute=app.config['SLOW_QUERY_MAX_PER_MINUTE'],
+        max_entries=app.config['SLOW_QUERY_MAX_ENTRIES'],
+        explain_connection=lambda: db_pool.connection(),
+    )
 
-# Establish initial connection on startup
-connect_db()
+# Statement listeners; pooled connections are only wrapped (traced) when there is one
+statement_listeners = []
+if metrics.enabled:
+    statement_listeners.append(statement_observer(metrics))
+if query_log is not None:
+    statement_listeners.append(query_log)
 
-# --- Database Helper Functions ---
-def get_db_cursor():
-    """ Returns a new cursor for the existing connection. Handles reconnects using _closed. """
-    global conn
-    MAX_RETRIES = 2
-    for attempt in range(MAX_RETRIES):
-        try:
-            # Check connection status using _closed attribute
-            is_closed = getattr(conn, '_closed', True) # Assume closed if attr missing or conn is None
-            if conn is None or is_closed:
-                app.logger.warning(f"DB connection is None or closed (Attempt {attempt + 1}/{MAX_RETRIES}). Reconnecting.")
-                connect_db() # Try to reconnect
-                if conn is None: # Check if reconnection failed
-                     # Use a specific exception if available
-                     raise mariadb.OperationalError("Database reconnection failed.")
-
-            # Ping to ensure connection is active (optional but recommended)
-            # ping() itself might try reconnecting depending on library version/settings
-            conn.ping()
-            app.logger.debug("DB connection ping successful.")
-            return conn.cursor() # Return cursor on success
-
-        except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as e:
-            app.logger.error(f"DB Error in get_db_cursor (Attempt {attempt + 1}/{MAX_RETRIES}): {e}", exc_info=False) # Log less verbosely on retry
-            if attempt < MAX_RETRIES - 1:
-                 app.logger.warning("Retrying DB connection...")
-                 # Force a reconnect attempt before the next loop iteration
-                 conn = None # Force connect_db to establish new connection
-                 connect_db()
-            else:
-                app.logger.error("Max DB connection retries reached. Raising error.")
-                raise # Re-raise the last exception after max retries
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=app.config['DB_POOL_SIZE'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'],
+    connect=traced_connect(mariadb.connect, statement_listeners) if statement_listeners else None,
+)
 
-        except AttributeError as ae:
-             app.logger.error(f"AttributeError getting DB cursor (likely conn object state check): {ae}", exc_info=True)
-             raise mariadb.InterfaceError("Internal error checking DB connection state.") from ae
-        except Exception as e:
-             app.logger.error(f"Unexpected error in get_db_cursor: {e}", exc_info=True)
-             raise # Re-raise other unexpected errors
+# --- Query Result Cache ---
+# Read-through cache for catalogue pages; api_create_model bumps its generation after a commit.
+# Set CACHE_REDIS_URL to share the generation counter (and so invalidations) between workers.
+app.config['QUERY_CACHE_ENABLED'] = settings.get("QUERY_CACHE_ENABLED", "1") != "0"
+app.config['QUERY_CACHE_MAX_ENTRIES'] = int(settings.get("QUERY_CACHE_MAX_ENTRIES", 256))
+app.config['QUERY_CACHE_TTL'] = float(settings.get("QUERY_CACHE_TTL", 60))
+app.config['CACHE_REDIS_URL'] = settings.get("CACHE_REDIS_URL")
 
-    # Should not be reached if logic above is correct
-    raise mariadb.OperationalError("Failed to get DB cursor after multiple retries.")
+query_cache = QueryCache(
+    max_entries=app.config['QUERY_CACHE_MAX_ENTRIES'],
+    ttl=app.config['QUERY_CACHE_TTL'],
+    generation=RedisGeneration(app.config['CACHE_REDIS_URL']) if app.config['CACHE_REDIS_URL'] else LocalGeneration(),
+    enabled=app.config['QUERY_CACHE_ENABLED'],
+)
+
+# Rendered <tr> fragments of the results table (row_fragments.py), keyed by model id, fragment
+# schema version and row values; rows only change key when their values do.
+app.config['ROW_FRAGMENT_CACHE_ENABLED'] = settings.get("ROW_FRAGMENT_CACHE_ENABLED", "1") != "0"
+app.config['ROW_FRAGMENT_CACHE_SIZE'] = int(settings.get("ROW_FRAGMENT_CACHE_SIZE", 5000))
+row_fragments = RowFragments(
+    link_for=lambda path: url_for("download", filepath=path),
+    max_entries=app.config['ROW_FRAGMENT_CACHE_SIZE'],
+    enabled=app.config['ROW_FRAGMENT_CACHE_ENABLED'],
+)
+
+# --- Background Jobs ---
+# FBA and other CPU-heavy work runs in a bounded process pool fed from the `jobs` table (job_queue.py),
+# never in request threads. With JOB_RUNNER_IN_APP=1 each web process runs a dispatcher thread;
+# set it to 0 and run `flask --app app2 jobs-worker` to keep job processes off the web servers.
+app.config['JOB_WORKERS'] = int(settings.get("JOB_WORKERS", 2))
+app.config['JOB_POLL_INTERVAL'] = float(settings.get("JOB_POLL_INTERVAL", 2))
+app.config['JOB_STALE_AFTER'] = int(settings.get("JOB_STALE_AFTER", 3600))
+app.config['JOB_MAX_ATTEMPTS'] = int(settings.get("JOB_MAX_ATTEMPTS", 3))
+app.config['JOB_RUNNER_IN_APP'] = settings.get("JOB_RUNNER_IN_APP", "1") != "0"
+job_queue = JobQueue(db_pool)
+# UPLOAD_ASYNC=1: POST /api/models stages the files, queues an 'upload' job and answers 202; hashing,
+# SBML metadata, table caching and the insert happen in a job worker (see upload_jobs.py).
+# UPLOAD_ASYNC=0 does all of it in the request and answers 201 with the new id.
+app.config['UPLOAD_ASYNC'] = settings.get("UPLOAD_ASYNC", "1") != "0"
+# Staged files of queued uploads; same filesystem as the blob store so they are linked into it, not copied
+INCOMING_FOLDER = UPLOAD_FOLDER / ".incoming"
+# Stores the app keeps under UPLOAD_FOLDER for itself: /download/<path> never serves them (raw,
+# compressed or delta blobs, cached tables and snapshots, other clients' unfinished uploads)
+INTERNAL_UPLOAD_DIRS = frozenset(
+    folder.relative_to(UPLOAD_FOLDER).parts[0].casefold()
+    for folder in (BLOB_FOLDER, upload_sessions.staging_dir, INCOMING_FOLDER, TABLE_FOLDER, SNAPSHOT_FOLDER)
+    if folder.is_relative_to(UPLOAD_FOLDER)
+)
+
+# --- Database Helper Functions ---
+def get_db():
+    """ Returns the pooled connection checked out for the current request (checked out on first use). """
+    if "db_conn" not in g:
+        g.db_conn = db_pool.acquire()
+    return g.db_conn
 
 
 def dict_rows(cur):
@@ -128,15 +301,16 @@ def dict_rows(cur):
         # app.logger.debug("dict_rows called with cursor having no description.")
         return []
     try:
-        cols = [d[0] for d in cur.description]
-        results = []
+        cols = cursor_columns(cur)
         # Use fetchall which returns an empty list if no rows match
-        for row in cur.fetchall():
-            # Ensure row has same number of elements as cols for zip
-            if len(row) == len(cols):
-                 results.append(dict(zip(cols, row)))
-            else:
-                 app.logger.warning(f"Row length mismatch in dict_rows. Cols: {len(cols)}, Row: {len(row)}. Skipping row.")
+        rows = cur.fetchall()
+        started = time.perf_counter()
+        # Every row has one value per description entry (DB-API), so no per-row length check is needed
+        results = records(cols, rows)
+        # Traced cursors (see query_log.py) attribute the conversion time to the statement
+        add_convert_time = getattr(cur, "add_convert_time", None)
+        if add_convert_time is not None:
+            add_convert_time(time.perf_counter() - started)
         return results
     except Exception as e:
         # Log error during processing
@@ -144,155 +318,952 @@ def dict_rows(cur):
         return [] # Return empty list on error
 
 
-def insert_gapfill_row(cur, meta):
-    """Inserts a new row into gapfill_models, expects dict with potentially None values."""
-    # Ensure this SQL matches your ACTUAL current table structure and column order
-    sql = """
+def compact_response(payload, status=200):
+    """ JSON response encoded with row_format.dumps (orjson when installed), for ?format=compact. """
+    return Response(row_json_dumps(payload), status=status, mimetype="application/json")
+
+
+def parse_page_args(args, default_limit, max_limit=None):
+    """
+    Reads keyset pagination arguments (?after_id=&limit=) from a request args dict.
+    Returns (after_id, limit); raises ValueError with a user-facing message if they are invalid.
+    """
+    max_limit = max_limit or app.config['API_MAX_PAGE_SIZE']
+    after_id = args.get("after_id", "").strip() or None
+    limit = args.get("limit", "").strip() or None
+    try:
+        after_id = int(after_id) if after_id is not None else None
+        limit = int(limit) if limit is not None else default_limit
+    except ValueError:
+        raise ValueError("'after_id' and 'limit' must be integers.")
+    if after_id is not None and after_id < 1:
+        raise ValueError("'after_id' must be a positive model ID.")
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"'limit' must be between 1 and {max_limit}.")
+    return after_id, limit
+
+
+def fetch_models_page(cur, after_id=None, limit=50, where=None, params=(), compact=False):
+    """
+    Fetches one page of gapfill_models, newest first, using keyset pagination on the id
+    primary key (WHERE id < after_id ... LIMIT n) so every page is an index range scan,
+    never an OFFSET scan. Returns (models, next_after_id); next_after_id is None on the last page.
+    With compact=True, models is (columns, row tuples) instead of a list of dicts.
+    """
+    clauses = [where] if where else []
+    params = list(params)
+    if after_id is not None:
+        clauses.append("id < ?")
+        params.append(after_id)
+    sql = "SELECT * FROM gapfill_models"
+    if clauses:
+        sql += " WHERE " + " AND ".join(f"({c})" for c in clauses)
+    # Fetch one extra row to find out whether another page exists without a COUNT(*)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+    cur.execute(sql, tuple(params))
+    if compact:
+        columns = cursor_columns(cur)
+        rows = cur.fetchall()
+        next_after_id = rows[limit - 1][columns.index("id")] if len(rows) > limit else None
+        return (columns, rows[:limit]), next_after_id
+    models = dict_rows(cur)
+    next_after_id = None
+    if len(models) > limit:
+        models = models[:limit]
+        next_after_id = models[-1]["id"]
+    return models, next_after_id
+
+
+def search_where(filters, mode):
+    """ Returns the (where, params) filter used by /search, /api/search and the export. """
+    return build_search(filters, mode, backend=app.config['SEARCH_BACKEND'])
+
+
+def get_models_page(after_id=None, limit=50, filters=None, mode="and", compact=False):
+    """
+    Cached wrapper around fetch_models_page for the catalogue and search views.
+    Only checks a DB connection out of the pool on a cache miss.
+    """
+    def load():
+        cur = get_db().cursor()
+        try:
+            where, params = search_where(filters, mode) if filters else (None, ())
+            return fetch_models_page(cur, after_id=after_id, limit=limit, where=where, params=params, compact=compact)
+        finally:
+            try: cur.close()
+            except mariadb.Error as e: app.logger.error(f"Error closing cursor in get_models_page(): {e}", exc_info=True)
+
+    cache_params = {"after_id": after_id, "limit": limit, "filters": filters, "mode": mode if filters else None}
+    return query_cache.get_or_load("models_page_compact" if compact else "models_page", cache_params, load)
+
+
+def get_catalogue_version():
+    """
+    Returns (max_id, row_count, change_counter) for gapfill_models, or None if it can't be read
+    (e.g. migration 002 not applied). Cached, and so free between writes.
+    """
+    def load():
+        cur = get_db().cursor()
+        try:
+            cur.execute(
+                "SELECT (SELECT MAX(id) FROM gapfill_models), (SELECT COUNT(*) FROM gapfill_models),"
+                " (SELECT version FROM catalogue_state WHERE id = 1)"
+            )
+            return tuple(cur.fetchone())
+        finally:
+            cur.close()
+
+    try:
+        return query_cache.get_or_load("catalogue_version", {}, load)
+    except mariadb.Error as e:
+        app.logger.warning(f"Could not read catalogue version, serving without ETag: {e}")
+        return None
+
+
+def catalogue_etag():
+    """ Strong ETag for catalogue listings: changes whenever a row is added, removed or updated. """
+    version = get_catalogue_version()
+    if version is None:
+        return None
+    max_id, row_count, change_counter = version
+    return f"catalogue-{max_id or 0}-{row_count}-{change_counter or 0}"
+
+
+def bump_catalogue_version(cur):
+    """ Increments the catalogue change counter; call inside the transaction that modifies gapfill_models. """
+    cur.execute("UPDATE catalogue_state SET version = version + 1 WHERE id = 1")
+
+
+def legacy_upload_stat(rel_path):
+    """ os.stat() of a legacy (non blob-store) upload. Raises OSError if it is missing. """
+    legacy_file = safe_join(str(UPLOAD_FOLDER), rel_path)
+    if not legacy_file:
+        raise FileNotFoundError(f"Invalid upload path '{rel_path}'.")
+    return os.stat(legacy_file)
+
+
+# sha256 of legacy uploads this process has already looked up or hashed, keyed on (path, size, mtime_ns):
+# repeated reads of an unchanged file (table requests, stats over many models) cost one stat()
+LEGACY_DIGEST_MEMO_SIZE = 4096
+legacy_digest_memo = OrderedDict()
+legacy_digest_memo_lock = threading.Lock()
+
+
+def memo_legacy_digest(rel_path, st, digest=None):
+    """ Returns the memoized digest of a legacy upload with stat ``st`` (None if unknown); stores ``digest`` if given. """
+    key = (rel_path, st.st_size, st.st_mtime_ns)
+    with legacy_digest_memo_lock:
+        if digest is None:
+            digest = legacy_digest_memo.get(key)
+            if digest is not None:
+                legacy_digest_memo.move_to_end(key)
+            return digest
+        legacy_digest_memo[key] = digest
+        while len(legacy_digest_memo) > LEGACY_DIGEST_MEMO_SIZE:
+            legacy_digest_memo.popitem(last=False)
+        return digest
+
+
+def get_upload_digest(rel_path):
+    """
+    Returns the sha256 of an uploaded file: taken straight from the path for blob-store links,
+    looked up in upload_files (memoized per process) for legacy paths, None if unknown. A recorded
+    digest only counts while the file still has the size and mtime it was recorded with.
+    """
+    cas = parse_link(rel_path)
+    if cas:
+        return cas[0]
+    try:
+        st = legacy_upload_stat(rel_path)
+    except OSError:
+        return None
+    digest = memo_legacy_digest(rel_path, st)
+    if digest is not None:
+        return digest
+
+    cur = get_db().cursor()
+    try:
+        cur.execute("SELECT sha256, size_bytes, mtime_ns FROM upload_files WHERE rel_path = ?", (rel_path,))
+        row = cur.fetchone()
+    except mariadb.Error as e:
+        app.logger.warning(f"Could not look up digest for '{rel_path}': {e}")
+        return None
+    finally:
+        cur.close()
+    if row and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+        return memo_legacy_digest(rel_path, st, row[0])
+    return None
+
+
+def record_upload_digest(cur, rel_path, digest, st):
+    """ Stores the digest of a legacy upload in upload_files, with the size and mtime it belongs to. """
+    cur.execute(
+        "INSERT INTO upload_files (rel_path, sha256, size_bytes, mtime_ns) VALUES (?, ?, ?, ?) "
+        "ON DUPLICATE KEY UPDATE sha256 = VALUES(sha256), size_bytes = VALUES(size_bytes), mtime_ns = VALUES(mtime_ns)",
+        (rel_path, digest, st.st_size, st.st_mtime_ns),
+    )
+
+
+def hash_legacy_upload(rel_path):
+    """ Returns (sha256, os.stat() result) of a legacy upload, read in UPLOAD_CHUNK_SIZE pieces. Raises OSError if it is missing. """
+    hasher = hashlib.sha256()
+    with open_upload(rel_path) as f:
+        st = os.fstat(f.fileno())
+        for chunk in iter(lambda: f.read(app.config['UPLOAD_CHUNK_SIZE']), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest(), st
+
+
+def build_model_meta(form, file_name, file_link, optional_paths=None):
+    """ Builds the gapfill_models row dict from submitted form fields and the stored file paths. """
+    optional_paths = optional_paths or {}
+    # Ensure these keys match the 'name' attributes in the HTML form; missing fields become None
+    return {
+        "growth_media":      form.get("growth_media"),
+        "gapfill_algorithm": form.get("gapfill_algorithm"),
+        "annotation_tool":   form.get("annotation_tool"),
+        "file_name":         file_name, # Original name of main uploaded file
+        "file_link":         file_link, # 'cas/<sha256>/<name>' path of the main file
+        "growth_data":       form.get("growth_data"),
+        # Paths of optional files (None if not uploaded/skipped/failed)
+        "growth_file":       optional_paths.get("growth_file"),
+        "biomass_file_5mM":  optional_paths.get("biomass_file_5mM"),
+        "biomass_file_20mM": optional_paths.get("biomass_file_20mM"),
+        "Biomass_RCH1":      None, # This column seems unused now
+    }
+
+
+# Ensure this SQL matches your ACTUAL current table structure and column order
+INSERT_GAPFILL_SQL = """
     INSERT INTO gapfill_models
       (growth_media, gapfill_algorithm, annotation_tool, file_name, file_link,
        growth_data, growth_file, biomass_file_5mM, biomass_file_20mM, Biomass_RCH1)
     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
-    # Prepare tuple of values in the correct order, using .get(key, None) for safety
-    # Ensure the order here matches the SQL columns exactly
-    values_tuple = (
+
+
+def gapfill_row_values(meta):
+    """ Tuple of values for INSERT_GAPFILL_SQL, in column order; missing keys become None. """
+    return (
         meta.get("growth_media"), meta.get("gapfill_algorithm"), meta.get("annotation_tool"),
         meta.get("file_name"), meta.get("file_link"), # file_link should be relative path now
         meta.get("growth_data"),
         meta.get("growth_file"), meta.get("biomass_file_5mM"), meta.get("biomass_file_20mM"),
         meta.get("Biomass_RCH1"), # Should be None based on current form/logic
     )
-    app.logger.debug(f"Executing SQL: {sql} with values: {values_tuple}")
+
+
+def translate_insert_error(e):
+    """ Maps constraint violations from an INSERT to IntegrityErrors with a client-readable message. """
+    if e.errno == 1048: # Column cannot be null
+        try: column_name = str(e).split("'")[1] # Attempt to parse column name
+        except IndexError: column_name = "a required field"
+        # Raise IntegrityError which might map to 400 Bad Request later
+        return mariadb.IntegrityError(f"Database Constraint Error: '{column_name}' cannot be empty.")
+    if e.errno == 1062: # Duplicate entry
+        return mariadb.IntegrityError("Database Constraint Error: Duplicate entry detected.")
+    return e
+
+
+def insert_gapfill_row(cur, meta):
+    """Inserts a new row into gapfill_models, expects dict with potentially None values."""
+    values_tuple = gapfill_row_values(meta)
+    app.logger.debug("Executing SQL: %s with values: %s", INSERT_GAPFILL_SQL, values_tuple)
     try:
-        cur.execute(sql, values_tuple)
-        app.logger.info(f"Insert successful, last row ID: {cur.lastrowid}")
+        cur.execute(INSERT_GAPFILL_SQL, values_tuple)
+        app.logger.debug("Insert successful, last row ID: %s", cur.lastrowid)
         return cur.lastrowid
     except mariadb.Error as e:
          # Log the specific data that caused the error might be too verbose, log keys instead
          current_app.logger.error(f"Error inserting data: {e} with meta keys: {list(meta.keys())}", exc_info=True)
-         # Raise specific, more informative errors if possible
-         if e.errno == 1048: # Column cannot be null
-              try: column_name = str(e).split("'")[1] # Attempt to parse column name
-              except IndexError: column_name = "a required field"
-              # Raise IntegrityError which might map to 400 Bad Request later
-              raise mariadb.IntegrityError(f"Database Constraint Error: '{column_name}' cannot be empty.")
-         elif e.errno == 1062: # Duplicate entry
-              raise mariadb.IntegrityError(f"Database Constraint Error: Duplicate entry detected.")
-         else:
+         translated = translate_insert_error(e)
+         if translated is e:
               raise # Re-raise other database errors
+         raise translated
+
+
+def insert_gapfill_rows(cur, metas):
+    """
+    Inserts many gapfill_models rows with one executemany() and returns their new ids in the
+    order of ``metas`` (None if they could not be determined). Must run inside the caller's
+    transaction: the ids are read back as the rows above the MAX(id) seen at the start, which
+    under REPEATABLE READ are exactly the rows this transaction inserted.
+    """
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM gapfill_models")
+    max_id_before = cur.fetchone()[0]
+    try:
+        cur.executemany(INSERT_GAPFILL_SQL, [gapfill_row_values(meta) for meta in metas])
+    except mariadb.Error as e:
+        current_app.logger.error(f"Error inserting batch of {len(metas)} rows: {e}", exc_info=True)
+        translated = translate_insert_error(e)
+        if translated is e:
+            raise
+        raise translated
+    cur.execute("SELECT id FROM gapfill_models WHERE id > ? ORDER BY id", (max_id_before,))
+    new_ids = [row[0] for row in cur.fetchall()]
+    if len(new_ids) != len(metas):
+        app.logger.warning(f"Batch insert: expected {len(metas)} new ids, found {len(new_ids)}; not reporting ids.")
+        return [None] * len(metas)
+    return new_ids
+
+
+def open_upload(rel_path):
+    """ Opens a stored upload (blob-store link or legacy uploads/ path) for reading its original bytes. """
+    cas = parse_link(rel_path)
+    if cas:
+        return blob_store.open(cas[0])
+    legacy_file = safe_join(str(UPLOAD_FOLDER), rel_path)
+    if not legacy_file:
+        raise FileNotFoundError(f"Invalid upload path '{rel_path}'.")
+    return open(legacy_file, "rb")
+
+
+def upload_digest(rel_path):
+    """
+    Like get_upload_digest(), but hashes a legacy file without a (current) recorded digest and
+    records it, so the file is read only once. Raises OSError if it is missing.
+    """
+    digest = get_upload_digest(rel_path)
+    if digest is None:
+        digest, st = hash_legacy_upload(rel_path)
+        memo_legacy_digest(rel_path, st, digest)
+        # Own short-lived connection: the caller's request transaction must not be committed here
+        try:
+            with db_pool.connection(timeout=1) as conn:
+                cur = conn.cursor()
+                try:
+                    record_upload_digest(cur, rel_path, digest, st)
+                    conn.commit()
+                finally:
+                    cur.close()
+        except mariadb.Error as e:
+            app.logger.warning(f"Could not record digest for '{rel_path}': {e}")
+    return digest
+
+
+def summarize_model_file(rel_path):
+    """
+    Extracts SBML metadata from a stored main model file (streaming; see sbml_metadata.py).
+    Returns None for non-XML files or if the file can't be read. A file that is not valid SBML
+    still gets a summary, with the reason in 'parse_error', so it is not retried on every backfill.
+    """
+    if not rel_path or not rel_path.lower().endswith(".xml"):
+        return None
+    try:
+        with open_upload(rel_path) as f:
+            return extract_sbml_metadata(f, collect_entities=True)
+    except (ET.ParseError, ValueError) as e:
+        app.logger.info(f"'{rel_path}' is not parseable SBML: {e}")
+        return empty_summary(parse_error=str(e)[:512])
+    except OSError as e:
+        app.logger.warning(f"Could not read '{rel_path}' for SBML metadata: {e}")
+        return None
+
+
+def store_model_index(cur, summaries):
+    """
+    Writes (model_id, summary) pairs to model_sbml_meta and the model_entities inverted index,
+    in the caller's transaction. A model's previous entity rows are replaced.
+    """
+    summaries = [(model_id, summary) for model_id, summary in summaries if summary]
+    if not summaries:
+        return
+    cur.executemany(
+        f"REPLACE INTO model_sbml_meta (model_id, {', '.join(META_COLUMNS)})"
+        f" VALUES ({', '.join('?' * (len(META_COLUMNS) + 1))})",
+        [(model_id, *(summary[column] for column in META_COLUMNS)) for model_id, summary in summaries]
+    )
+    cur.executemany("DELETE FROM model_entities WHERE model_id = ?", [(model_id,) for model_id, _ in summaries])
+    entity_rows = [
+        (entity_type, entity_id, model_id)
+        for model_id, summary in summaries
+        for entity_type, entity_ids in (summary.get("entities") or {}).items()
+        for entity_id in entity_ids
+        if len(entity_id) <= 255
+    ]
+    if entity_rows:
+        cur.executemany("INSERT INTO model_entities (entity_type, entity_id, model_id) VALUES (?, ?, ?)", entity_rows)
+
+
+
+# --- Model Versions ---
+def parse_parent_id(values):
+    """ Reads the optional 'parent_id' upload field (the model this upload is a new version of). """
+    parent_id = values.get("parent_id")
+    if parent_id in (None, ""):
+        return None
+    try:
+        return int(parent_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"'parent_id' must be a model id, not '{parent_id}'.")
+
+
+def model_diff(from_link, from_digest, to_link, to_digest):
+    """ Structural diff between two stored SBML files, from their cached snapshots (parsed on first use). """
+    old = snapshot_cache.get(from_digest, lambda: open_upload(from_link))
+    new = snapshot_cache.get(to_digest, lambda: open_upload(to_link))
+    return diff_snapshots(old, new)
+
+
+def prepare_version(parent_id, file_link, digest):
+    """
+    Looks up the parent of a new version and diffs the new main file against the parent's,
+    before the insert transaction starts. Returns the dict store_model_version() takes; 'diff'
+    is None if either file is not SBML. Raises ValueError if the parent does not exist.
+    """
+    cur = get_db().cursor()
+    try:
+        cur.execute("SELECT file_link FROM gapfill_models WHERE id = ?", (parent_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    if not row:
+        raise ValueError(f"Parent model {parent_id} not found.")
+    parent_link = row[0]
+    version = {"parent_id": parent_id, "sha256": digest, "parent_sha256": None, "diff": None}
+    try:
+        version["parent_sha256"] = upload_digest(parent_link) if parent_link else None
+        if version["parent_sha256"] and parent_link.lower().endswith(".xml") and file_link.lower().endswith(".xml"):
+            version["diff"] = model_diff(parent_link, version["parent_sha256"], file_link, digest)
+    except (ET.ParseError, FBAError, OSError) as e:
+        app.logger.warning(f"Could not diff '{file_link}' against parent model {parent_id}: {e}")
+    return version
+
+
+def store_model_diff(cur, from_digest, to_digest, diff):
+    """ Caches a diff in model_diffs (in the caller's transaction). """
+    cur.execute(
+        f"REPLACE INTO model_diffs (from_sha256, to_sha256, {', '.join(DIFF_COUNTS)}, diff)"
+        f" VALUES (?, ?, {', '.join('?' * len(DIFF_COUNTS))}, ?)",
+        (from_digest, to_digest, *(diff["summary"][key] for key in DIFF_COUNTS), json.dumps(diff))
+    )
+
+
+def store_model_version(cur, model_id, version):
+    """
+    Records a new model as the next version in its parent's lineage, in the insert transaction,
+    and caches its diff against the parent. The parent's row and the lineage's first version are
+    locked while the version number is assigned, so concurrent uploads to one lineage get
+    consecutive numbers. Returns (lineage_id, version_number).
+    """
+    parent_id = version["parent_id"]
+    # Children of one parent are numbered one at a time (this also covers the parent's first child)
+    cur.execute("SELECT id FROM gapfill_models WHERE id = ? FOR UPDATE", (parent_id,))
+    if not cur.fetchone():
+        raise ValueError(f"Parent model {parent_id} not found.")
+    cur.execute("SELECT lineage_id FROM model_versions WHERE model_id = ? FOR UPDATE", (parent_id,))
+    row = cur.fetchone()
+    if row:
+        lineage_id = row[0]
+        cur.execute("SELECT model_id FROM model_versions WHERE model_id = ? FOR UPDATE", (lineage_id,))
+    else: # Parent uploaded before versioning (or a first version): it becomes version 1 of a new lineage
+        lineage_id = parent_id
+        cur.execute(
+            "INSERT INTO model_versions (model_id, parent_id, lineage_id, version_number, sha256) VALUES (?, NULL, ?, 1, ?)",
+            (parent_id, lineage_id, version["parent_sha256"])
+        )
+    cur.execute("SELECT MAX(version_number) FROM model_versions WHERE lineage_id = ? FOR UPDATE", (lineage_id,))
+    version_number = (cur.fetchone()[0] or 0) + 1
+    cur.execute(
+        "INSERT INTO model_versions (model_id, parent_id, lineage_id, version_number, sha256) VALUES (?, ?, ?, ?, ?)",
+        (model_id, parent_id, lineage_id, version_number, version["sha256"])
+    )
+    if version["diff"] is not None:
+        store_model_diff(cur, version["parent_sha256"], version["sha256"], version["diff"])
+    if app.config['VERSION_DELTAS'] and version["parent_sha256"] and version["parent_sha256"] != version["sha256"]:
+        job_queue.enqueue(cur, "delta", model_id, {"sha256": version["sha256"], "base": version["parent_sha256"]})
+    return lineage_id, version_number
+
+
+def version_response(version, lineage_id, version_number):
+    """ Version fields added to an upload response. """
+    return {
+        "parent_id": version["parent_id"],
+        "lineage_id": lineage_id,
+        "version": version_number,
+        "diff_summary": version["diff"]["summary"] if version["diff"] else None,
+    }
+
+
+def load_table(rel_path):
+    """
+    Returns (ColumnarTable, digest) for a stored TSV, parsing it into the columnar cache on first
+    use. Raises TableError for a file that can't be parsed and OSError if it is missing.
+    """
+    digest = upload_digest(rel_path)
+    return table_cache.get(digest, lambda: open_upload(rel_path)), digest
+
+
+def cache_uploaded_tables(rel_paths):
+    """ Builds the columnar cache for the TSVs of an upload. Failures are only logged: tables are also built on first use. """
+    for rel_path in dict.fromkeys(p for p in rel_paths if p and p.lower().endswith(".tsv")):
+        try:
+            load_table(rel_path)
+        except (TableError, OSError) as e:
+            app.logger.warning(f"Could not build columnar cache for '{rel_path}': {e}")
+
+
+def locate_upload(rel_path):
+    """ Returns (filesystem path, encoding) of a stored upload for code that needs a real file; (None, None) if missing. """
+    cas = parse_link(rel_path)
+    if cas:
+        return blob_store.locate(cas[0])
+    legacy_file = safe_join(str(UPLOAD_FOLDER), rel_path)
+    if legacy_file and os.path.isfile(legacy_file):
+        return Path(legacy_file), None
+    return None, None
+
+
+def prepare_fba_job(cur, job):
+    """ Job handler: finds the model's SBML file and returns the FBA call for a worker process. """
+    cur.execute("SELECT file_link FROM gapfill_models WHERE id = ?", (job["model_id"],))
+    row = cur.fetchone()
+    if not row:
+        raise JobError(f"Model {job['model_id']} no longer exists.")
+    if not (row[0] or "").lower().endswith(".xml"):
+        raise JobError("FBA needs an SBML (.xml) model file.")
+    payload = job["payload"] or {}
+    cas = parse_link(row[0])
+    if cas: # Read through the blob store, which also rebuilds blobs stored as deltas
+        if not blob_store.exists(cas[0]):
+            raise JobError(f"Model file '{row[0]}' not found.")
+        return run_fba_blob_job, (str(BLOB_FOLDER), cas[0], payload.get("bounds"))
+    path, encoding = locate_upload(row[0])
+    if path is None:
+        raise JobError(f"Model file '{row[0]}' not found.")
+    return run_fba_job, (str(path), encoding, payload.get("bounds"))
+
+
+def prepare_delta_job(cur, job):
+    """ Job handler: re-stores a new version's main file as a delta against its parent's. """
+    payload = job["payload"] or {}
+    if not (payload.get("sha256") and payload.get("base")):
+        raise JobError("Delta job needs 'sha256' and 'base'.")
+    return store_blob_delta, (str(BLOB_FOLDER), payload["sha256"], payload["base"], app.config['DELTA_MAX_SIZE'])
+
+
+def apply_fba_result(cur, job, result):
+    """
+    Job handler: writes the predicted growth ('yes' / 'no') to the model's growth_data. Values
+    typed in at upload are kept unless the job was submitted with overwrite=true.
+    """
+    result["growth_data_written"] = False
+    if result["status"] not in ("optimal", "infeasible"):
+        return # No prediction to record (unbounded or solver failure)
+    cur.execute(f"SELECT {', '.join(FACET_COLUMNS)} FROM gapfill_models WHERE id = ? FOR UPDATE", (job["model_id"],))
+    old_row = cur.fetchone()
+    if old_row is None:
+        return # Model deleted since the job was queued
+    old_facets = dict(zip(FACET_COLUMNS, old_row))
+    growth = "yes" if result["growth"] else "no"
+    sql = "UPDATE gapfill_models SET growth_data = ? WHERE id = ?"
+    if not (job["payload"] or {}).get("overwrite"):
+        sql += " AND (growth_data IS NULL OR growth_data = '')"
+    cur.execute(sql, (growth, job["model_id"]))
+    if cur.rowcount:
+        result["growth_data_written"] = True
+        bump_catalogue_version(cur)
+        recount_model(cur, old_facets, dict(old_facets, growth_data=growth))
+
+
+def prepare_upload_job(cur, job):
+    """ Job handler: checks the staged files and the parent model, and returns the processing call for a worker process. """
+    payload = job["payload"] or {}
+    files = payload.get("files") or {}
+    if "file_link" not in files:
+        raise JobError("Upload job has no main file.")
+    for staged in files.values():
+        if not os.path.isfile(staged["path"]):
+            raise JobError(f"Staged file '{staged['name']}' is gone; upload it again.")
+    parent = None
+    if payload.get("parent_id"):
+        cur.execute("SELECT file_link FROM gapfill_models WHERE id = ?", (payload["parent_id"],))
+        row = cur.fetchone()
+        if not row:
+            raise JobError(f"Parent model {payload['parent_id']} not found.")
+        parent = {"id": payload["parent_id"], "link": row[0], "sha256": None, "path": None}
+        try:
+            if row[0]:
+                parent["sha256"] = upload_digest(row[0])
+                if not parse_link(row[0]):
+                    parent["path"] = str(locate_upload(row[0])[0])
+        except OSError as e: # Parent file missing: the version is still recorded, without a diff
+            app.logger.warning(f"Parent file of upload job {job['id']} unavailable: {e}")
+    return process_upload, (
+        str(BLOB_FOLDER), blob_store.compression, str(TABLE_FOLDER), str(SNAPSHOT_FOLDER), files, parent,
+    )
+
+
+def apply_upload_job(cur, job, result):
+    """
+    Job handler: inserts the processed upload as a gapfill_models row, with its SBML index and
+    version, in the transaction that finishes the job. The stored result keeps the new id and
+    file links; the SBML summary and the diff are not copied into the jobs table.
+    """
+    payload = job["payload"]
+    files = result["files"]
+    summary = result.pop("summary")
+    diff = result.pop("diff")
+    optional_paths = {column: info["link"] for column, info in files.items() if column != "file_link"}
+    meta = build_model_meta(payload["form"], files["file_link"]["link"].rsplit("/", 1)[-1],
+                            files["file_link"]["link"], optional_paths)
+    new_id = insert_gapfill_row(cur, meta)
+    store_model_index(cur, [(new_id, summary)])
+    parent_sha256 = result.pop("parent_sha256", None)
+    if payload.get("parent_id"):
+        version = {"parent_id": payload["parent_id"], "sha256": files["file_link"]["sha256"],
+                   "parent_sha256": parent_sha256, "diff": diff}
+        result.update(version_response(version, *store_model_version(cur, new_id, version)))
+    bump_catalogue_version(cur)
+    count_new_models(cur, [meta])
+    cur.execute("UPDATE jobs SET model_id = ? WHERE id = ?", (new_id, job["id"]))
+    result["model_id"] = new_id
+    result["file_name"] = meta["file_name"]
+
+
+JOB_HANDLERS = {
+    "fba": JobHandler(prepare=prepare_fba_job, apply=apply_fba_result),
+    # Retried: the staged files are kept until the row is committed or the job fails for good
+    UPLOAD_JOB_KIND: JobHandler(prepare=prepare_upload_job, apply=apply_upload_job, cleanup=cleanup_staging, retry=True),
+    "delta": JobHandler(prepare=prepare_delta_job, apply=None), # Nothing to write back; the result is the size saved
+}
+job_runner = JobRunner(
+    job_queue,
+    JOB_HANDLERS,
+    max_workers=app.config['JOB_WORKERS'],
+    poll_interval=app.config['JOB_POLL_INTERVAL'],
+    stale_after=app.config['JOB_STALE_AFTER'],
+    max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+    on_commit=query_cache.invalidate, # growth_data changed
+)
+
+@app.errorhandler(PoolTimeoutError)
+def database_busy(error):
+    """ Every pooled connection stayed busy for DB_POOL_TIMEOUT: a temporary overload, not a server error. """
+    app.logger.warning(f"{request.method} {request.path}: {error}")
+    response = jsonify(error="The database is busy; please retry shortly.")
+    response.status_code = 503
+    response.headers["Retry-After"] = str(app.config['DB_POOL_RETRY_AFTER'])
+    return response
+
 
 # --- Teardown Function ---
 @app.teardown_appcontext
 def close_db_connection(exception=None):
-    # Runs after request context. Global conn kept open. Cursors closed in routes.
+    """ Returns the request's pooled connection (if one was checked out). Cursors are closed in routes. """
     if exception:
         # Log exceptions passed during teardown
         app.logger.error(f"App teardown triggered with exception: {exception}", exc_info=True)
-    pass
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        # Connections that hit a connection-level error are dropped instead of reused
+        broken = isinstance(exception, (mariadb.InterfaceError, mariadb.OperationalError))
+        db_pool.release(conn, discard=broken)
+
+worker_pid = None
+
+
+@app.before_request
+def prepare_worker():
+    """
+    Per-process startup, run with each worker's first request (after the server has forked):
+    creates the upload folder, checks its permissions and opens the first pooled connection in
+    the background, so configuration problems show up in the logs early without delaying the request.
+    """
+    global worker_pid
+    if worker_pid == os.getpid():
+        return
+    worker_pid = os.getpid()
+    try:
+        UPLOAD_FOLDER.mkdir(exist_ok=True, parents=True)
+    except OSError as e:
+        app.logger.error(f"Could not create UPLOAD_FOLDER '{UPLOAD_FOLDER}': {e}")
+    if not os.access(str(UPLOAD_FOLDER), os.R_OK | os.W_OK | os.X_OK):
+        app.logger.warning(f"UPLOAD_FOLDER '{UPLOAD_FOLDER}' may lack Read/Write/Execute permissions for the server process.")
+    threading.Thread(target=warm_db_pool, name="db-pool-warm", daemon=True).start()
+
+
+def warm_db_pool():
+    try:
+        db_pool.warm(1)
+        app.logger.info("Successfully connected to MariaDB (worker pid %d).", os.getpid())
+    except mariadb.Error as e:
+        app.logger.error(f"Could not connect to MariaDB: {e}")
+
+
+@app.before_request
+def start_job_runner():
+    """ Starts this process's job dispatcher thread with its first request (a no-op afterwards). """
+    if app.config['JOB_RUNNER_IN_APP'] and not job_runner.started:
+        job_runner.start()
+
+
+@app.after_request
+def set_cache_control(response):
+    """ Applies the per-route Cache-Control policy from app.config['CACHE_CONTROL'] (or a route's g.cache_control). """
+    policies = app.config['CACHE_CONTROL']
+    if g.get("cache_control"):
+        policies = {request.endpoint: g.cache_control}
+    return apply_cache_control(response, policies, request.endpoint)
 
 # --- Health check ---
 @app.route("/ping")
 def ping():
     # Optional: Add DB check
     # try:
-    #     with get_db_cursor() as cur: cur.execute("SELECT 1")
+    #     with db_pool.connection() as c: c.cursor().execute("SELECT 1")
     #     return "pong (DB OK)", 200
     # except Exception: return "pong (DB Error)", 503
     return "pong", 200
 
+@app.route("/api/db/pool")
+def api_pool_stats():
+    """ Reports connection pool statistics (open/idle/in-use connections, waits, health checks). """
+    return jsonify(db_pool.stats())
+
+@app.route("/api/cache/stats")
+def api_cache_stats():
+    """ Reports query cache and row fragment cache hit/miss counters, size and current generation. """
+    return jsonify(dict(query_cache.stats(), row_fragments=row_fragments.stats()))
+
+# --- Metrics ---
+metrics.describe("http_request_duration_seconds", "histogram", "Time from request start until the response (or its first streamed byte) was ready.")
+metrics.describe("db_query_duration_seconds", "histogram", "Statement execution time by statement verb and table.")
+metrics.describe("db_fetch_duration_seconds", "histogram", "Time spent fetching a statement's rows.")
+metrics.describe("db_convert_duration_seconds", "histogram", "Time spent converting a statement's rows to dicts.")
+metrics.describe("db_rows_fetched_total", "counter", "Rows fetched by statement.")
+metrics.describe("upload_bytes_total", "counter", "Bytes received in uploaded files.")
+metrics.describe("upload_files_total", "counter", "Uploaded files stored in the blob store.")
+metrics.describe("upload_store_duration_seconds", "histogram", "Time to hash and store one uploaded file.")
+
+# Pool and cache counters are already kept by db_pool / query_cache; they are read at scrape time
+POOL_COUNTERS = ("checkouts", "connections_created", "connections_discarded", "connect_failures",
+                 "health_checks", "health_check_failures", "timeouts")
+POOL_GAUGES = ("open", "idle", "in_use", "waiting", "peak_in_use")
+CACHE_COUNTERS = ("hits", "misses", "evictions", "invalidations", "backend_errors")
+FRAGMENT_COUNTERS = ("hits", "misses", "evictions")
+
+
+def pool_metrics():
+    stats = db_pool.stats()
+    for key in POOL_COUNTERS:
+        yield f"db_pool_{key}_total", "counter", f"Connection pool {key.replace('_', ' ')}.", (), stats[key]
+    for key in POOL_GAUGES:
+        yield f"db_pool_{key}_connections", "gauge", f"Connections {key.replace('_', ' ')}.", (), stats[key]
+
+
+def cache_metrics():
+    stats = query_cache.stats()
+    for key in CACHE_COUNTERS:
+        yield f"query_cache_{key}_total", "counter", f"Query cache {key.replace('_', ' ')}.", (), stats[key]
+    yield "query_cache_entries", "gauge", "Entries held in the query cache.", (), stats["entries"]
+    yield "query_cache_hit_ratio", "gauge", "Hits / lookups since the process started.", (), stats["hit_rate"]
+    stats = row_fragments.stats()
+    for key in FRAGMENT_COUNTERS:
+        yield f"row_fragment_cache_{key}_total", "counter", f"Row fragment cache {key}.", (), stats[key]
+    yield "row_fragment_cache_entries", "gauge", "Rendered rows held in the row fragment cache.", (), stats["entries"]
+
+
+metrics.add_collector(pool_metrics)
+metrics.add_collector(cache_metrics)
+
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    """ Records the request's latency under its endpoint (route function) name, method and status. """
+    if metrics.enabled and "request_started" in g:
+        metrics.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - g.request_started,
+            (("endpoint", request.endpoint or "unmatched"), ("method", request.method), ("status", str(response.status_code))),
+        )
+    return response
+
+
+def store_upload(stream):
+    """ blob_store.put_stream() that also counts the file in the upload metrics. """
+    started = time.perf_counter()
+    digest, size, created = blob_store.put_stream(stream)
+    if metrics.enabled:
+        endpoint = request.endpoint
+        labels = (("endpoint", endpoint), ("result", "new" if created else "deduplicated"))
+        metrics.inc("upload_bytes_total", labels, size)
+        metrics.inc("upload_files_total", labels)
+        metrics.observe("upload_store_duration_seconds", time.perf_counter() - started, (("endpoint", endpoint),))
+    return digest, size, created
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """ Prometheus text exposition of this process's metrics (404 unless METRICS_ENABLED=1). """
+    if not metrics.enabled:
+        raise NotFound()
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+# --- Admin ---
+def admin_denied():
+    """ None if the request may use admin endpoints, else the error response. """
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify(error="Admin endpoints are disabled; set ADMIN_TOKEN to enable them."), 403
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify(error="Admin token required."), 401
+    return None
+
+
+@app.route("/api/admin/slow-queries", methods=["GET", "DELETE"])
+def api_slow_queries():
+    """
+    Slow-query log: counters, per-statement totals (slowest first) and the latest sampled statements
+    with their timings, rows and EXPLAIN plan (?limit= caps the entries). DELETE clears it.
+    """
+    denied = admin_denied()
+    if denied:
+        return denied
+    if query_log is None:
+        return jsonify(error="Slow-query log is disabled (set SLOW_QUERY_MS)."), 404
+    if request.method == "DELETE":
+        query_log.clear()
+        return "", 204
+    try:
+        limit = int(request.args.get("limit", 0)) or None
+    except ValueError:
+        return jsonify(error="'limit' must be an integer."), 400
+    return jsonify(query_log.report(limit))
+
 # --- Web UI Routes ---
 @app.route("/")
 def index():
-    """ Renders the main page, showing the latest 5 models. """
+    """ Renders the main page, showing the latest models one page at a time (?after_id= for older ones). """
     models = []
+    next_after_id = None
     error_message = None
-    cur = None
     try:
-        app.logger.info(f"Request received for index route '/'")
-        cur = get_db_cursor()
-        # Fetch limited number of models for initial display
-        cur.execute("SELECT * FROM gapfill_models ORDER BY id DESC LIMIT 5")
-        models = dict_rows(cur)
-        app.logger.info(f"Retrieved {len(models)} models for index display.")
+        app.logger.debug("Request received for index route '/'")
+        after_id, limit = parse_page_args(request.args, app.config['INDEX_PAGE_SIZE'])
+        models, next_after_id = get_models_page(after_id=after_id, limit=limit)
+        app.logger.debug("Retrieved %d models for index display.", len(models))
+    except ValueError as ve:
+        error_message = str(ve)
     except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
         app.logger.error(f"Database error retrieving models for index: {db_e}", exc_info=True)
         error_message = "Database connection or query error retrieving models. Please try again later."
     except Exception as e:
         app.logger.error(f"Unexpected error in index(): {e}", exc_info=True)
         error_message = "An unexpected server error occurred while retrieving models."
-    finally:
-        if cur:
-            try: cur.close()
-            except mariadb.Error as e: app.logger.error(f"Error closing cursor in index(): {e}", exc_info=True)
 
+    table_header, table_rows = row_fragments.render(models)
     return render_template(
         "index.html",
         search_results=models,
+        table_header=table_header,
+        table_rows=table_rows,
         media_search=None, # Indicate no search was performed
+        next_page_url=url_for("index", after_id=next_after_id) if next_after_id else None,
+        more_rows_url=url_for("api_model_rows", after_id=next_after_id) if next_after_id else None,
+        is_first_page=not request.args.get("after_id"),
         current_year=datetime.now().year,
         error_message=error_message
     )
 
-@app.route("/search", methods=["POST"])
+@app.route("/search", methods=["GET", "POST"])
 def search():
-    """ Handles searching models by growth media and renders the results. """
+    """
+    Handles the multi-field model search form and renders one page of results
+    (GET is used for paging so page links can carry the filters).
+    """
     models = []
-    term = request.form.get("media_search", "").strip()
+    next_after_id = None
+    filters, mode = {}, "and"
     error_message = None
-    cur = None
-    app.logger.info(f"Handling search request for term: '{term}'")
     try:
-        cur = get_db_cursor()
-        # Fetch all matching models for search
-        cur.execute(
-            "SELECT * FROM gapfill_models WHERE growth_media LIKE ? ORDER BY id DESC",
-            (f"%{term}%",)
-        )
-        models = dict_rows(cur)
-        app.logger.info(f"Found {len(models)} models matching search term '{term}'.")
+        filters, mode = parse_search_args(request.values)
+        app.logger.debug("Handling search request: %s (mode=%s)", filters, mode)
+        after_id, limit = parse_page_args(request.args, app.config['SEARCH_PAGE_SIZE'])
+        models, next_after_id = get_models_page(after_id=after_id, limit=limit, filters=filters, mode=mode)
+        app.logger.debug("Found %d models matching search %s.", len(models), filters)
+    except ValueError as ve:
+        error_message = str(ve)
     except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
-        app.logger.error(f"Database error during search for '{term}': {db_e}", exc_info=True)
-        error_message = f"Database error during search for '{term}'. Please try again later."
+        app.logger.error(f"Database error during search for {filters}: {db_e}", exc_info=True)
+        error_message = "Database error during search. Please try again later."
     except Exception as e:
         app.logger.error(f"Unexpected error in search(): {e}", exc_info=True)
-        error_message = f"Search failed for '{term}' due to a server error."
-    finally:
-        if cur:
-             try: cur.close()
-             except mariadb.Error as e: app.logger.error(f"Error closing cursor in search(): {e}", exc_info=True)
+        error_message = "Search failed due to a server error."
 
+    table_header, table_rows = row_fragments.render(models)
     return render_template(
         "index.html",
         search_results=models,
-        media_search=term, # Pass the search term back to display it
+        table_header=table_header,
+        table_rows=table_rows,
+        media_search=filters.get("growth_media", ""), # Pass the search terms back to refill the form
+        search_filters=filters,
+        search_mode=mode,
+        search_summary=describe_search(filters, mode) or "all models",
+        first_page_url=url_for("search", mode=mode, **filters),
+        next_page_url=url_for("search", mode=mode, after_id=next_after_id, **filters) if next_after_id else None,
+        more_rows_url=url_for("api_model_rows", mode=mode, after_id=next_after_id, **filters) if next_after_id else None,
+        is_first_page=not request.args.get("after_id"),
         current_year=datetime.now().year,
         error_message=error_message
     )
 
 # --- File Download Route ---
-if not UPLOAD_FOLDER.exists():
-    app.logger.warning(f"UPLOAD_FOLDER '{UPLOAD_FOLDER}' does not exist at startup.")
-elif not os.access(str(UPLOAD_FOLDER), os.R_OK | os.X_OK): # Check read/execute for listing/serving
-     app.logger.warning(f"UPLOAD_FOLDER '{UPLOAD_FOLDER}' may lack Read/Execute permissions for the server process.")
-
 @app.route("/download/<path:filepath>")
 def download(filepath):
     """ Serves files from UPLOAD_FOLDER, handling subdirectories securely. """
-    app.logger.info(f"Download request received for path: '{filepath}'")
+    app.logger.debug("Download request received for path: '%s'", filepath)
     # Basic security check: prevent directory traversal ('..') and absolute paths
     normalized_path = os.path.normpath(filepath)
     if '..' in normalized_path.split(os.sep) or normalized_path.startswith((os.sep, '/')):
          app.logger.warning(f"Download rejected for potentially unsafe path: {filepath} (normalized: {normalized_path})")
          abort(400, "Invalid file path.") # Bad Request
 
-    app.logger.info(f"Attempting download via send_from_directory for path: '{filepath}' relative to '{UPLOAD_FOLDER}'")
+    # Blob-store links ('cas/<sha256>/<original name>'): the digest is the ETag and the content
+    # behind a link never changes, so clients may cache it indefinitely.
+    cas = parse_link(Path(normalized_path).as_posix())
+    if cas:
+        return download_blob(*cas)
+    top_dir = Path(normalized_path).parts[0].casefold()
+    if top_dir in INTERNAL_UPLOAD_DIRS or top_dir.startswith("."):
+        app.logger.warning(f"Download rejected for internal path: {filepath}")
+        abort(404, "File not found.")
+
+    # Conditional GET: validate against the stored content hash (ETag) and the file mtime
+    # (Last-Modified) so a revalidating client gets a 304 without the file being opened.
+    etag = last_modified = None
+    full_path = safe_join(str(UPLOAD_FOLDER), filepath)
+    if full_path and os.path.isfile(full_path):
+        last_modified = os.path.getmtime(full_path)
+        etag = get_upload_digest(Path(normalized_path).as_posix())
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
+    app.logger.debug("Attempting download via send_from_directory for path: '%s' relative to '%s'", filepath, UPLOAD_FOLDER)
     try:
+        if last_modified is not None: # Existing file inside UPLOAD_FOLDER (checked by safe_join above)
+            return send_stored_file(full_path, Path(full_path).name, etag, last_modified)
         # send_from_directory handles security checks (path within directory)
         return send_from_directory(
             directory=str(UPLOAD_FOLDER),
             path=filepath,  # Pass the relative path including potential subdirs
-            as_attachment=True # Force download dialog
+            as_attachment=True, # Force download dialog
+            etag=etag or True,  # Stored sha256 when known, otherwise Werkzeug's mtime/size-based tag
+            last_modified=last_modified
         )
+    except RequestedRangeNotSatisfiable:
+        raise # 416 with the file's length
     except (FileNotFoundError, NotFound) as e: # Catch specific not found errors
          app.logger.warning(f"File not found via send_from_directory for path: '{filepath}' within {UPLOAD_FOLDER}. Error: {e}")
          abort(404, "File not found.") # Not Found
@@ -313,38 +1284,995 @@ def download(filepath):
          abort(http_status, description=error_msg)
 
 
+def send_stored_file(path, download_name, etag, last_modified, content_encoding=None):
+    """
+    Sends a file as it is stored on disk, after the caller has validated the path and answered
+    conditional requests: handed to the front-end server when DOWNLOAD_OFFLOAD is set (files
+    without a Content-Encoding only), as 206 partial content for Range requests (single or
+    multipart), otherwise with send_file().
+    """
+    mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    mode = app.config['DOWNLOAD_OFFLOAD']
+    if mode != "none" and content_encoding is None:
+        response = offload_response(path, mode, UPLOAD_FOLDER, app.config['DOWNLOAD_ACCEL_PREFIX'], mimetype)
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    else:
+        size = os.path.getsize(path)
+        ranges = requested_ranges(size, etag, last_modified)
+        if ranges:
+            response = range_response(lambda: open(path, "rb"), size, ranges, mimetype, app.config['UPLOAD_CHUNK_SIZE'])
+            response.headers.set("Content-Disposition", "attachment", filename=download_name)
+        else:
+            # conditional=False: 304s were answered by the caller and ranges above (Werkzeug rejects multi-range)
+            response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                                 etag=etag or True, last_modified=last_modified, conditional=False)
+            response.accept_ranges = "bytes"
+        if content_encoding:
+            response.content_encoding = content_encoding
+    return add_validators(response, etag, last_modified)
+
+
+def download_blob(digest, download_name):
+    """
+    Sends a blob from the blob store under the name it was uploaded with.
+    Compressed blobs are sent as stored with a Content-Encoding header when the client accepts
+    that encoding (ranges then apply to the compressed bytes), and decompressed on the fly
+    otherwise, in which case Range requests get the whole file.
+    """
+    g.cache_control = app.config['CACHE_CONTROL']['download_blob']
+    blob_path, encoding = blob_store.locate(digest)
+    # Deltas are an internal representation, always rebuilt below; gzip/zstd can go out as stored
+    send_encoded = encoding in ENCODING_SUFFIXES and request.accept_encodings[encoding] > 0
+    # Each representation needs its own strong ETag; the plain digest always means the raw bytes
+    etag = f"{digest}.{encoding}" if send_encoded else digest
+    cached = not_modified(etag)
+    if cached:
+        cached.vary.add("Accept-Encoding")
+        return cached
+    if blob_path is None:
+        app.logger.warning(f"Download failed: blob {digest} ('{download_name}') is missing from {BLOB_FOLDER}")
+        abort(404, "File not found.")
+
+    last_modified = blob_path.stat().st_mtime
+    if encoding is None or send_encoded:
+        response = send_stored_file(blob_path, download_name, etag, last_modified, encoding if send_encoded else None)
+    else:
+        # Client can't take the stored encoding: decompress while streaming, never the whole file at once
+        def generate():
+            with blob_store.open(digest) as src:
+                while True:
+                    chunk = src.read(app.config['UPLOAD_CHUNK_SIZE'])
+                    if not chunk:
+                        break
+                    yield chunk
+        response = Response(
+            generate(), mimetype=mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+        )
+        response.headers.set("Content-Disposition", "attachment", filename=download_name)
+        response.accept_ranges = "none" # Decoded length unknown until the end; Range gets the whole file
+        add_validators(response, etag, last_modified)
+    if encoding in ENCODING_SUFFIXES:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
 # --- JSON API Routes ---
 @app.route("/api/models", methods=["GET"])
 def api_list_models():
-    """ API endpoint to list all models in JSON format. """
-    models = []
-    cur = None
+    """
+    API endpoint to list models in JSON format, newest first, one page at a time.
+    Pass the returned 'next_after_id' back as ?after_id= to get the next page (null on the last page).
+    ?format=compact returns {"columns": [...], "rows": [[...], ...]} instead of a "models" list of
+    objects (see row_format.py).
+    """
+    try:
+        after_id, limit = parse_page_args(request.args, app.config['API_PAGE_SIZE'])
+        fmt = parse_row_format(request.args)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    compact = fmt == "compact"
     try:
-        cur = get_db_cursor()
-        cur.execute("SELECT * FROM gapfill_models ORDER BY id DESC")
-        models = dict_rows(cur)
-        return jsonify(models)
+        # Answer revalidation with a 304 before any rows are fetched
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        models, next_after_id = get_models_page(after_id=after_id, limit=limit, compact=compact)
+        next_url = url_for("api_list_models", after_id=next_after_id, limit=limit,
+                           format=fmt if compact else None) if next_after_id else None
+        if compact:
+            columns, rows = models
+            response = compact_response({"columns": columns, "rows": rows, "limit": limit,
+                                         "next_after_id": next_after_id, "next": next_url})
+        else:
+            response = jsonify(
+                models=models,
+                limit=limit,
+                next_after_id=next_after_id,
+                next=next_url,
+            )
+        if next_after_id:
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+        return add_validators(response, etag)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
     except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
         app.logger.error(f"API DB error in api_list_models(): {db_e}", exc_info=True)
         return jsonify(error=f"Database error: Failed to retrieve models."), 500
     except Exception as e:
         app.logger.error(f"API Exception in api_list_models(): {e}", exc_info=True)
         return jsonify(error="Internal server error listing models"), 500
-    finally:
-        if cur:
-            try: cur.close()
-            except mariadb.Error as e: app.logger.error(f"Error closing cursor in api_list_models(): {e}", exc_info=True)
 
 
-@app.route("/api/models", methods=["POST"])
-def api_create_model():
-    """ API endpoint to upload model file (XML/TSV) and optional associated TSV files. """
-    saved_files_paths = [] # Track Path objects of saved files for cleanup
-    main_file_dest = None
+@app.route("/api/search", methods=["GET"])
+def api_search_models():
+    """
+    Multi-field search API. Filters: growth_media, gapfill_algorithm, annotation_tool, growth_data
+    and file_name (matches the main and TSV file names), combined with ?mode=and (default) or ?mode=or.
+    Paged like /api/models (?after_id=&limit=), and like it takes ?format=compact.
+    """
+    try:
+        filters, mode = parse_search_args(request.args)
+        after_id, limit = parse_page_args(request.args, app.config['API_PAGE_SIZE'])
+        fmt = parse_row_format(request.args)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    if not filters:
+        return jsonify(error=f"Provide at least one search field: {', '.join(SEARCH_FIELDS)}."), 400
+    compact = fmt == "compact"
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        models, next_after_id = get_models_page(after_id=after_id, limit=limit, filters=filters, mode=mode, compact=compact)
+        next_url = url_for("api_search_models", mode=mode, after_id=next_after_id, limit=limit,
+                           format=fmt if compact else None, **filters) if next_after_id else None
+        if compact:
+            columns, rows = models
+            response = compact_response({"columns": columns, "rows": rows, "filters": filters, "mode": mode,
+                                         "limit": limit, "next_after_id": next_after_id, "next": next_url})
+        else:
+            response = jsonify(
+                models=models,
+                filters=filters,
+                mode=mode,
+                limit=limit,
+                next_after_id=next_after_id,
+                next=next_url,
+            )
+        return add_validators(response, etag)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
+        app.logger.error(f"API DB error in api_search_models(): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Search failed."), 500
+    except Exception as e:
+        app.logger.error(f"API Exception in api_search_models(): {e}", exc_info=True)
+        return jsonify(error="Internal server error during search"), 500
+
 
+@app.route("/api/models/rows", methods=["GET"])
+def api_model_rows():
+    """
+    Next page of the index / search results table as pre-rendered <tr> HTML, for the page's
+    "Load more" button. Takes the same filters and ?mode= as /search (none for the index) and
+    ?after_id=&limit=; returns {"html", "rows", "next_after_id", "next"}.
+    """
     try:
-        # --- 1. Handle Main Model File ---
-        if "modelUpload" not in request.files:
+        filters, mode = parse_search_args(request.args)
+        page_size = app.config['SEARCH_PAGE_SIZE'] if filters else app.config['INDEX_PAGE_SIZE']
+        after_id, limit = parse_page_args(request.args, page_size)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        models, next_after_id = get_models_page(after_id=after_id, limit=limit, filters=filters or None, mode=mode)
+        _, fragments = row_fragments.render(models)
+        response = jsonify(
+            html="".join(fragments),
+            rows=len(fragments),
+            next_after_id=next_after_id,
+            next=url_for("api_model_rows", mode=mode, after_id=next_after_id, limit=limit, **filters) if next_after_id else None,
+        )
+        return add_validators(response, etag)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
+        app.logger.error(f"API DB error in api_model_rows(): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve models."), 500
+    except Exception as e:
+        app.logger.error(f"API Exception in api_model_rows(): {e}", exc_info=True)
+        return jsonify(error="Internal server error listing models"), 500
+
+
+@app.route("/api/facets", methods=["GET"])
+def api_facets():
+    """
+    Model counts per growth_media, gapfill_algorithm, annotation_tool and growth_data value.
+    Any of those fields given as a query parameter restricts the counts to models with exactly
+    that value (e.g. ?gapfill_algorithm=CarveMe&growth_media=M9&growth_data=yes); each facet is
+    counted under the other facets' filters. ?limit= caps the values listed per facet. Read
+    from the incrementally maintained model_facet_counts table, never from gapfill_models.
+    """
+    filters = {column: request.args[column] for column in FACET_COLUMNS if request.args.get(column)}
+    limit = request.args.get("limit")
+    try:
+        limit = int(limit) if limit else None
+        if limit is not None and limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify(error="'limit' must be a positive integer."), 400
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        def load():
+            cur = get_db().cursor()
+            try:
+                return load_facet_combinations(cur)
+            finally:
+                cur.close()
+
+        combinations = query_cache.get_or_load("facet_combinations", {}, load)
+        response = jsonify(filters=filters, **summarize_facets(combinations, filters, limit))
+        return add_validators(response, etag)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
+        app.logger.error(f"API DB error in api_facets(): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to read facet counts."), 500
+    except Exception as e:
+        app.logger.error(f"API Exception in api_facets(): {e}", exc_info=True)
+        return jsonify(error="Internal server error reading facet counts"), 500
+
+
+@app.route("/api/models/export", methods=["GET"])
+def api_export_models():
+    """
+    Streams the whole (optionally filtered) catalogue as NDJSON (?format=ndjson, default), as a
+    chunked JSON array (?format=json) or as one {"columns": [...], "rows": [[...], ...]} object
+    (?format=compact, see row_format.py). Rows are read from an unbuffered cursor with fetchmany(),
+    so memory use stays flat however large gapfill_models grows. A database error mid-stream
+    ends the export with an {"error": ..., "rows_sent": n} marker, so the output stays parseable.
+    Accepts the same filters as /search (growth_media, gapfill_algorithm, ..., mode=and|or).
+    """
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in ("ndjson", "json", "compact"):
+        return jsonify(error="Invalid format. Use 'ndjson', 'json' or 'compact'."), 400
+    try:
+        filters, mode = parse_search_args(request.args)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    where, params = search_where(filters, mode)
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+
+    etag = catalogue_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached # Nothing changed since the client's last export
+
+    cur = None
+    try:
+        # Unbuffered: rows stay on the server/socket until fetched instead of being loaded up front
+        cur = get_db().cursor(buffered=False)
+        sql = "SELECT * FROM gapfill_models"
+        if where:
+            sql += f" WHERE {where}"
+        cur.execute(sql + " ORDER BY id DESC", params)
+        cols = [d[0] for d in cur.description]
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except (mariadb.Error, mariadb.InterfaceError, mariadb.OperationalError) as db_e:
+        app.logger.error(f"API DB error in api_export_models(): {db_e}", exc_info=True)
+        if cur:
+            try: cur.close()
+            except mariadb.Error: pass
+        return jsonify(error="Database error: Failed to export models."), 500
+
+    dumps = app.json.dumps # Handles dates/decimals the same way jsonify does
+
+    def generate():
+        rows_sent = 0
+        try:
+            if fmt == "json":
+                yield "["
+            elif fmt == "compact":
+                yield b'{"columns":' + row_json_dumps(cols) + b',"rows":['
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if fmt == "compact": # Row tuples are encoded as they are, no dict per row
+                    yield (b"," if rows_sent else b"") + encode_rows(rows)
+                else:
+                    encoded = [dumps(dict(zip(cols, row))) for row in rows]
+                    if fmt == "ndjson":
+                        yield "\n".join(encoded) + "\n"
+                    else:
+                        yield ("," if rows_sent else "") + ",".join(encoded)
+                rows_sent += len(rows)
+            if fmt == "json":
+                yield "]"
+            elif fmt == "compact":
+                yield "]}"
+            app.logger.info(f"Export finished: {rows_sent} models streamed as {fmt}.")
+        except mariadb.Error as db_e:
+            # Headers are already sent, so the best we can do is log and end the stream early with
+            # valid output that says so: an error line (ndjson), an error object as the last array
+            # element (json) or an "error" key next to the rows (compact)
+            app.logger.error(f"DB error while streaming export after {rows_sent} rows: {db_e}", exc_info=True)
+            marker = {"error": "Export interrupted by a database error.", "rows_sent": rows_sent}
+            if fmt == "ndjson":
+                yield dumps(marker) + "\n"
+            elif fmt == "json":
+                yield ("," if rows_sent else "") + dumps(marker) + "]"
+            else:
+                yield "]," + dumps(marker)[1:]
+        finally:
+            try: cur.close()
+            except mariadb.Error as e: app.logger.error(f"Error closing export cursor: {e}", exc_info=True)
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=gapfill_models.{'json' if fmt == 'compact' else fmt}"
+    return add_validators(response, etag)
+
+
+# --- Bundle Downloads ---
+# Bundle manifest key (the batch upload's file keys) -> gapfill_models column
+BUNDLE_FILE_COLUMNS = dict(zip(FILE_KEYS, ("file_link", *OPTIONAL_FILE_INPUTS.values())))
+
+
+def plan_bundle(rows):
+    """
+    Lays out the archive for gapfill_models rows. Returns (manifest, members, digests): each
+    model's files go under model_<id>/, and a file shared by several models is stored once and
+    referenced by all of them. The manifest uses the batch upload format, so a bundle can be
+    posted to /api/models/batch as it is to mirror the models elsewhere; files that are missing
+    on disk are listed under 'missing'. ``digests`` identify the content (None if unknown).
+    """
+    items, missing, members, digests = [], [], [], []
+    placed = {} # digest (or legacy path) -> archive name
+    for row in rows:
+        item = {"id": row["id"], "file_name": row["file_name"], **{key: row[key] for key in META_KEYS}}
+        for key, column in BUNDLE_FILE_COLUMNS.items():
+            rel_path = row[column]
+            if not rel_path:
+                continue
+            cas = parse_link(rel_path)
+            source = cas[0] if cas else rel_path
+            if source not in placed:
+                path, encoding = locate_upload(rel_path)
+                if path is None:
+                    missing.append({"id": row["id"], "column": column, "path": rel_path})
+                    continue
+                name = f"model_{row['id']}/{cas[1] if cas else Path(rel_path).name}"
+                stem, ext = os.path.splitext(name)
+                n = 2
+                while name in placed.values(): # Same name, different content (e.g. growth and biomass TSVs)
+                    name, n = f"{stem}_{n}{ext}", n + 1
+                placed[source] = name
+                # Compressed and delta blobs have no known size until read (tar then counts first)
+                size = path.stat().st_size if encoding is None else None
+                members.append((name, size, lambda rel_path=rel_path: open_upload(rel_path)))
+                digests.append(cas[0] if cas else get_upload_digest(rel_path))
+            item[key] = placed[source]
+        items.append(item)
+    return {"models": items, "missing": missing}, members, digests
+
+
+def parse_bundle_ids(values):
+    """ Model ids from ?ids=1,2,3 (repeatable) or a JSON/form 'ids' list, deduplicated in order. """
+    raw = values.getlist("ids") if hasattr(values, "getlist") else values.get("ids") or []
+    if isinstance(raw, (str, int)):
+        raw = [raw]
+    ids = []
+    for value in raw:
+        for part in str(value).split(","):
+            if part.strip():
+                try:
+                    ids.append(int(part))
+                except ValueError:
+                    raise ValueError(f"Invalid model id '{part.strip()}'.")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("No model ids given; use ?ids=1,2,3.")
+    if len(ids) > app.config['BUNDLE_MAX_MODELS']:
+        raise ValueError(f"A bundle can hold at most {app.config['BUNDLE_MAX_MODELS']} models.")
+    return ids
+
+
+def bundle_response(model_ids, base_name):
+    """
+    Streams the files of the given models as one archive (?format=zip (default), tar or tar.gz),
+    built while it is sent: no temp files, and memory does not grow with the bundle size.
+    """
+    fmt = request.args.get("format", "zip").lower()
+    if fmt not in BUNDLE_FORMATS:
+        return jsonify(error=f"Invalid format '{fmt}'. Use one of: {', '.join(BUNDLE_FORMATS)}."), 400
+    cur = None
+    try:
+        cur = get_db().cursor()
+        cur.execute(
+            f"SELECT * FROM gapfill_models WHERE id IN ({', '.join('?' * len(model_ids))}) ORDER BY id",
+            tuple(model_ids)
+        )
+        rows = dict_rows(cur)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in bundle_response({model_ids[:10]}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve models."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    not_found = sorted(set(model_ids) - {row["id"] for row in rows})
+    if not_found:
+        return jsonify(error=f"Model(s) not found: {', '.join(map(str, not_found))}."), 404
+
+    manifest, members, digests = plan_bundle(rows)
+    manifest_bytes = json.dumps(manifest, indent=2).encode("utf-8")
+    # Bundles are byte-for-byte reproducible, so the manifest plus the file digests make a strong ETag
+    etag = None
+    if None not in digests:
+        etag = hashlib.sha256("\n".join([fmt, *digests]).encode() + manifest_bytes).hexdigest()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+    members.insert(0, ("manifest.json", len(manifest_bytes), lambda: io.BytesIO(manifest_bytes)))
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+
+    def generate():
+        try:
+            yield from stream_archive(fmt, members, chunk_size)
+            app.logger.info(f"Bundle of {len(rows)} model(s) sent as {fmt} ({len(members)} files).")
+        except OSError as e:
+            # Headers are already sent: the client gets a truncated (invalid) archive
+            app.logger.error(f"Bundle of models {model_ids[:10]} interrupted: {e}", exc_info=True)
+
+    mimetype, suffix = BUNDLE_FORMATS[fmt]
+    response = Response(generate(), mimetype=mimetype)
+    response.headers.set("Content-Disposition", "attachment", filename=base_name + suffix)
+    return add_validators(response, etag)
+
+
+@app.route("/api/models/<int:model_id>/bundle", methods=["GET"])
+def api_model_bundle(model_id):
+    """ One model's main file and associated TSVs (plus manifest.json) as a single zip/tar stream. """
+    return bundle_response([model_id], f"model_{model_id}")
+
+
+@app.route("/api/models/bundle", methods=["GET", "POST"])
+def api_models_bundle():
+    """
+    Many models in one archive: GET ?ids=1,2,3 or POST a JSON/form 'ids' list (for long lists).
+    Same layout and ?format= as /api/models/<id>/bundle.
+    """
+    values = request.args
+    if request.method == "POST":
+        values = request.get_json(silent=True) or request.form
+    try:
+        model_ids = parse_bundle_ids(values)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    return bundle_response(model_ids, f"gapfill_models_{len(model_ids)}")
+
+
+@app.route("/api/models/sbml", methods=["GET"])
+def api_sbml_models():
+    """
+    Lists models with their extracted SBML metadata, filtered and sorted by model size without
+    opening any file. Filters: ?min_reactions= / max_reactions=, min_/max_metabolites, min_/max_genes,
+    ?compartment=, ?sbml_id=, ?parsed=1 (skip files that were not valid SBML).
+    Sort with ?sort=id|reactions|metabolites|genes|compartments and ?order=asc|desc (default: id desc).
+    Paged with ?limit= and the returned 'next_after' cursor passed back as ?after=.
+    """
+    try:
+        clauses, params, sort, order = build_meta_query(request.args)
+        _, limit = parse_page_args(request.args, app.config['API_PAGE_SIZE'])
+        after = parse_meta_cursor(request.args["after"]) if request.args.get("after") else None
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+
+    sort_column = SORT_COLUMNS[sort]
+    if after is not None:
+        # Keyset on (sort column, model_id): both are in every count index, so pages are range scans
+        op = ">" if order == "asc" else "<"
+        if sort == "id":
+            clauses.append(f"m.model_id {op} ?")
+            params.append(after[1])
+        else:
+            clauses.append(f"({sort_column} {op} ? OR ({sort_column} = ? AND m.model_id {op} ?))")
+            params.extend([after[0], after[0], after[1]])
+
+    def load():
+        cur = get_db().cursor()
+        try:
+            sql = (
+                "SELECT g.id, g.file_name, g.file_link, g.growth_media, g.gapfill_algorithm, g.annotation_tool, "
+                + ", ".join(f"m.{column}" for column in META_COLUMNS)
+                + " FROM model_sbml_meta m JOIN gapfill_models g ON g.id = m.model_id"
+            )
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += f" ORDER BY {sort_column} {order.upper()}, m.model_id {order.upper()} LIMIT ?"
+            cur.execute(sql, (*params, limit + 1))
+            return dict_rows(cur)
+        finally:
+            cur.close()
+
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        # Keyed on the parsed query (filters, cursor, sort), not the raw args
+        cache_params = {"clauses": clauses, "params": params, "sort": sort, "order": order, "limit": limit}
+        rows = query_cache.get_or_load("sbml_models", cache_params, load)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_sbml_models(): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve model metadata."), 500
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_value = last["id"] if sort == "id" else last[sort_column.split(".", 1)[1]]
+        next_after = f"{sort_value}:{last['id']}"
+    next_url = None
+    if next_after:
+        next_args = dict(request.args, after=next_after, limit=limit)
+        next_url = url_for("api_sbml_models", **next_args)
+    response = jsonify(models=rows, limit=limit, sort=sort, order=order, next_after=next_after, next=next_url)
+    if next_url:
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return add_validators(response, etag)
+
+
+@app.route("/api/models/<int:model_id>/sbml", methods=["GET"])
+def api_model_sbml(model_id):
+    """ SBML metadata extracted from one model's main file (404 if none has been extracted). """
+    cur = None
+    try:
+        cur = get_db().cursor()
+        cur.execute(
+            f"SELECT model_id, {', '.join(META_COLUMNS)}, extracted_at FROM model_sbml_meta WHERE model_id = ?",
+            (model_id,)
+        )
+        rows = dict_rows(cur)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_sbml({model_id}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve model metadata."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    if not rows:
+        return jsonify(error=f"No SBML metadata for model {model_id}."), 404
+    return jsonify(rows[0])
+
+
+@app.route("/api/models/containing", methods=["GET"])
+def api_models_containing():
+    """
+    Which models contain reaction / metabolite / gene X? Answered from the model_entities inverted
+    index, never by opening files. Ids are matched with or without their R_/M_/G_ prefix.
+    ?reaction=PGI&metabolite=glc__D_e (repeatable or comma-separated) with ?mode=and (all, default)
+    or ?mode=or (any). Paged like /api/models (?after_id=&limit=).
+    """
+    try:
+        terms, mode = parse_entity_args(request.args)
+        after_id, limit = parse_page_args(request.args, app.config['API_PAGE_SIZE'])
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+
+    def load():
+        cur = get_db().cursor()
+        try:
+            where, params = build_entity_where(terms, mode)
+            return fetch_models_page(cur, after_id=after_id, limit=limit, where=where, params=params)
+        finally:
+            cur.close()
+
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        cache_params = {"terms": sorted(terms), "mode": mode, "after_id": after_id, "limit": limit}
+        models, next_after_id = query_cache.get_or_load("models_containing", cache_params, load)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_models_containing(): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to look up models."), 500
+
+    next_url = None
+    if next_after_id:
+        next_args = request.args.to_dict(flat=False) # Keep repeated ?reaction= etc.
+        next_args.update(after_id=next_after_id, limit=limit)
+        next_url = url_for("api_models_containing", **next_args)
+    response = jsonify(
+        query=[{"type": entity_type, "id": entity_id} for entity_type, entity_id in terms],
+        mode=mode,
+        models=models,
+        limit=limit,
+        next_after_id=next_after_id,
+        next=next_url,
+    )
+    if next_url:
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return add_validators(response, etag)
+
+
+@app.route("/api/models/<int:model_id>/entities", methods=["GET"])
+def api_model_entities(model_id):
+    """ Indexed reaction, metabolite and gene ids of one model (?type= to return one kind only). """
+    entity_type = request.args.get("type")
+    if entity_type and entity_type not in ENTITY_TYPES:
+        return jsonify(error=f"Invalid type '{entity_type}'. Use one of: {', '.join(ENTITY_TYPES)}."), 400
+    cur = None
+    try:
+        cur = get_db().cursor()
+        sql = "SELECT entity_type, entity_id FROM model_entities WHERE model_id = ?"
+        params = [model_id]
+        if entity_type:
+            sql += " AND entity_type = ?"
+            params.append(entity_type)
+        cur.execute(sql + " ORDER BY entity_type, entity_id", tuple(params))
+        entities = {t: [] for t in ([entity_type] if entity_type else ENTITY_TYPES)}
+        for row_type, row_id in cur.fetchall():
+            entities[row_type].append(row_id)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_entities({model_id}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve model entities."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    return jsonify(model_id=model_id, entities=entities, counts={t: len(ids) for t, ids in entities.items()})
+
+
+@app.route("/api/models/<int:model_id>/versions", methods=["GET"])
+def api_model_versions(model_id):
+    """
+    The version lineage a model belongs to, oldest first: each version's parent, number and the
+    counts of its diff against the parent. A model that was never versioned is a lineage of one.
+    """
+    def load():
+        cur = get_db().cursor()
+        try:
+            cur.execute("SELECT lineage_id FROM model_versions WHERE model_id = ?", (model_id,))
+            row = cur.fetchone()
+            if not row:
+                cur.execute("SELECT file_name FROM gapfill_models WHERE id = ?", (model_id,))
+                model = cur.fetchone()
+                if not model:
+                    return None
+                return {"lineage_id": model_id, "versions": [
+                    {"model_id": model_id, "file_name": model[0], "parent_id": None, "version": 1,
+                     "sha256": None, "created_at": None, "diff_summary": None}
+                ]}
+            cur.execute(
+                "SELECT v.model_id, m.file_name, v.parent_id, v.version_number, v.sha256, v.created_at,"
+                f" {', '.join('d.' + column for column in DIFF_COUNTS)}"
+                " FROM model_versions v"
+                " LEFT JOIN gapfill_models m ON m.id = v.model_id"
+                " LEFT JOIN model_versions p ON p.model_id = v.parent_id"
+                " LEFT JOIN model_diffs d ON d.from_sha256 = p.sha256 AND d.to_sha256 = v.sha256"
+                " WHERE v.lineage_id = ? ORDER BY v.version_number",
+                (row[0],)
+            )
+            versions = [
+                {"model_id": version_id, "file_name": file_name, "parent_id": parent_id, "version": number,
+                 "sha256": digest, "created_at": created_at,
+                 "diff_summary": dict(zip(DIFF_COUNTS, counts)) if counts[0] is not None else None}
+                for version_id, file_name, parent_id, number, digest, created_at, *counts in cur.fetchall()
+            ]
+            return {"lineage_id": row[0], "versions": versions}
+        finally:
+            cur.close()
+
+    try:
+        etag = catalogue_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        lineage = query_cache.get_or_load("model_versions", {"model_id": model_id}, load)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_versions({model_id}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve model versions."), 500
+    if lineage is None:
+        return jsonify(error=f"Model {model_id} not found."), 404
+    return add_validators(jsonify(model_id=model_id, **lineage), etag)
+
+
+@app.route("/api/models/<int:from_id>/diff/<int:to_id>", methods=["GET"])
+def api_model_diff(from_id, to_id):
+    """
+    Structural diff from one model's SBML file to another's (typically two versions of a lineage,
+    but any pair works): reactions and metabolites added or removed, changed bounds and
+    stoichiometry, and objective changes. Diffs are cached in model_diffs by file digest, in
+    either direction; a new pair is computed from the cached snapshots once and stored.
+    ?summary=1 returns only the counts.
+    """
+    summary_only = request.args.get("summary", "").lower() in ("1", "true", "yes")
+    conn = None
+    cur = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT id, file_link FROM gapfill_models WHERE id IN (?, ?)", (from_id, to_id))
+        links = dict(cur.fetchall())
+        for model_id in (from_id, to_id):
+            if model_id not in links:
+                return jsonify(error=f"Model {model_id} not found."), 404
+            if not (links[model_id] or "").lower().endswith(".xml"):
+                return jsonify(error=f"Model {model_id} has no SBML (.xml) file to diff."), 400
+        from_digest, to_digest = upload_digest(links[from_id]), upload_digest(links[to_id])
+
+        # The diff of two file contents never changes, so the digests make a strong ETag
+        etag = f"diff-{from_digest}-{to_digest}" + ("-summary" if summary_only else "")
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        cur.execute(
+            "SELECT from_sha256, diff FROM model_diffs"
+            " WHERE (from_sha256 = ? AND to_sha256 = ?) OR (from_sha256 = ? AND to_sha256 = ?)",
+            (from_digest, to_digest, to_digest, from_digest)
+        )
+        stored = dict(cur.fetchall())
+        if from_digest in stored:
+            diff = json.loads(stored[from_digest])
+        elif to_digest in stored:
+            diff = reverse_diff(json.loads(stored[to_digest]))
+        else:
+            diff = model_diff(links[from_id], from_digest, links[to_id], to_digest)
+            store_model_diff(cur, from_digest, to_digest, diff)
+            conn.commit()
+    except (ET.ParseError, FBAError) as e:
+        return jsonify(error=f"Could not read the SBML of both models: {e}"), 422
+    except OSError as e:
+        app.logger.warning(f"Model file missing for diff {from_id} -> {to_id}: {e}")
+        return jsonify(error="Model file not found."), 404
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_diff({from_id}, {to_id}): {db_e}", exc_info=True)
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        return jsonify(error="Database error: Failed to diff models."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+
+    body = {"from_id": from_id, "to_id": to_id, "from_sha256": from_digest, "to_sha256": to_digest}
+    if summary_only:
+        body["summary"] = diff["summary"]
+    else:
+        body.update(diff)
+    return add_validators(jsonify(body), etag)
+
+
+def parse_table_args(args):
+    """ Reads ?columns=a,b&start=&stop=&filter= for the table routes; raises ValueError. """
+    columns = [c.strip() for c in args.get("columns", "").split(",") if c.strip()] or None
+    try:
+        start = int(args.get("start") or 0)
+        stop = int(args["stop"]) if args.get("stop") else None
+    except ValueError:
+        raise ValueError("'start' and 'stop' must be integers.")
+    if start < 0 or (stop is not None and stop < start):
+        raise ValueError("Need 0 <= start <= stop.")
+    max_rows = app.config['TABLE_MAX_ROWS']
+    if stop is None or stop - start > max_rows:
+        stop = start + max_rows
+    return columns, start, stop, parse_filters(args.getlist("filter"))
+
+
+def fetch_table_links(cur, kind, model_ids):
+    """ Returns {model_id: stored path} of one TSV kind for the given models (models without one are left out). """
+    column = TABLE_KINDS[kind]
+    placeholders = ", ".join("?" * len(model_ids))
+    cur.execute(f"SELECT id, {column} FROM gapfill_models WHERE id IN ({placeholders})", tuple(model_ids))
+    return {row_id: rel_path for row_id, rel_path in cur.fetchall()
+            if rel_path and rel_path.lower().endswith(".tsv")}
+
+
+@app.route("/api/models/<int:model_id>/tables/<kind>", methods=["GET"])
+def api_model_table(model_id, kind):
+    """
+    Reads one model's growth / biomass_5mM / biomass_20mM (or TSV 'model') table from the columnar
+    cache instead of the text file. ?columns=a,b selects columns, ?start=&stop= a row range (at most
+    TABLE_MAX_ROWS rows), and repeatable ?filter=<column><op><value> (>=, <=, >, <, ==, !=) selects rows
+    before the range is applied. The response also describes every column (name, numeric or text).
+    """
+    if kind not in TABLE_KINDS:
+        return jsonify(error=f"Unknown table '{kind}'. Use one of: {', '.join(TABLE_KINDS)}."), 400
+    try:
+        columns, start, stop, filters = parse_table_args(request.args)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+
+    cur = None
+    try:
+        cur = get_db().cursor()
+        rel_path = fetch_table_links(cur, kind, [model_id]).get(model_id)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_table({model_id}, {kind}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to look up the model."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    if rel_path is None:
+        return jsonify(error=f"Model {model_id} has no {kind} table."), 404
+
+    try:
+        table, digest = load_table(rel_path)
+        result = table.select(columns, start, stop, filters)
+    except TableError as te:
+        return jsonify(error=str(te)), 400
+    except OSError as e:
+        app.logger.warning(f"Table file for model {model_id} ({kind}) unavailable: {e}")
+        return jsonify(error="Table file not found."), 404
+    return jsonify(model_id=model_id, kind=kind, sha256=digest, selection=result, **table.describe())
+
+
+@app.route("/api/tables/<kind>/stats", methods=["GET"])
+def api_table_stats(kind):
+    """
+    Aggregate statistics of one numeric column across many models' tables, e.g.
+    /api/tables/growth/stats?ids=1,2,3&column=OD600&stats=mean,max&filter=time>=10
+    Returns the statistics per model and over all of their rows together. ?stats= picks from
+    count, sum, mean, min, max, std (all by default).
+    """
+    if kind not in TABLE_KINDS:
+        return jsonify(error=f"Unknown table '{kind}'. Use one of: {', '.join(TABLE_KINDS)}."), 400
+    column = (request.args.get("column") or "").strip()
+    stats = [s.strip() for s in request.args.get("stats", "").split(",") if s.strip()] or list(STATS)
+    try:
+        model_ids = list(dict.fromkeys(int(i) for i in request.args.get("ids", "").split(",") if i.strip()))
+        filters = parse_filters(request.args.getlist("filter"))
+    except ValueError as ve:
+        return jsonify(error=str(ve) if isinstance(ve, TableError) else "'ids' must be a comma-separated list of model IDs."), 400
+    if not column:
+        return jsonify(error="'column' is required."), 400
+    if not model_ids or len(model_ids) > app.config['API_MAX_PAGE_SIZE']:
+        return jsonify(error=f"Give between 1 and {app.config['API_MAX_PAGE_SIZE']} model IDs in 'ids'."), 400
+    unknown = [s for s in stats if s not in STATS]
+    if unknown:
+        return jsonify(error=f"Unknown stats {unknown}. Use: {', '.join(STATS)}."), 400
+
+    cur = None
+    try:
+        cur = get_db().cursor()
+        links = fetch_table_links(cur, kind, model_ids)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_table_stats({kind}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to look up models."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+
+    per_model, parts = [], []
+    for model_id in model_ids:
+        if model_id not in links:
+            per_model.append({"model_id": model_id, "error": f"No {kind} table."})
+            continue
+        try:
+            table, _ = load_table(links[model_id])
+            part = table.partial_stats(column, filters)
+        except (TableError, OSError) as e:
+            per_model.append({"model_id": model_id, "error": str(e)})
+            continue
+        parts.append(part)
+        per_model.append({"model_id": model_id, **finish_stats(part, stats)})
+    return jsonify(kind=kind, column=column, filters=request.args.getlist("filter"),
+                   overall=finish_stats(merge_stats(parts), stats), models=per_model)
+
+
+def stage_upload(stream, path):
+    """ Writes an uploaded file to the staging area as-is (no hashing); returns its size. """
+    with open(path, "wb") as out:
+        shutil.copyfileobj(stream, out, app.config['UPLOAD_CHUNK_SIZE'])
+        size = out.tell()
+    metrics.inc("upload_bytes_total", (("endpoint", request.endpoint), ("result", "staged")), size)
+    return size
+
+
+def queue_upload(main_file, main_filename):
+    """
+    UPLOAD_ASYNC path of api_create_model: stages the main file and the optional TSVs, queues an
+    'upload' job for them and answers 202 with the job id and its status URL.
+    """
+    try:
+        parent_id = parse_parent_id(request.form)
+    except ValueError as ve:
+        return jsonify(error=str(ve)), 400
+    if parent_id:
+        cur = get_db().cursor()
+        try:
+            cur.execute("SELECT id FROM gapfill_models WHERE id = ?", (parent_id,))
+            parent_exists = cur.fetchone() is not None
+        finally:
+            cur.close()
+        if not parent_exists:
+            return jsonify(error=f"Parent model {parent_id} not found."), 400
+
+    INCOMING_FOLDER.mkdir(parents=True, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=INCOMING_FOLDER)
+    try:
+        main_path = os.path.join(staging_dir, "file_link")
+        files = {"file_link": {"name": main_filename, "path": main_path}}
+        main_size = stage_upload(main_file.stream, main_path)
+        for input_name, db_column in OPTIONAL_FILE_INPUTS.items():
+            if input_name in request.files and request.files[input_name].filename:
+                opt_filename = secure_filename(request.files[input_name].filename)
+                if not opt_filename or not opt_filename.lower().endswith('.tsv'):
+                    app.logger.warning(f"Optional file upload '{opt_filename}' for {input_name} skipped (not a .tsv file).")
+                    continue
+                opt_path = os.path.join(staging_dir, db_column)
+                stage_upload(request.files[input_name].stream, opt_path)
+                files[db_column] = {"name": opt_filename, "path": opt_path}
+
+        payload = {
+            "staging": staging_dir,
+            "files": files,
+            "form": {key: request.form.get(key) for key in ("growth_media", "gapfill_algorithm", "annotation_tool", "growth_data")},
+            "parent_id": parent_id,
+        }
+        conn = get_db()
+        cur = conn.cursor()
+        try:
+            job_id = job_queue.enqueue(cur, UPLOAD_JOB_KIND, None, payload)
+            conn.commit()
+        finally:
+            cur.close()
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    job_runner.wake()
+    app.logger.info(f"Queued upload job {job_id} for '{main_filename}' ({main_size} bytes, {len(files)} file(s)).")
+
+    status_url = url_for("api_job_status", job_id=job_id)
+    response = jsonify(job_id=job_id, status="queued", status_url=status_url, file_name=main_filename,
+                       message="Upload received; processing in the background.")
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+
+@app.route("/api/models", methods=["POST"])
+def api_create_model():
+    """
+    API endpoint to upload model file (XML/TSV) and optional associated TSV files.
+    Files go into the content-addressed blob store; the row references them as 'cas/<sha256>/<name>'.
+    With UPLOAD_ASYNC (the default) the files are only staged here and the response is 202 with an
+    'upload' job to poll at /api/jobs/<id>; its result carries the new model_id once processed.
+    """
+    new_blobs = [] # Digests first stored by this request (logged if the request fails)
+
+    try:
+        # --- 1. Handle Main Model File ---
+        if "modelUpload" not in request.files:
             return jsonify(error="No main model file part ('modelUpload') provided."), 400
         main_file = request.files["modelUpload"]
         if not main_file or not main_file.filename:
@@ -358,49 +2286,33 @@ def api_create_model():
         if main_ext not in ALLOWED_EXTENSIONS:
             return jsonify(error=f"Invalid main file type '{main_ext}'. Only {', '.join(ALLOWED_EXTENSIONS)} allowed."), 400
 
-        # Determine save location and relative path for main file
-        # Example: Save main files directly in uploads root
-        main_file_relative_path = main_filename # Path relative to UPLOAD_FOLDER
-        main_file_dest = UPLOAD_FOLDER / main_filename # Full path for saving
-
-        # Example: Save main files in a subdirectory like 'main_models'
-        # main_file_subdir = 'main_models'
-        # main_file_relative_path = str(Path(main_file_subdir) / main_filename).replace('\\', '/') # Use forward slash
-        # main_file_dest = UPLOAD_FOLDER / main_file_subdir / main_filename
-        # Path(UPLOAD_FOLDER / main_file_subdir).mkdir(parents=True, exist_ok=True) # Ensure subdir exists
+        if app.config['UPLOAD_ASYNC']:
+            return queue_upload(main_file, main_filename)
 
-        app.logger.info(f"Main file destination: {main_file_dest}, Relative path for DB: {main_file_relative_path}")
-
-        if main_file_dest.exists():
-            return jsonify(error=f"Main file '{main_filename}' already exists. Upload cancelled."), 409
-
-        # Save main file
+        # Save main file into the blob store. Identical bytes are stored once, and files with the
+        # same name but different content no longer collide (the digest is part of the path).
         try:
-            main_file.save(str(main_file_dest)) # save expects a string path
-            saved_files_paths.append(main_file_dest) # Track saved file Path object
-            app.logger.info(f"Main file '{main_filename}' saved successfully to {main_file_dest}")
+            main_digest, main_size, created = store_upload(main_file.stream)
+            if created:
+                new_blobs.append(main_digest)
+            main_file_relative_path = make_link(main_digest, main_filename) # Path relative to /download
+            app.logger.info(f"Main file '{main_filename}' stored as blob {main_digest} ({main_size} bytes, {'new' if created else 'deduplicated'}).")
         except Exception as save_e:
             app.logger.error(f"Error saving main file {main_filename}: {save_e}", exc_info=True)
-            # Raise a specific error to be caught by the outer handler for cleanup
+            # Raise a specific error to be caught by the outer handler
             raise IOError(f"Failed to save main model file: {save_e}")
 
         # --- 2. Handle Optional TSV Files ---
-        optional_files_config = {
-            # form_input_name: { subdir_name: str, db_column_key: str }
-            'growth_file_upload': {'subdir': 'growth_file', 'db_column': 'growth_file'},
-            'biomass_5mM_upload': {'subdir': '5mM', 'db_column': 'biomass_file_5mM'},
-            'biomass_20mM_upload':{'subdir': '20mM', 'db_column': 'biomass_file_20mM'}
-        }
         # Dictionary to hold the relative paths for DB insertion (defaults to None)
-        optional_file_paths_for_db = { v['db_column']: None for v in optional_files_config.values() }
-        app.logger.debug(f"Processing optional files. Initial paths: {optional_file_paths_for_db}")
+        optional_file_paths_for_db = { db_column: None for db_column in OPTIONAL_FILE_INPUTS.values() }
+        app.logger.debug("Processing optional files. Initial paths: %s", optional_file_paths_for_db)
 
-        for input_name, config in optional_files_config.items():
+        for input_name, db_column in OPTIONAL_FILE_INPUTS.items():
             # Check if the file input exists in the request and has a non-empty filename
             if input_name in request.files and request.files[input_name].filename:
                 opt_file = request.files[input_name]
                 opt_filename = secure_filename(opt_file.filename)
-                app.logger.debug(f"Found optional file for {input_name}: {opt_filename}")
+                app.logger.debug("Found optional file for %s: %s", input_name, opt_filename)
 
                 if not opt_filename:
                     app.logger.warning(f"Optional file upload skipped for {input_name} due to invalid filename after securing.")
@@ -411,72 +2323,51 @@ def api_create_model():
                     app.logger.warning(f"Optional file upload '{opt_filename}' for {input_name} is not a .tsv file. Skipping.")
                     continue # Skip non-TSV files
 
-                subdir_name = config['subdir']
-                subdir_path = UPLOAD_FOLDER / subdir_name    # Use pathlib
-                opt_dest = subdir_path / opt_filename       # Use pathlib
-
-                # Check for existence *before* creating directory
-                if opt_dest.exists():
-                    app.logger.warning(f"Optional file '{opt_filename}' already exists in {subdir_name}. Skipping save, but using existing path for DB.")
-                    # Store the path relative to UPLOAD_FOLDER using forward slashes
-                    relative_path = (Path(subdir_name) / opt_filename).as_posix()
-                    optional_file_paths_for_db[config['db_column']] = relative_path
-                    app.logger.debug(f"Set DB path for {config['db_column']} to existing: {relative_path}")
-                    continue # Don't try to save, move to next optional file
-
-                # Save the optional file
+                # Save the optional file (deduplicated against every earlier upload)
                 try:
-                    subdir_path.mkdir(parents=True, exist_ok=True) # Create subdir if needed
-                    opt_file.save(str(opt_dest)) # Save expects string path
-                    saved_files_paths.append(opt_dest) # Track saved file Path object
-                    app.logger.info(f"Optional file '{opt_filename}' saved to {opt_dest}")
-                    # Store the relative path string (using forward slashes) for DB/URL
-                    relative_path = (Path(subdir_name) / opt_filename).as_posix()
-                    optional_file_paths_for_db[config['db_column']] = relative_path
-                    app.logger.debug(f"Set DB path for {config['db_column']} to new: {relative_path}")
-
+                    opt_digest, opt_size, created = store_upload(opt_file.stream)
+                    if created:
+                        new_blobs.append(opt_digest)
+                    relative_path = make_link(opt_digest, opt_filename)
+                    optional_file_paths_for_db[db_column] = relative_path
+                    app.logger.info(f"Optional file '{opt_filename}' stored as blob {opt_digest} ({'new' if created else 'deduplicated'}).")
                 except Exception as save_e:
-                    app.logger.error(f"Error saving optional file {opt_filename} to {opt_dest}: {save_e}", exc_info=True)
+                    app.logger.error(f"Error saving optional file {opt_filename}: {save_e}", exc_info=True)
                     # Decide: Continue or fail whole upload? Let's continue for now. Path will remain None.
                     # If failing is desired, uncomment below:
                     # raise IOError(f"Failed to save optional file '{opt_filename}': {save_e}")
             else:
-                 app.logger.debug(f"No file provided or empty filename for optional input: {input_name}")
-
-        # --- 3. Collect Other Form Data ---
-        # Ensure these keys match the 'name' attributes in your HTML form
-        form_field_keys = [
-            "growth_media", "gapfill_algorithm", "annotation_tool", "growth_data"
-        ]
-        # .get() defaults to None if key is missing from form submission
-        form_data = {fld: request.form.get(fld) for fld in form_field_keys}
-
-        # --- 4. Prepare Metadata for DB ---
-        # Note: file_link now stores the relative path of the main file, not a generated URL
-        meta = {
-            "growth_media":      form_data.get("growth_media"),
-            "gapfill_algorithm": form_data.get("gapfill_algorithm"),
-            "annotation_tool":   form_data.get("annotation_tool"),
-            "file_name":         main_filename,            # Original name of main uploaded file
-            "file_link":         main_file_relative_path,  # RELATIVE PATH of main file
-            "growth_data":       form_data.get("growth_data"),
-            # Add paths for optional files (will be None if not uploaded/skipped/failed)
-            "growth_file":       optional_file_paths_for_db.get('growth_file'),
-            "biomass_file_5mM":  optional_file_paths_for_db.get('biomass_file_5mM'),
-            "biomass_file_20mM": optional_file_paths_for_db.get('biomass_file_20mM'),
-            "Biomass_RCH1":      None, # This column seems unused now
-        }
-        app.logger.debug(f"Meta dictionary prepared for DB insert: {meta}")
+                 app.logger.debug("No file provided or empty filename for optional input: %s", input_name)
 
-        # --- 5. Insert into DB ---
+        # --- 3. Prepare Metadata for DB (other form fields + stored file paths) ---
+        meta = build_model_meta(request.form, main_filename, main_file_relative_path, optional_file_paths_for_db)
+        app.logger.debug("Meta dictionary prepared for DB insert: %s", meta)
+        # Parse the SBML before the transaction starts, so no locks are held while reading the file
+        sbml_summary = summarize_model_file(main_file_relative_path)
+        cache_uploaded_tables([main_file_relative_path, *optional_file_paths_for_db.values()])
+        # New version of an existing model: diff it against the parent now, store it with the row
+        try:
+            parent_id = parse_parent_id(request.form)
+            version = prepare_version(parent_id, main_file_relative_path, main_digest) if parent_id else None
+        except ValueError as ve:
+            return jsonify(error=str(ve)), 400
+
+        # --- 4. Insert into DB ---
         cur = None
         conn_local = None
         try:
-            cur = get_db_cursor()
-            conn_local = conn # Use the global connection obtained by cursor function
+            conn_local = get_db() # This request's pooled connection
+            cur = conn_local.cursor()
             new_id = insert_gapfill_row(cur, meta)
+            store_model_index(cur, [(new_id, sbml_summary)])
+            lineage = store_model_version(cur, new_id, version) if version else None
+            bump_catalogue_version(cur)
+            count_new_models(cur, [meta])
             conn_local.commit()
+            query_cache.invalidate() # Cached catalogue pages no longer include the new row
             app.logger.info(f"Successfully inserted DB record ID {new_id} referencing file '{main_filename}'.")
+            if lineage and app.config['VERSION_DELTAS']:
+                job_runner.wake()
 
             # Prepare response JSON (don't necessarily need to include all internal paths)
             response_meta = {
@@ -486,6 +2377,8 @@ def api_create_model():
                  # "file_link_path": meta.get("file_link"),
                  "message": "Upload successful."
              }
+            if lineage:
+                response_meta.update(version_response(version, *lineage))
             return jsonify(response_meta), 201 # 201 Created
 
         except (mariadb.Error, mariadb.IntegrityError) as db_e:
@@ -502,46 +2395,38 @@ def api_create_model():
     except Exception as e:
         # This catches DB errors re-raised from inner block, file save IOErrors, etc.
         app.logger.error(f"Error processing upload request: {e}", exc_info=True)
-        # Attempt DB rollback again just in case
-        if conn:
-            try:
-                # Check connection state before rollback
-                if not getattr(conn, '_closed', True): conn.rollback()
+        # Attempt DB rollback again just in case (only if this request checked out a connection)
+        conn = g.get("db_conn")
+        if conn is not None:
+            try: conn.rollback()
             except mariadb.Error as rb_e: app.logger.error(f"Outer rollback failed: {rb_e}")
 
-        # --- Cleanup ALL files potentially saved during this failed request ---
-        app.logger.warning(f"Initiating file cleanup due to error: {e}")
-        app.logger.debug(f"Files to potentially clean up: {saved_files_paths}")
-        for file_path_obj in saved_files_paths:
-            try:
-                # Ensure it's a Path object and check existence/type
-                file_path = Path(file_path_obj) # Ensure it's a Path object
-                if file_path.is_file(): # Only delete if it's a file
-                    file_path.unlink()
-                    app.logger.info(f"Cleaned up file: {file_path}")
-                elif file_path.exists():
-                     app.logger.warning(f"Cleanup skipped: Path exists but is not a file: {file_path}")
-            except Exception as del_e: # Catch broader errors during cleanup
-                 app.logger.error(f"Could not delete file '{file_path_obj}' during cleanup: {del_e}", exc_info=True)
+        # --- Blobs stored by this failed request ---
+        # They are not deleted here: a concurrent upload of the same bytes may already reference
+        # them. Unreferenced blobs are removed by `flask --app app2 blobs-gc`.
+        if new_blobs:
+            app.logger.warning(f"Upload failed; {len(new_blobs)} new blob(s) left for blobs-gc: {new_blobs}")
 
         # Determine appropriate error response message and status code
         status_code = 500
         error_message = "An unexpected internal server error occurred during upload."
         # Provide more specific error messages based on caught exception type
+        if isinstance(e, PoolTimeoutError):
+            return database_busy(e)
         if isinstance(e, mariadb.IntegrityError):
             error_message = str(e) # Use specific IntegrityError message from insert_gapfill_row
             status_code = 400 # Constraint violations are often client-fixable (Bad Request)
+        elif isinstance(e, ValueError): # e.g. the parent model disappeared before the insert
+            error_message = str(e)
+            status_code = 400
+        # OperationalError before the generic mariadb.Error it subclasses (DB unreachable, lost connection)
+        elif isinstance(e, mariadb.OperationalError):
+             error_message = f"Database connection error: {e}"
+             status_code = 503 # Service Unavailable
         elif isinstance(e, mariadb.Error):
             error_message = f"Database operation failed: {e}"
         elif isinstance(e, IOError): # If we raised IOError on file save fail
              error_message = str(e)
-        elif isinstance(e, FileExistsError): # Should be caught earlier by explicit check
-             error_message = str(e)
-             status_code = 409 # Conflict
-        # Add specific check for our OperationalError from get_db_cursor
-        elif isinstance(e, mariadb.OperationalError):
-             error_message = f"Database connection error: {e}"
-             status_code = 503 # Service Unavailable
 
         return jsonify(error=error_message), status_code
     finally:
@@ -551,6 +2436,726 @@ def api_create_model():
              except mariadb.Error as e: app.logger.error(f"Error closing cursor: {e}", exc_info=True)
 
 
+@app.route("/api/models/batch", methods=["POST"])
+def api_create_models_batch():
+    """
+    Registers many models in one request and one transaction (see batch_upload.py for the format).
+    Send either 'archive' (zip/tar containing manifest.json or manifest.tsv plus the files) or a
+    'manifest' (file or field) with the files as repeated 'files' parts. Form fields growth_media,
+    gapfill_algorithm, annotation_tool and growth_data are defaults for items that omit them.
+    Every file is streamed into the blob store, then all rows are inserted with one executemany()
+    and committed together. If any item is invalid or the insert fails nothing is inserted, and
+    the response lists the result of every item.
+    """
+    # Batches are far larger than a single upload; raise the body limit for this request only
+    request.max_content_length = app.config['BATCH_MAX_SIZE']
+    stored = {} # normalised file name -> (digest, size, display name)
+    new_blobs = []
+    manifest = None
+
+    def store(name, stream):
+        display_name = secure_filename(name.rsplit("/", 1)[-1])
+        if not display_name or Path(display_name).suffix.lower() not in ALLOWED_EXTENSIONS:
+            return # Not a model/TSV file (README, directories' metadata, ...); skip it
+        digest, size, created = store_upload(stream)
+        if created:
+            new_blobs.append(digest)
+        stored[name] = (digest, size, display_name)
+
+    try:
+        if "archive" in request.files and request.files["archive"].filename:
+            for member_name, member in iter_archive(request.files["archive"], app.config['MAX_UPLOAD_SIZE']):
+                name = normalize_member_name(member_name)
+                if name is None:
+                    continue
+                if name.rsplit("/", 1)[-1] in MANIFEST_NAMES and manifest is None:
+                    manifest = read_manifest(member, name)
+                else:
+                    store(name, member)
+        else:
+            if "manifest" in request.files and request.files["manifest"].filename:
+                manifest_file = request.files["manifest"]
+                manifest = read_manifest(manifest_file.stream, manifest_file.filename)
+            elif request.form.get("manifest"):
+                manifest = read_manifest(io.BytesIO(request.form["manifest"].encode("utf-8")), "manifest")
+            for part in request.files.getlist("files"):
+                name = normalize_member_name(part.filename)
+                if name is not None:
+                    store(name, part.stream)
+        if manifest is None:
+            raise BatchError(f"No manifest found; include {' or '.join(MANIFEST_NAMES)} in the archive or send a 'manifest'.")
+        if not manifest:
+            raise BatchError("Manifest lists no models.")
+        if len(manifest) > app.config['BATCH_MAX_ITEMS']:
+            raise BatchError(f"Batch has {len(manifest)} models; the limit is {app.config['BATCH_MAX_ITEMS']}.")
+    except BatchError as be:
+        if new_blobs:
+            app.logger.warning(f"Batch rejected; {len(new_blobs)} new blob(s) left for blobs-gc.")
+        return jsonify(error=str(be)), 400
+    except OSError as e:
+        app.logger.error(f"Storing batch files failed: {e}", exc_info=True)
+        if new_blobs:
+            app.logger.warning(f"Batch failed; {len(new_blobs)} new blob(s) left for blobs-gc.")
+        return jsonify(error="Failed to store batch files."), 500
+
+    defaults = {key: request.form.get(key) for key in ("growth_media", "gapfill_algorithm", "annotation_tool", "growth_data")}
+    results = resolve_items(manifest, stored, ALLOWED_EXTENSIONS, defaults)
+    versions = {} # item index -> prepare_version() result, for items with a parent_id
+    for r in results:
+        if r["status"] == "ok" and r["parent_id"] is not None:
+            try:
+                versions[r["index"]] = prepare_version(r["parent_id"], r["links"]["file"], r["sha256"])
+            except ValueError as ve:
+                r.update(status="error", error=str(ve))
+            except mariadb.Error as db_e:
+                app.logger.error(f"Looking up parent of batch item {r['index']} failed: {db_e}", exc_info=True)
+                return jsonify(error="Database error: could not look up parent models."), 500
+    failed = [r for r in results if r["status"] == "error"]
+    if failed:
+        app.logger.warning(f"Batch rejected: {len(failed)} of {len(results)} items invalid.")
+        for r in results:
+            if r["status"] == "ok":
+                r["status"] = "skipped" # Valid, but not inserted because the batch is all-or-nothing
+        return jsonify(error=f"{len(failed)} of {len(results)} items are invalid; nothing was inserted.",
+                       results=[{k: v for k, v in r.items() if k not in ("links", "meta")} for r in results]), 400
+
+    metas = []
+    summaries_by_digest = {} # Identical files in one batch are parsed once
+    for r in results:
+        optional_paths = {column: r["links"].get(column) for column in OPTIONAL_FILE_INPUTS.values()}
+        metas.append(build_model_meta(r["meta"], r["file_name"], r["links"]["file"], optional_paths))
+        if r["sha256"] not in summaries_by_digest:
+            summaries_by_digest[r["sha256"]] = summarize_model_file(r["links"]["file"])
+    cache_uploaded_tables([link for r in results for link in r["links"].values()])
+
+    conn = None
+    cur = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        new_ids = insert_gapfill_rows(cur, metas)
+        lineages = {}
+        if None not in new_ids: # Otherwise `flask --app app2 sbml-backfill` picks these models up
+            store_model_index(cur, [(new_id, summaries_by_digest[r["sha256"]]) for r, new_id in zip(results, new_ids)])
+            for r, new_id in zip(results, new_ids):
+                if r["index"] in versions:
+                    lineages[r["index"]] = store_model_version(cur, new_id, versions[r["index"]])
+        elif versions:
+            app.logger.warning(f"Batch insert: new ids unknown; {len(versions)} version link(s) not recorded.")
+        bump_catalogue_version(cur) # Once for the whole batch
+        count_new_models(cur, metas)
+        conn.commit()
+        query_cache.invalidate()
+    except ValueError as ve: # A parent model disappeared before the insert
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        return jsonify(error=f"Batch insert was rolled back: {ve}",
+                       results=[{"index": r["index"], "file": r["file"], "status": "rolled_back"} for r in results]), 400
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as e:
+        app.logger.error(f"Batch insert of {len(metas)} models failed: {e}", exc_info=True)
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        if new_blobs:
+            app.logger.warning(f"Batch failed; {len(new_blobs)} new blob(s) left for blobs-gc.")
+        status_code = 400 if isinstance(e, mariadb.IntegrityError) else 500
+        return jsonify(error=f"Batch insert failed and was rolled back: {e}",
+                       results=[{"index": r["index"], "file": r["file"], "status": "rolled_back"} for r in results]), status_code
+    finally:
+        if cur is not None:
+            try: cur.close()
+            except mariadb.Error as e: app.logger.error(f"Error closing cursor: {e}", exc_info=True)
+
+    app.logger.info(f"Batch inserted {len(metas)} models ({len(new_blobs)} new blobs, {len(stored)} files).")
+    if lineages and app.config['VERSION_DELTAS']:
+        job_runner.wake()
+    items = []
+    for r, new_id in zip(results, new_ids):
+        item = {"index": r["index"], "file": r["file"], "status": "created", "id": new_id,
+                "file_name": r["file_name"], "sha256": r["sha256"]}
+        if r["index"] in lineages:
+            item.update(version_response(versions[r["index"]], *lineages[r["index"]]))
+        items.append(item)
+    return jsonify(count=len(items), new_blobs=len(new_blobs), results=items), 201
+
+
+# --- Background Job API ---
+def job_response(job):
+    """ JSON view of a jobs row, with a link to poll it. """
+    body = dict(job)
+    body["status_url"] = url_for("api_job_status", job_id=job["id"])
+    return body
+
+
+@app.route("/api/models/<int:model_id>/fba", methods=["POST"])
+def api_submit_fba(model_id):
+    """
+    Queues a flux balance analysis of the model's SBML file and returns 202 with the job to poll.
+    Optional JSON body: {"overwrite": true} to replace a growth_data value typed in at upload, and
+    {"bounds": {"R_EX_glc__D_e": [-10, 1000], ...}} to override flux bounds (e.g. the medium).
+    If an identical job is already queued or running, that job is returned instead.
+    """
+    payload = request.get_json(silent=True) or {}
+    bounds = payload.get("bounds")
+    if bounds is not None:
+        if not isinstance(bounds, dict) or not all(
+            isinstance(b, list) and len(b) == 2 and all(v is None or isinstance(v, (int, float)) for v in b)
+            for b in bounds.values()
+        ):
+            return jsonify(error="'bounds' must map reaction ids to [lower, upper] numbers (null = unbounded)."), 400
+    job_payload = {"overwrite": bool(payload.get("overwrite")), "bounds": bounds}
+
+    conn = None
+    cur = None
+    try:
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("SELECT file_link FROM gapfill_models WHERE id = ?", (model_id,))
+        row = cur.fetchone()
+        if not row:
+            return jsonify(error=f"Model {model_id} not found."), 404
+        if not (row[0] or "").lower().endswith(".xml"):
+            return jsonify(error="FBA needs an SBML (.xml) model file."), 400
+        active = job_queue.find_active(cur, "fba", model_id)
+        if active and active["payload"] == job_payload:
+            return jsonify(job_response(active)), 200
+        job_id = job_queue.enqueue(cur, "fba", model_id, job_payload)
+        conn.commit()
+        job = job_queue.get(cur, job_id)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"Could not queue FBA job for model {model_id}: {db_e}", exc_info=True)
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        return jsonify(error="Database error: could not queue the job."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+
+    job_runner.wake()
+    response = jsonify(job_response(job))
+    response.status_code = 202
+    response.headers["Location"] = url_for("api_job_status", job_id=job_id)
+    return response
+
+
+@app.route("/api/models/<int:model_id>/fba", methods=["GET"])
+def api_model_fba(model_id):
+    """ The model's most recent FBA job (queued, running or finished) with its result. """
+    cur = None
+    try:
+        cur = get_db().cursor()
+        cur.execute("SELECT MAX(id) FROM jobs WHERE model_id = ? AND kind = 'fba'", (model_id,))
+        row = cur.fetchone()
+        job = job_queue.get(cur, row[0]) if row and row[0] else None
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_model_fba({model_id}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve the job."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    if job is None:
+        return jsonify(error=f"No FBA job for model {model_id}."), 404
+    response = jsonify(job_response(job))
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/api/jobs/<int:job_id>", methods=["GET"])
+def api_job_status(job_id):
+    """ Status of a background job; 'result' is filled in once it has succeeded, 'error' if it failed. """
+    cur = None
+    try:
+        cur = get_db().cursor()
+        job = job_queue.get(cur, job_id)
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except mariadb.Error as db_e:
+        app.logger.error(f"API DB error in api_job_status({job_id}): {db_e}", exc_info=True)
+        return jsonify(error="Database error: Failed to retrieve the job."), 500
+    finally:
+        if cur is not None:
+            cur.close()
+    if job is None:
+        return jsonify(error=f"Job {job_id} not found."), 404
+    response = jsonify(job_response(job))
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+# --- Resumable (Chunked) Upload API ---
+def upload_error_response(error):
+    """ JSON error for the chunked upload API; includes the current offset so clients can resume. """
+    body = {"error": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    response = jsonify(body)
+    if error.offset is not None:
+        response.headers["Upload-Offset"] = str(error.offset)
+    response.status_code = error.status
+    return response
+
+
+@app.route("/api/uploads", methods=["POST"])
+def api_upload_initiate():
+    """
+    Starts a resumable upload. Accepts JSON or form fields 'filename' (required) and
+    'total_size' (bytes, recommended). Returns the upload id and the URL to PUT chunks to.
+    """
+    payload = request.get_json(silent=True) or request.form
+    filename = secure_filename(payload.get("filename") or "")
+    if not filename:
+        return jsonify(error="A valid 'filename' is required."), 400
+    ext = Path(filename).suffix.lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        return jsonify(error=f"Invalid file type '{ext}'. Only {', '.join(ALLOWED_EXTENSIONS)} allowed."), 400
+    try:
+        total_size = int(payload["total_size"]) if payload.get("total_size") not in (None, "") else None
+    except (TypeError, ValueError):
+        return jsonify(error="'total_size' must be an integer number of bytes."), 400
+
+    try:
+        session = upload_sessions.create(filename, total_size)
+    except UploadError as ue:
+        return upload_error_response(ue)
+    app.logger.info(f"Started chunked upload {session['upload_id']} for '{filename}' ({total_size or 'unknown'} bytes).")
+    chunk_url = url_for("api_upload_chunk", upload_id=session["upload_id"])
+    response = jsonify(
+        upload_id=session["upload_id"],
+        filename=filename,
+        offset=0,
+        total_size=total_size,
+        max_chunk_size=app.config['MAX_CONTENT_LENGTH'],
+        chunk_url=chunk_url,
+        finalize_url=url_for("api_upload_finalize", upload_id=session["upload_id"]),
+    )
+    response.status_code = 201
+    response.headers["Location"] = chunk_url
+    return response
+
+
+@app.route("/api/uploads/<upload_id>", methods=["PUT", "PATCH"])
+def api_upload_chunk(upload_id):
+    """
+    Appends one chunk (the raw request body) to an upload. The chunk's starting byte comes from
+    the 'Upload-Offset' header, '?offset=' or a 'Content-Range: bytes start-end/total' header and
+    must equal the current offset; on a mismatch the response is 409 with the offset to resume from.
+    """
+    offset = request.headers.get("Upload-Offset", request.args.get("offset"))
+    if offset is None and request.headers.get("Content-Range"):
+        content_range = parse_content_range_header(request.headers["Content-Range"])
+        offset = content_range.start if content_range else None
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify(error="Chunk offset required ('Upload-Offset' header, '?offset=' or Content-Range)."), 400
+
+    try:
+        new_offset = upload_sessions.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except UploadError as ue:
+        return upload_error_response(ue)
+    metrics.inc("upload_bytes_total", (("endpoint", "api_upload_chunk"), ("result", "chunk")), new_offset - offset)
+    response = jsonify(upload_id=upload_id, offset=new_offset)
+    response.headers["Upload-Offset"] = str(new_offset)
+    return response
+
+
+@app.route("/api/uploads/<upload_id>", methods=["GET", "HEAD"])
+def api_upload_status(upload_id):
+    """ Reports how many bytes of an upload have been received (the offset to resume from). """
+    try:
+        session = upload_sessions.status(upload_id)
+    except UploadError as ue:
+        return upload_error_response(ue)
+    response = jsonify(session)
+    response.headers["Upload-Offset"] = str(session["offset"])
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.route("/api/uploads/<upload_id>", methods=["DELETE"])
+def api_upload_abort(upload_id):
+    """ Abandons an upload and deletes its staged data. """
+    try:
+        upload_sessions.status(upload_id)
+    except UploadError as ue:
+        return upload_error_response(ue)
+    upload_sessions.discard(upload_id)
+    return "", 204
+
+
+@app.route("/api/uploads/<upload_id>/finalize", methods=["POST"])
+def api_upload_finalize(upload_id):
+    """
+    Completes a resumable upload: the staged file is hashed into the blob store and the model row
+    is inserted in one transaction. Takes the same metadata fields as POST /api/models (JSON or form);
+    optional TSVs uploaded the same way are attached by id with 'growth_file_upload_id',
+    'biomass_5mM_upload_id' and 'biomass_20mM_upload_id'.
+    """
+    payload = request.get_json(silent=True) or request.form
+    # Every session stays locked until its file is in the blob store, so a chunk PUT that is
+    # still running can't append to a file after it was hashed
+    locks = ExitStack()
+    try:
+        # Check every session first so nothing is stored if one of them is incomplete
+        locks.enter_context(upload_sessions.locked(upload_id))
+        main_part, main_session = upload_sessions.complete(upload_id)
+        optional_parts = {}
+        for input_name, db_column in OPTIONAL_FILE_INPUTS.items():
+            opt_id = payload.get(f"{input_name}_id")
+            if opt_id:
+                if opt_id == upload_id or any(opt_id == other for other, _, _ in optional_parts.values()):
+                    locks.close()
+                    return jsonify(error=f"Upload '{opt_id}' is attached more than once."), 400
+                locks.enter_context(upload_sessions.locked(opt_id))
+                opt_part, opt_session = upload_sessions.complete(opt_id)
+                if not opt_session["filename"].lower().endswith(".tsv"):
+                    locks.close()
+                    return jsonify(error=f"Upload '{opt_id}' for {db_column} is not a .tsv file."), 400
+                optional_parts[db_column] = (opt_id, opt_part, opt_session["filename"])
+    except UploadError as ue:
+        locks.close()
+        return upload_error_response(ue)
+
+    conn = None
+    cur = None
+    try:
+        with locks:
+            main_digest, main_size, _ = blob_store.adopt_file(main_part)
+            main_link = make_link(main_digest, main_session["filename"])
+            optional_paths = {}
+            for db_column, (_, opt_part, opt_filename) in optional_parts.items():
+                opt_digest, _, _ = blob_store.adopt_file(opt_part)
+                optional_paths[db_column] = make_link(opt_digest, opt_filename)
+
+        meta = build_model_meta(payload, main_session["filename"], main_link, optional_paths)
+        sbml_summary = summarize_model_file(main_link)
+        cache_uploaded_tables([main_link, *optional_paths.values()])
+        parent_id = parse_parent_id(payload)
+        version = prepare_version(parent_id, main_link, main_digest) if parent_id else None
+        conn = get_db()
+        cur = conn.cursor()
+        new_id = insert_gapfill_row(cur, meta)
+        store_model_index(cur, [(new_id, sbml_summary)])
+        lineage = store_model_version(cur, new_id, version) if version else None
+        bump_catalogue_version(cur)
+        count_new_models(cur, [meta])
+        conn.commit()
+        query_cache.invalidate()
+    except ValueError as ve: # Invalid or unknown parent_id
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        return jsonify(error=str(ve)), 400
+    except PoolTimeoutError:
+        raise # Answered with 503 by database_busy()
+    except (mariadb.Error, OSError) as e:
+        # Staging files are kept (blobs were only hard-linked), so the client can retry finalize
+        app.logger.error(f"Finalizing upload {upload_id} failed: {e}", exc_info=True)
+        if conn is not None:
+            try: conn.rollback()
+            except mariadb.Error as rb_e: app.logger.error(f"Rollback failed: {rb_e}")
+        if isinstance(e, mariadb.IntegrityError):
+            return jsonify(error=str(e)), 400
+        return jsonify(error="Could not finalize upload; it can be retried."), 500
+    finally:
+        if cur is not None:
+            try: cur.close()
+            except mariadb.Error as e: app.logger.error(f"Error closing cursor: {e}", exc_info=True)
+
+    for session_id in [upload_id] + [opt_id for opt_id, _, _ in optional_parts.values()]:
+        upload_sessions.discard(session_id)
+    app.logger.info(f"Finalized chunked upload {upload_id} as model ID {new_id} ({main_size} bytes).")
+    response_meta = dict(id=new_id, file_name=meta["file_name"], sha256=main_digest, size=main_size,
+                         message="Upload successful.")
+    if lineage:
+        response_meta.update(version_response(version, *lineage))
+        if app.config['VERSION_DELTAS']:
+            job_runner.wake()
+    return jsonify(response_meta), 201
+
+
+# --- CLI Commands ---
+@app.cli.command("db-migrate")
+def db_migrate_command():
+    """ Applies pending SQL migrations from migrations/ (e.g. the search indexes). """
+    with db_pool.connection() as conn:
+        applied = apply_migrations(conn)
+    print(f"Applied migrations: {', '.join(applied)}" if applied else "Database schema is up to date.")
+
+
+@app.cli.command("blobs-gc")
+def blobs_gc_command():
+    """ Deletes blob-store files no longer referenced by any gapfill_models row (older than 1 hour). """
+    referenced = set()
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT file_link, growth_file, biomass_file_5mM, biomass_file_20mM FROM gapfill_models")
+            for row in cur.fetchall():
+                for rel_path in row:
+                    cas = parse_link(rel_path) if rel_path else None
+                    if cas:
+                        referenced.add(cas[0])
+        finally:
+            cur.close()
+    deleted = blob_store.collect_garbage(referenced)
+    print(f"Removed {len(deleted)} unreferenced blob(s); {len(referenced)} referenced.")
+
+
+@app.cli.command("compress-uploads")
+@click.option("--keep-originals", is_flag=True, help="Leave legacy upload files in place after importing them.")
+def compress_uploads_command(keep_originals):
+    """
+    Converts the existing uploads/ tree to compressed blob storage (UPLOAD_COMPRESSION):
+    legacy files referenced by gapfill_models are imported into the blob store and their rows
+    re-pointed at 'cas/<sha256>/<name>' links, then every stored blob is recompressed.
+    """
+    if blob_store.compression is None:
+        raise click.UsageError("Set UPLOAD_COMPRESSION=gzip or zstd before running compress-uploads.")
+    path_columns = ("file_link", "growth_file", "biomass_file_5mM", "biomass_file_20mM")
+    imported = {} # legacy relative path -> new blob link
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT id, {', '.join(path_columns)} FROM gapfill_models")
+            rows = cur.fetchall()
+            updated_rows = 0
+            for row_id, *paths in rows:
+                changes = {}
+                for column, rel_path in zip(path_columns, paths):
+                    if not rel_path or parse_link(rel_path):
+                        continue # Empty, or already in the blob store
+                    if rel_path not in imported:
+                        legacy_file = safe_join(str(UPLOAD_FOLDER), rel_path)
+                        if not legacy_file or not os.path.isfile(legacy_file):
+                            print(f"  skipping row {row_id} {column}: '{rel_path}' not found")
+                            continue
+                        digest, _, _ = blob_store.put_file(legacy_file)
+                        imported[rel_path] = make_link(digest, Path(rel_path).name)
+                    changes[column] = imported[rel_path]
+                if changes:
+                    assignments = ", ".join(f"{column} = ?" for column in changes)
+                    cur.execute(f"UPDATE gapfill_models SET {assignments} WHERE id = ?", (*changes.values(), row_id))
+                    updated_rows += 1
+            if updated_rows:
+                bump_catalogue_version(cur)
+            if imported and not keep_originals:
+                cur.executemany("DELETE FROM upload_files WHERE rel_path = ?", [(rel_path,) for rel_path in imported])
+            conn.commit()
+        finally:
+            cur.close()
+    query_cache.invalidate()
+    print(f"Imported {len(imported)} legacy file(s) into the blob store; updated {updated_rows} row(s).")
+
+    if not keep_originals:
+        for rel_path in imported:
+            try:
+                Path(safe_join(str(UPLOAD_FOLDER), rel_path)).unlink()
+            except OSError as e:
+                print(f"  could not remove legacy file '{rel_path}': {e}")
+
+    recompressed = saved = 0
+    for digest, path in list(blob_store.iter_digests()):
+        before = path.stat().st_size
+        if blob_store.recompress(digest):
+            recompressed += 1
+            saved += before - blob_store.locate(digest)[0].stat().st_size
+    print(f"Recompressed {recompressed} blob(s) with {blob_store.compression}, saving {saved / 1024 / 1024:.1f} MB.")
+
+
+@app.cli.command("uploads-digests")
+def uploads_digests_command():
+    """
+    Records the sha256 of every legacy upload referenced by gapfill_models in upload_files (files
+    with a current digest are skipped), so ETags and table caches never have to hash them on a request.
+    """
+    path_columns = ("file_link", "growth_file", "biomass_file_5mM", "biomass_file_20mM")
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT {', '.join(path_columns)} FROM gapfill_models")
+            legacy_paths = sorted({p for row in cur.fetchall() for p in row if p and not parse_link(p)})
+            cur.execute("SELECT rel_path, size_bytes, mtime_ns FROM upload_files")
+            recorded = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+            hashed = missing = 0
+            for rel_path in legacy_paths:
+                try:
+                    st = legacy_upload_stat(rel_path)
+                    if recorded.get(rel_path) == (st.st_size, st.st_mtime_ns):
+                        continue
+                    digest, st = hash_legacy_upload(rel_path)
+                except OSError as e:
+                    print(f"  skipping '{rel_path}': {e}")
+                    missing += 1
+                    continue
+                record_upload_digest(cur, rel_path, digest, st)
+                conn.commit()
+                hashed += 1
+        finally:
+            cur.close()
+    print(f"Recorded {hashed} digest(s) of {len(legacy_paths)} legacy file(s); {missing} missing.")
+
+
+@app.cli.command("uploads-cleanup")
+def uploads_cleanup_command():
+    """
+    Deletes chunked upload sessions with no activity for UPLOAD_SESSION_TTL seconds, and staged files
+    of queued uploads that old (their job failed before it could store them).
+    """
+    removed = upload_sessions.cleanup_expired()
+    print(f"Removed {removed} expired upload session(s).")
+    cutoff = time.time() - app.config['UPLOAD_SESSION_TTL']
+    stale = [p for p in INCOMING_FOLDER.iterdir() if p.is_dir() and p.stat().st_mtime < cutoff] if INCOMING_FOLDER.is_dir() else []
+    for path in stale:
+        shutil.rmtree(path, ignore_errors=True)
+    print(f"Removed {len(stale)} stale staged upload(s).")
+
+
+@app.cli.command("sbml-backfill")
+@click.option("--all", "reparse_all", is_flag=True, help="Re-extract metadata for every model, not just those missing it.")
+@click.option("--batch-size", default=200, show_default=True, help="Models written per transaction.")
+def sbml_backfill_command(reparse_all, batch_size):
+    """
+    Extracts SBML metadata (model_sbml_meta) and entity ids (model_entities) for models uploaded
+    before upload-time extraction existed, reading blob-store files and legacy files under uploads/
+    alike. Run once with --all after applying migration 004 so models indexed earlier get entities.
+    """
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            sql = "SELECT g.id, g.file_link FROM gapfill_models g"
+            if not reparse_all:
+                sql += " LEFT JOIN model_sbml_meta m ON m.model_id = g.id WHERE m.model_id IS NULL"
+            cur.execute(sql + " ORDER BY g.id")
+            todo = cur.fetchall()
+            done = skipped = 0
+            pending = []
+            for row_id, file_link in todo:
+                summary = summarize_model_file(file_link)
+                if summary is None:
+                    skipped += 1 # Not XML, or the file is missing
+                    continue
+                pending.append((row_id, summary))
+                if len(pending) >= batch_size:
+                    store_model_index(cur, pending)
+                    bump_catalogue_version(cur)
+                    conn.commit()
+                    done += len(pending)
+                    pending = []
+                    print(f"  {done} model(s) indexed...")
+            if pending:
+                store_model_index(cur, pending)
+                bump_catalogue_version(cur)
+                conn.commit()
+                done += len(pending)
+        finally:
+            cur.close()
+    query_cache.invalidate()
+    print(f"Extracted SBML metadata for {done} model(s); skipped {skipped} without a readable SBML file.")
+
+
+@app.cli.command("facets-rebuild")
+def facets_rebuild_command():
+    """ Recounts model_facet_counts (GET /api/facets) from gapfill_models. """
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            bump_catalogue_version(cur) # Locks the catalogue against concurrent writes until the commit
+            models, combinations = rebuild_facets(cur)
+            conn.commit()
+        finally:
+            cur.close()
+    query_cache.invalidate()
+    print(f"Rebuilt facet counts: {models} model(s) in {combinations} combination(s).")
+
+
+@app.cli.command("tables-build")
+def tables_build_command():
+    """ Builds the columnar cache for every stored growth / biomass TSV that does not have one yet. """
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"SELECT id, {', '.join(TABLE_KINDS.values())} FROM gapfill_models")
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    built = failed = 0
+    for row_id, *paths in rows:
+        for rel_path in paths:
+            if not rel_path or not rel_path.lower().endswith(".tsv"):
+                continue
+            try:
+                load_table(rel_path)
+                built += 1
+            except (TableError, OSError) as e:
+                failed += 1
+                print(f"  row {row_id}: '{rel_path}' skipped: {e}")
+    print(f"{built} table(s) cached in {TABLE_FOLDER}; {failed} could not be parsed or found.")
+
+
+@app.cli.command("jobs-worker")
+def jobs_worker_command():
+    """ Runs the background job runner in the foreground (use with JOB_RUNNER_IN_APP=0). Stop with Ctrl-C. """
+    print(f"Job worker {job_runner.worker_name}: {app.config['JOB_WORKERS']} process(es), kinds: {', '.join(JOB_HANDLERS)}")
+    try:
+        job_runner.run_forever()
+    except KeyboardInterrupt:
+        job_runner.stop()
+
+
+@app.cli.command("fba-check")
+@click.argument("model_path", required=False, default=str(BASE_DIR / "examples" / "toy_fba_model.xml"))
+def fba_check_command(model_path):
+    """ Runs FBA on a local SBML file (default: the bundled toy model, optimum 20) to check the solver. """
+    try:
+        result = run_fba_job(model_path)
+    except FBAError as e:
+        raise click.ClickException(str(e))
+    print(f"{result['status']}: objective {result['objective_value']} ({'growth' if result['growth'] else 'no growth'})")
+    for reaction_id, flux in result["top_fluxes"].items():
+        print(f"  {reaction_id}: {flux:g}")
+
+
+@app.cli.command("versions-deltas")
+def versions_deltas_command():
+    """
+    Re-stores the main file of every recorded model version as a delta against its parent's file,
+    where that saves at least half its size (what VERSION_DELTAS=1 does for new uploads).
+    """
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT DISTINCT v.sha256, p.sha256 FROM model_versions v"
+                " JOIN model_versions p ON p.model_id = v.parent_id"
+                " WHERE v.sha256 IS NOT NULL AND p.sha256 IS NOT NULL AND v.sha256 <> p.sha256"
+            )
+            pairs = cur.fetchall()
+        finally:
+            cur.close()
+    converted = saved = 0
+    for digest, base_digest in pairs:
+        if not (blob_store.exists(digest) and blob_store.exists(base_digest)):
+            continue # Legacy (non blob-store) files
+        try:
+            result = store_blob_delta(BLOB_FOLDER, digest, base_digest, app.config['DELTA_MAX_SIZE'])
+        except (OSError, ValueError) as e:
+            print(f"  {digest}: skipped: {e}")
+            continue
+        if result["delta"]:
+            converted += 1
+            saved += result["size_before"] - result["size_after"]
+    print(f"Stored {converted} of {len(pairs)} version(s) as deltas, saving {saved / 1024 / 1024:.1f} MB.")
+
+
 # --- Run the App ---
 if __name__ == "__main__":
     # Example: python app2.py
@@ -0,0 +1,189 @@
+"""
+Helpers for the batch model registration endpoint (POST /api/models/batch).
+
+A batch is a manifest describing the models plus the files it references, sent either as
+one archive (zip or tar, optionally compressed) that contains the manifest, or as a
+multipart request with a 'manifest' field/file and any number of 'files' parts.
+
+The manifest is JSON (a list of objects, or {"models": [...]}) or a TSV with a header row.
+Each item names its main model file in 'file' and may reference optional TSVs in
+'growth_file', 'biomass_file_5mM' and 'biomass_file_20mM'; the remaining keys are the
+usual metadata fields (growth_media, gapfill_algorithm, annotation_tool, growth_data).
+An item may give 'parent_id', the id of an existing model it is a new version of.
+"""
+import csv
+import io
+import json
+import posixpath
+import tarfile
+import zipfile
+import zlib
+
+from blob_store import make_link
+
+MANIFEST_NAMES = ("manifest.json", "manifest.tsv")
+FILE_KEYS = ("file", "growth_file", "biomass_file_5mM", "biomass_file_20mM")
+META_KEYS = ("growth_media", "gapfill_algorithm", "annotation_tool", "growth_data")
+MANIFEST_MAX_BYTES = 16 * 1024 * 1024
+# What a truncated or corrupt archive raises while it is iterated or a member is read
+ARCHIVE_READ_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+class BatchError(Exception):
+    """ The batch as a whole is invalid (bad archive, missing/unreadable manifest, too large). """
+
+
+def normalize_member_name(name):
+    """ Normalises an archive member / manifest path; returns None for unsafe or empty paths. """
+    if not name:
+        return None
+    name = posixpath.normpath(name.replace("\\", "/"))
+    if name == "." or name.startswith("/") or name.split("/")[0] == "..":
+        return None
+    return name
+
+
+def parse_manifest(text, name="manifest.json"):
+    """ Parses a JSON or TSV manifest into a list of item dicts. """
+    stripped = text.lstrip()
+    if name.endswith(".json") or stripped.startswith(("[", "{")):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise BatchError(f"Manifest is not valid JSON: {e}")
+        if isinstance(data, dict):
+            data = data.get("models")
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise BatchError("JSON manifest must be a list of objects (or {\"models\": [...]}).")
+        return data
+    reader = csv.DictReader(io.StringIO(text), delimiter="\t")
+    if not reader.fieldnames or "file" not in reader.fieldnames:
+        raise BatchError("TSV manifest needs a header row with at least a 'file' column.")
+    return [{k: (v or "").strip() or None for k, v in row.items() if k} for row in reader]
+
+
+def read_manifest(stream, name):
+    """ Reads a manifest member/part (bounded in size) and parses it. """
+    data = stream.read(MANIFEST_MAX_BYTES + 1)
+    if len(data) > MANIFEST_MAX_BYTES:
+        raise BatchError(f"Manifest exceeds {MANIFEST_MAX_BYTES} bytes.")
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BatchError("Manifest must be UTF-8 encoded.")
+    return parse_manifest(text, name)
+
+
+def resolve_items(items, stored, allowed_extensions, defaults=None):
+    """
+    Matches manifest items to the stored files. ``stored`` maps normalised file name ->
+    (digest, size, display name). Returns one result dict per item, in manifest order:
+    'status' is 'ok' (with 'file_name', 'links' {column: cas link}, 'meta', 'sha256' and
+    'parent_id') or 'error' (with 'error'). Metadata missing from an item falls back to ``defaults``.
+    """
+    defaults = defaults or {}
+    results = []
+    for index, item in enumerate(items):
+        result = {"index": index, "file": item.get("file")}
+        try:
+            links = {}
+            for key in FILE_KEYS:
+                ref = item.get(key)
+                if not ref:
+                    if key == "file":
+                        raise BatchError("Item has no 'file'.")
+                    continue
+                name = normalize_member_name(str(ref))
+                if name is None or name not in stored:
+                    raise BatchError(f"'{key}' refers to '{ref}', which is not in the batch.")
+                digest, _, display_name = stored[name]
+                ext = posixpath.splitext(display_name)[1].lower()
+                if key == "file" and ext not in allowed_extensions:
+                    raise BatchError(f"Invalid file type '{ext}'. Only {', '.join(sorted(allowed_extensions))} allowed.")
+                if key != "file" and ext != ".tsv":
+                    raise BatchError(f"'{key}' must be a .tsv file.")
+                links[key] = make_link(digest, display_name)
+                if key == "file":
+                    result.update(file_name=display_name, sha256=digest)
+            parent_id = item.get("parent_id")
+            if parent_id in (None, ""):
+                parent_id = None
+            else:
+                try:
+                    parent_id = int(parent_id)
+                except (TypeError, ValueError):
+                    raise BatchError(f"'parent_id' must be a model id, not '{parent_id}'.")
+        except BatchError as e:
+            result.update(status="error", error=str(e))
+        else:
+            meta = {key: item.get(key) if item.get(key) not in (None, "") else defaults.get(key) for key in META_KEYS}
+            result.update(status="ok", links=links, meta=meta, parent_id=parent_id)
+        results.append(result)
+    return results
+
+
+class ArchiveMember:
+    """ Read-only stream of one archive member; read errors of a corrupt archive become BatchError. """
+
+    def __init__(self, stream, name):
+        self._stream = stream
+        self.name = name
+
+    def read(self, size=-1):
+        try:
+            return self._stream.read(size)
+        except ARCHIVE_READ_ERRORS as e:
+            raise BatchError(f"Corrupt archive member '{self.name}': {e}")
+
+
+def iter_archive(file_storage, max_member_size):
+    """
+    Yields (member name, readable stream) for every regular file in a zip or tar upload, in
+    archive order, without extracting to disk or reading whole members into memory.
+    Tar archives are read in streaming mode, so they need not be seekable. A truncated or
+    corrupt archive raises BatchError, also while a yielded member is being read.
+    """
+    stream = file_storage.stream
+    filename = (file_storage.filename or "").lower()
+    if filename.endswith(".zip") or _looks_like_zip(stream):
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise BatchError(f"Invalid zip archive: {e}")
+        with archive:
+            try:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max_member_size:
+                        raise BatchError(f"Archive member '{info.filename}' exceeds {max_member_size} bytes.")
+                    with archive.open(info) as member:
+                        yield info.filename, ArchiveMember(member, info.filename)
+            except ARCHIVE_READ_ERRORS as e:
+                raise BatchError(f"Corrupt zip archive: {e}")
+        return
+
+    try:
+        archive = tarfile.open(fileobj=stream, mode="r|*")
+    except tarfile.TarError as e:
+        raise BatchError(f"Unsupported archive (expected zip or tar): {e}")
+    with archive:
+        try:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                if info.size > max_member_size:
+                    raise BatchError(f"Archive member '{info.name}' exceeds {max_member_size} bytes.")
+                yield info.name, ArchiveMember(archive.extractfile(info), info.name)
+        except ARCHIVE_READ_ERRORS as e:
+            raise BatchError(f"Corrupt or truncated tar archive: {e}")
+
+
+def _looks_like_zip(stream):
+    try:
+        start = stream.tell()
+        magic = stream.read(4)
+        stream.seek(start)
+    except (AttributeError, OSError, ValueError):
+        return False
+    return magic == b"PK\x03\x04"
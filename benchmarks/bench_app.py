@@ -0,0 +1,388 @@
+"""
+Load test: the app2 web app under concurrent requests at 1k / 10k / 100k catalogue rows.
+
+Starts app2 in-process on a local threaded HTTP server, backed either by a SQLite file through
+sqlite_standin.py (--db sqlite, the default; no server needed) or by an empty scratch MariaDB
+database (--db mariadb). The catalogue is seeded with synthetic gapfill_models rows referencing
+a pool of synthetic SBML models and growth/biomass TSVs in a temporary upload folder. At every
+scale each scenario is driven by --concurrency client threads for --requests requests, and the
+throughput and latency percentiles are printed. --json writes them, with the commit they were
+measured at, and --compare prints the change against an earlier --json file.
+
+    python benchmarks/bench_app.py --scales 1000,10000 --json results.json
+    python benchmarks/bench_app.py --compare baseline.json --json results.json
+    python benchmarks/bench_app.py --db mariadb --host localhost --user bench --password ... --database scratch
+
+Scenarios: index (GET /), search (GET /search), api_list (GET /api/models, first or a random page),
+api_create (POST /api/models with a new SBML file) and download (GET /download/cas/...).
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+MEDIA = ["M9 glucose", "M9 acetate", "LB", "xylitol minimal", "AKGDSH", "succinate", "glycerol M9", "lactate"]
+MEDIA_TERMS = ["glucose", "acetate", "xylitol", "succinate", "M9", "LB"]
+ALGORITHMS = ["Model SEED", "CarveMe", "gapseq", "ModelSEED2", "fastGapFill"]
+TOOLS = ["RASTtk", "Prokka", "eggNOG", "DRAM"]
+GROWTH = ["Growth", "No Growth"]
+SCENARIOS = ("index", "search", "api_list", "api_create", "download")
+
+GAPFILL_MODELS_DDL = """
+    CREATE TABLE IF NOT EXISTS gapfill_models (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        growth_media VARCHAR(255), gapfill_algorithm VARCHAR(255), annotation_tool VARCHAR(255),
+        file_name VARCHAR(255), file_link VARCHAR(512), growth_data VARCHAR(255),
+        growth_file VARCHAR(512), biomass_file_5mM VARCHAR(512), biomass_file_20mM VARCHAR(512),
+        Biomass_RCH1 VARCHAR(255)
+    ) ENGINE=InnoDB
+"""
+INSERT_SQL = (
+    "INSERT INTO gapfill_models (growth_media, gapfill_algorithm, annotation_tool, file_name, file_link,"
+    " growth_data, growth_file, biomass_file_5mM, biomass_file_20mM, Biomass_RCH1)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+# --- Synthetic files ---
+def synthetic_sbml(rng, model_id, reactions):
+    """ A small SBML Level 3 + fbc model with a chain of ``reactions`` reactions and a biomass objective. """
+    species = [f"M_m{i}_c" for i in range(reactions + 1)]
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<sbml xmlns="http://www.sbml.org/sbml/level3/version1/core"'
+        ' xmlns:fbc="http://www.sbml.org/sbml/level3/version1/fbc/version2" level="3" version="1" fbc:required="false">',
+        f'  <model id="{model_id}" name="Synthetic model {model_id}" fbc:strict="true">',
+        '    <listOfCompartments><compartment id="c" constant="true"/></listOfCompartments>',
+        '    <listOfSpecies>',
+        *(f'      <species id="{s}" compartment="c" hasOnlySubstanceUnits="false" boundaryCondition="false" constant="false"/>'
+          for s in species),
+        '    </listOfSpecies>',
+        '    <listOfParameters>',
+        '      <parameter id="lb" value="0" constant="true"/>',
+        f'      <parameter id="ub" value="{rng.choice([10, 100, 1000])}" constant="true"/>',
+        '    </listOfParameters>',
+        '    <listOfReactions>',
+        '      <reaction id="R_EX_m0" reversible="false" fast="false" fbc:lowerFluxBound="lb" fbc:upperFluxBound="ub">',
+        f'        <listOfProducts><speciesReference species="{species[0]}" stoichiometry="1" constant="true"/></listOfProducts>',
+        '      </reaction>',
+    ]
+    for i in range(reactions):
+        lines += [
+            f'      <reaction id="R_r{i}" reversible="false" fast="false" fbc:lowerFluxBound="lb" fbc:upperFluxBound="ub">',
+            f'        <listOfReactants><speciesReference species="{species[i]}" stoichiometry="1" constant="true"/></listOfReactants>',
+            f'        <listOfProducts><speciesReference species="{species[i + 1]}" stoichiometry="1" constant="true"/></listOfProducts>',
+            '      </reaction>',
+        ]
+    lines += [
+        '      <reaction id="R_BIOMASS" reversible="false" fast="false" fbc:lowerFluxBound="lb" fbc:upperFluxBound="ub">',
+        f'        <listOfReactants><speciesReference species="{species[-1]}" stoichiometry="1" constant="true"/></listOfReactants>',
+        '      </reaction>',
+        '    </listOfReactions>',
+        '    <fbc:listOfObjectives fbc:activeObjective="obj">',
+        '      <fbc:objective fbc:id="obj" fbc:type="maximize"><fbc:listOfFluxObjectives>',
+        '        <fbc:fluxObjective fbc:reaction="R_BIOMASS" fbc:coefficient="1"/>',
+        '      </fbc:listOfFluxObjectives></fbc:objective>',
+        '    </fbc:listOfObjectives>',
+        '  </model>',
+        '</sbml>',
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def synthetic_tsv(rng, rows):
+    lines = ["condition\tvalue\treplicate"]
+    lines += [f"{rng.choice(MEDIA)}\t{rng.uniform(0, 2):.4f}\t{i % 3 + 1}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def store_file_pool(app2, rng, count):
+    """ Stores ``count`` SBML models and TSVs in the app's blob store; returns their links. """
+    models, tables = [], []
+    for i in range(count):
+        digest, _, _ = app2.blob_store.put_stream(io.BytesIO(synthetic_sbml(rng, f"bench_{i}", rng.randint(20, 300))))
+        models.append(app2.make_link(digest, f"bench_{i}.xml"))
+        digest, _, _ = app2.blob_store.put_stream(io.BytesIO(synthetic_tsv(rng, rng.randint(50, 2000))))
+        tables.append(app2.make_link(digest, f"table_{i}.tsv"))
+    return models, tables
+
+
+# --- Database ---
+def prepare_schema(mariadb, apply_migrations, db_config):
+    conn = mariadb.connect(**db_config)
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        cur.execute(GAPFILL_MODELS_DDL)
+        cur.execute("SELECT COUNT(*) FROM gapfill_models")
+        (existing,) = cur.fetchone()
+        conn.commit()
+    finally:
+        cur.close()
+    if existing:
+        conn.close()
+        raise SystemExit(f"gapfill_models already has {existing} rows; point the benchmark at an empty scratch database.")
+    apply_migrations(conn)
+    conn.close()
+
+
+def seed_rows(conn, start, stop, rng, models, tables):
+    rows = []
+    for i in range(start, stop):
+        rows.append((
+            rng.choice(MEDIA), rng.choice(ALGORITHMS), rng.choice(TOOLS), f"model_{i:06d}.xml", rng.choice(models),
+            rng.choice(GROWTH), rng.choice(tables), rng.choice(tables), rng.choice(tables), None,
+        ))
+    cur = conn.cursor()
+    try:
+        cur.executemany(INSERT_SQL, rows)
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def grow_catalogue(app2, scale, rng, models, tables):
+    """ Seeds gapfill_models up to ``scale`` rows and invalidates the app's cached catalogue pages. """
+    with app2.db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT COUNT(*) FROM gapfill_models")
+            (seeded,) = cur.fetchone()
+        finally:
+            cur.close()
+        for start in range(seeded, scale, 5000):
+            seed_rows(conn, start, min(start + 5000, scale), rng, models, tables)
+        cur = conn.cursor()
+        try:
+            cur.execute("ANALYZE TABLE gapfill_models")
+            if cur.description:
+                cur.fetchall()
+            app2.bump_catalogue_version(cur)
+            conn.commit()
+        finally:
+            cur.close()
+    app2.query_cache.invalidate()
+
+
+# --- Load generation ---
+def multipart(fields, files):
+    boundary = f"bench{random.getrandbits(64):016x}"
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8"))
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode("utf-8") + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def make_request(scenario, rng, scale, models, counter):
+    """ (method, path, body, headers, expected statuses) for one request of ``scenario``. """
+    if scenario == "index":
+        return "GET", "/", None, {}, (200,)
+    if scenario == "search":
+        return "GET", "/search?" + urlencode({"growth_media": rng.choice(MEDIA_TERMS)}), None, {}, (200,)
+    if scenario == "api_list":
+        params = {"limit": 100}
+        if rng.random() < 0.5:
+            params["after_id"] = rng.randint(2, scale)
+        return "GET", "/api/models?" + urlencode(params), None, {}, (200,)
+    if scenario == "api_create":
+        n = next(counter)
+        body, headers = multipart(
+            {"growth_media": rng.choice(MEDIA), "gapfill_algorithm": rng.choice(ALGORITHMS),
+             "annotation_tool": rng.choice(TOOLS), "growth_data": rng.choice(GROWTH)},
+            {"modelUpload": (f"upload_{n}.xml", synthetic_sbml(rng, f"upload_{n}", rng.randint(20, 300)))},
+        )
+        return "POST", "/api/models", body, headers, (201, 202) # 202 with UPLOAD_ASYNC
+    if scenario == "download":
+        return "GET", "/download/" + rng.choice(models), None, {}, (200,)
+    raise ValueError(f"Unknown scenario '{scenario}'.")
+
+
+def percentile(sorted_values, p):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def run_scenario(port, scenario, scale, requests, concurrency, models, seed):
+    rng = random.Random(f"{seed}-{scenario}-{scale}")
+    counter = iter(range(sys.maxsize))
+    plans = [make_request(scenario, rng, scale, models, counter) for _ in range(requests)] # Built before the clock starts
+
+    def send(plan):
+        method, path, body, headers, expected = plan
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status in expected
+            finally:
+                conn.close()
+        except OSError:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(send, plans))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for seconds, _ in outcomes)
+    return {
+        "rows": scale,
+        "scenario": scenario,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p90_ms": round(percentile(latencies, 90), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+# --- Reporting ---
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_comparison(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    previous = {(r["rows"], r["scenario"]): r for r in baseline["results"]}
+    print(f"\n== Compared with {baseline_path} (commit {baseline.get('commit')}) ==")
+    print(f"{'rows':>7} {'scenario':<11} {'rps':>9} {'p50':>9} {'p99':>9}")
+    for r in results:
+        old = previous.get((r["rows"], r["scenario"]))
+        if old is None:
+            continue
+        def change(key):
+            return f"{100 * (r[key] - old[key]) / old[key]:+.1f}%" if old.get(key) else "n/a"
+        print(f"{r['rows']:>7} {r['scenario']:<11} {change('throughput_rps'):>9} {change('p50_ms'):>9} {change('p99_ms'):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", choices=("sqlite", "mariadb"), default="sqlite")
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("DB_PORT", 3306)))
+    parser.add_argument("--user", default=os.environ.get("DB_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("DB_PASSWORD", ""))
+    parser.add_argument("--database", default=os.environ.get("DB_NAME", "test"), help="An empty scratch database (--db mariadb)")
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma-separated row counts")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario and scale")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--files", type=int, default=100, help="Synthetic SBML models / TSVs the rows reference")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--compare", help="Earlier --json results to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary upload folder (and SQLite file)")
+    args = parser.parse_args(argv)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario '{scenario}'; choose from {', '.join(SCENARIOS)}.")
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_app-"))
+    os.environ["UPLOAD_FOLDER"] = str(workdir / "uploads")
+    os.environ["JOB_RUNNER_IN_APP"] = "0"
+    if args.db == "sqlite":
+        import sqlite_standin
+        sqlite_standin.DATABASE = str(workdir / "bench.sqlite3")
+        sys.modules["mariadb"] = sqlite_standin
+        os.environ.setdefault("SEARCH_BACKEND", "like")
+    else:
+        os.environ.update({"DB_HOST": args.host, "DB_PORT": str(args.port), "DB_USER": args.user,
+                           "DB_PASSWORD": args.password, "DB_NAME": args.database})
+    import mariadb
+    from db_migrate import apply_migrations
+    from werkzeug.serving import make_server
+
+    db_config = {"host": args.host, "port": args.port, "user": args.user,
+                 "password": args.password, "database": args.database}
+    prepare_schema(mariadb, apply_migrations, db_config)
+
+    import app2 # Reads the environment set above
+    logging.getLogger().setLevel(logging.WARNING) # Per-request logging would dominate the timings
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app2.app.logger.setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, app2.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    commit, dirty = git_revision()
+    results = []
+    try:
+        rng = random.Random(args.seed)
+        models, tables = store_file_pool(app2, rng, args.files)
+        for scale in sorted(int(s) for s in args.scales.split(",")):
+            grow_catalogue(app2, scale, rng, models, tables) # api_create rows count towards the next scale
+            print(f"\n== {scale} rows ({args.db}, {args.concurrency} clients, {args.requests} requests each) ==")
+            print(f"{'scenario':<11} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+            for scenario in scenarios:
+                result = run_scenario(server.server_port, scenario, scale, args.requests, args.concurrency,
+                                      models, args.seed)
+                results.append(result)
+                print(f"{scenario:<11} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.2f} "
+                      f"{result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {result['errors']:>7}")
+    finally:
+        server.shutdown()
+        app2.db_pool.close_all()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"\nKept {workdir}")
+
+    report = {
+        "benchmark": "bench_app",
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "db": args.db,
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "files": args.files,
+                     "seed": args.seed, "search_backend": app2.app.config['SEARCH_BACKEND']},
+        "results": results,
+    }
+    if args.compare:
+        print_comparison(results, args.compare)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: record (list of dicts + jsonify) vs. compact (columns + row tuples) listing responses.
+
+Converts and serialises synthetic gapfill_models rows the way a listing endpoint does, with no
+database involved, so only the Python side is measured:
+
+    records (old)     the previous dict_rows loop (per-row length check) + jsonify's encoder
+    records           row_format.records() + jsonify's encoder (?format omitted)
+    compact (stdlib)  row tuples + row_format.dumps_stdlib
+    compact           row tuples + row_format.dumps (orjson when installed) (?format=compact)
+
+For each scale it reports the median CPU time per response, the peak memory allocated while
+building it (tracemalloc, measured in a separate pass) and the response size.
+
+    python benchmarks/bench_rows.py
+    python benchmarks/bench_rows.py --scales 1000,100000 --repeat 5 --json results.json
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from flask import Flask
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import row_format  # noqa: E402
+
+COLUMNS = ["id", "growth_media", "gapfill_algorithm", "annotation_tool", "file_name", "file_link", "growth_data",
+           "growth_file", "biomass_file_5mM", "biomass_file_20mM", "Biomass_RCH1"]
+MEDIA = ["M9 glucose", "M9 acetate", "LB", "xylitol minimal", "AKGDSH", "succinate", "glycerol M9", "lactate"]
+ALGORITHMS = ["Model SEED", "CarveMe", "gapseq", "ModelSEED2", "fastGapFill"]
+TOOLS = ["RASTtk", "Prokka", "eggNOG", "DRAM"]
+GROWTH = ["Growth", "No Growth", None]
+
+
+def make_rows(count, rng):
+    def link(name):
+        return f"cas/{rng.getrandbits(256):064x}/{name}"
+    return [
+        (i, rng.choice(MEDIA), rng.choice(ALGORITHMS), rng.choice(TOOLS), f"model_{i:06d}.xml",
+         link(f"model_{i:06d}.xml"), rng.choice(GROWTH), link(f"growth_{i:06d}.tsv"),
+         link(f"biomass5_{i:06d}.tsv") if i % 2 else None, link(f"biomass20_{i:06d}.tsv") if i % 3 else None, None)
+        for i in range(count, 0, -1)
+    ]
+
+
+def old_dict_rows(cols, rows):
+    results = []
+    for row in rows:
+        if len(row) == len(cols):
+            results.append(dict(zip(cols, row)))
+    return results
+
+
+def build_variants(app):
+    jsonify_dumps = lambda obj: app.json.response(obj).get_data()
+    return {
+        "records (old)": lambda rows: jsonify_dumps({"models": old_dict_rows(COLUMNS, rows)}),
+        "records": lambda rows: jsonify_dumps({"models": row_format.records(COLUMNS, rows)}),
+        "compact (stdlib)": lambda rows: row_format.dumps_stdlib({"columns": COLUMNS, "rows": rows}),
+        "compact": lambda rows: row_format.dumps({"columns": COLUMNS, "rows": rows}),
+    }
+
+
+def measure(build, rows, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.process_time()
+        body = build(rows)
+        times.append(time.process_time() - started)
+    size = len(body)
+    del body
+    tracemalloc.start()
+    body = build(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": statistics.median(times) * 1000, "peak_mib": peak / 2**20, "bytes": size}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="100,1000,100000", help="Comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per variant and scale")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args(argv)
+
+    app = Flask("bench_rows")
+    variants = build_variants(app)
+    print(f"orjson: {'yes' if row_format.orjson is not None else 'no (compact uses the stdlib encoder)'}")
+    results = []
+    for scale in [int(s) for s in args.scales.split(",")]:
+        rows = make_rows(scale, random.Random(args.seed))
+        with app.app_context():
+            measured = {name: measure(build, rows, args.repeat) for name, build in variants.items()}
+        baseline = measured["records (old)"]
+        print(f"\n{scale} rows")
+        print(f"  {'variant':<18} {'cpu ms':>10} {'peak MiB':>10} {'bytes':>12}  vs records (old)")
+        for name, m in measured.items():
+            print(f"  {name:<18} {m['cpu_ms']:>10.2f} {m['peak_mib']:>10.2f} {m['bytes']:>12}"
+                  f"  cpu x{baseline['cpu_ms'] / m['cpu_ms']:.1f}, memory x{baseline['peak_mib'] / m['peak_mib']:.1f},"
+                  f" size {100 * m['bytes'] / baseline['bytes']:.0f}%")
+            results.append({"rows": scale, "variant": name, **m})
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark: indexed multi-field search (FULLTEXT backend) vs. the old LIKE '%term%' search.
+
+Builds a scratch copy of the gapfill_models layout (bench_gapfill_models) with the indexes from
+migrations/001_search_indexes.sql, fills it with synthetic rows in steps (default 1k, 10k, 100k),
+and times the same searches through both backends of model_search.build_search at every step.
+The scratch table is dropped afterwards unless --keep is given; gapfill_models is never touched.
+
+    python benchmarks/bench_search.py --host localhost --user bench --password ... --database scratch
+    python benchmarks/bench_search.py --scales 1000,10000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import mariadb
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db_migrate import MIGRATIONS_DIR, split_statements  # noqa: E402
+from model_search import build_search  # noqa: E402
+
+TABLE = "bench_gapfill_models"
+
+MEDIA = ["M9 glucose", "M9 acetate", "LB", "xylitol minimal", "AKGDSH", "succinate", "glycerol M9", "lactate"]
+ALGORITHMS = ["Model SEED", "CarveMe", "gapseq", "ModelSEED2", "fastGapFill"]
+TOOLS = ["RASTtk", "Prokka", "eggNOG", "DRAM"]
+GROWTH = ["Growth", "No Growth"]
+
+QUERIES = [
+    {"growth_media": "glucose"},
+    {"growth_media": "xylitol"},
+    {"gapfill_algorithm": "CarveMe", "annotation_tool": "Prokka"},
+    {"growth_media": "acetate", "growth_data": "Growth"},
+    {"file_name": "model_00042"},
+]
+
+
+def create_table(cur):
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cur.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            growth_media VARCHAR(255), gapfill_algorithm VARCHAR(255), annotation_tool VARCHAR(255),
+            file_name VARCHAR(255), file_link VARCHAR(512), growth_data VARCHAR(255),
+            growth_file VARCHAR(512), biomass_file_5mM VARCHAR(512), biomass_file_20mM VARCHAR(512),
+            Biomass_RCH1 VARCHAR(255)
+        ) ENGINE=InnoDB
+    """)
+    migration = (MIGRATIONS_DIR / "001_search_indexes.sql").read_text(encoding="utf-8")
+    for statement in split_statements(migration):
+        cur.execute(statement.replace("ON gapfill_models", f"ON {TABLE}"))
+
+
+def seed(cur, start, stop, rng):
+    rows = []
+    for i in range(start, stop):
+        name = f"model_{i:05d}.xml"
+        rows.append((
+            rng.choice(MEDIA), rng.choice(ALGORITHMS), rng.choice(TOOLS), name, name, rng.choice(GROWTH),
+            f"growth_file/growth_{i:05d}.tsv", f"5mM/biomass_{i:05d}.tsv", f"20mM/biomass_{i:05d}.tsv", None,
+        ))
+    cur.executemany(
+        f"INSERT INTO {TABLE} (growth_media, gapfill_algorithm, annotation_tool, file_name, file_link,"
+        " growth_data, growth_file, biomass_file_5mM, biomass_file_20mM, Biomass_RCH1)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def time_query(cur, where, params, repeat, limit):
+    sql = f"SELECT * FROM {TABLE} WHERE {where} ORDER BY id DESC LIMIT {limit}"
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("DB_PORT", 3306)))
+    parser.add_argument("--user", default=os.environ.get("DB_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("DB_PASSWORD", ""))
+    parser.add_argument("--database", default=os.environ.get("DB_NAME", "test"))
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=20, help="Executions per query")
+    parser.add_argument("--limit", type=int, default=50, help="Page size (LIMIT) of each search")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch table afterwards")
+    args = parser.parse_args(argv)
+
+    conn = mariadb.connect(host=args.host, port=args.port, user=args.user,
+                           password=args.password, database=args.database)
+    conn.autocommit = True
+    cur = conn.cursor()
+    rng = random.Random(42)
+    results = []
+    try:
+        create_table(cur)
+        seeded = 0
+        for scale in sorted(int(s) for s in args.scales.split(",")):
+            for start in range(seeded, scale, 5000):
+                seed(cur, start, min(start + 5000, scale), rng)
+            seeded = scale
+            cur.execute(f"ANALYZE TABLE {TABLE}")
+            cur.fetchall()
+            print(f"\n== {scale} rows ==")
+            print(f"{'query':<55} {'backend':<9} {'median ms':>10} {'p95 ms':>8}")
+            for filters in QUERIES:
+                for backend in ("like", "fulltext"):
+                    where, params = build_search(filters, "and", backend=backend)
+                    timings = time_query(cur, where, params, args.repeat, args.limit)
+                    median = statistics.median(timings)
+                    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+                    results.append({"rows": scale, "filters": filters, "backend": backend,
+                                    "median_ms": round(median, 3), "p95_ms": round(p95, 3)})
+                    print(f"{json.dumps(filters):<55} {backend:<9} {median:>10.2f} {p95:>8.2f}")
+    finally:
+        if not args.keep:
+            cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.close()
+        conn.close()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: cold start of app.py / app2.py, as a freshly started (or forked-then-importing) worker sees it.
+
+Every sample runs in a new Python process that imports the app module and then serves its first
+request (GET /ping) through Flask's test client, and reports three times: the import, the first
+request and the whole process (interpreter start to exit, measured by the parent). The database
+is the SQLite stand-in (sqlite_standin.py) by default, so no server is needed and connection
+time does not blur the numbers; --db mariadb uses the connector and the DB_* settings as is.
+
+--app-dir benchmarks another checkout of the repository, e.g. a `git worktree` of an older commit,
+so a before/after comparison runs the same harness. --importtime lists the slowest imports
+(python -X importtime) of one extra run.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --apps app2 --runs 20 --json startup.json
+    git worktree add /tmp/before HEAD~1 && python benchmarks/bench_startup.py --app-dir /tmp/before
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+STANDIN_DIR = Path(__file__).resolve().parent
+
+# Runs in the child process; prints one JSON line with its timings
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+if {standin!r}:
+    sys.path.insert(0, {standin_dir!r})
+    import sqlite_standin
+    sqlite_standin.DATABASE = {database!r}
+    sys.modules["mariadb"] = sqlite_standin
+started = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter()
+response = module.app.test_client().get("/ping")
+served = time.perf_counter()
+print(json.dumps({{"import_s": imported - started, "first_request_s": served - imported, "status": response.status_code}}))
+"""
+
+
+def child_env(workdir, app_dir):
+    env = dict(os.environ)
+    env.update({
+        "UPLOAD_FOLDER": str(workdir / "uploads"),
+        "JOB_RUNNER_IN_APP": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "PYTHONPATH": str(app_dir),
+    })
+    return env
+
+
+def run_once(module, app_dir, workdir, standin):
+    code = CHILD.format(app_dir=str(app_dir), standin=standin, standin_dir=str(STANDIN_DIR),
+                        database=str(workdir / "startup.sqlite3"), module=module)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          env=child_env(workdir, app_dir), cwd=str(workdir))
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} failed to start (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    sample = json.loads(proc.stdout.strip().splitlines()[-1])
+    sample["process_s"] = elapsed
+    return sample
+
+
+def slowest_imports(module, app_dir, workdir, standin, count=10):
+    code = CHILD.format(app_dir=str(app_dir), standin=standin, standin_dir=str(STANDIN_DIR),
+                        database=str(workdir / "startup.sqlite3"), module=module)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          env=child_env(workdir, app_dir), cwd=str(workdir))
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", default="app,app2", help="Comma-separated app modules to start")
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts per app")
+    parser.add_argument("--app-dir", default=str(REPO_DIR), help="Checkout to benchmark (default: this one)")
+    parser.add_argument("--db", choices=("sqlite", "mariadb"), default="sqlite")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports")
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    args = parser.parse_args(argv)
+
+    app_dir = Path(args.app_dir).resolve()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_startup-") as tmp:
+        workdir = Path(tmp)
+        for module in [m for m in args.apps.split(",") if m]:
+            samples = [run_once(module, app_dir, workdir, args.db == "sqlite") for _ in range(args.runs)]
+            summary = {key: {"median_ms": round(1000 * statistics.median(s[key] for s in samples), 1),
+                             "max_ms": round(1000 * max(s[key] for s in samples), 1)}
+                       for key in ("import_s", "first_request_s", "process_s")}
+            results[module] = summary
+            print(f"{module} ({args.runs} cold starts, {app_dir})")
+            for key, label in (("import_s", "import"), ("first_request_s", "first request"), ("process_s", "process total")):
+                print(f"  {label:<14} median {summary[key]['median_ms']:>8.1f} ms   max {summary[key]['max_ms']:>8.1f} ms")
+            if args.importtime:
+                print("  slowest imports (cumulative):")
+                for cumulative_us, name in slowest_imports(module, app_dir, workdir, args.db == "sqlite"):
+                    print(f"    {cumulative_us / 1000:>8.1f} ms  {name}")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"app_dir": str(app_dir), "runs": args.runs, "results": results}, indent=2),
+                                   encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+SQLite stand-in for the `mariadb` connector, for running the app without a MariaDB server.
+
+bench_app.py installs this module as ``sys.modules["mariadb"]`` before importing app2, so the
+app, its connection pool and db_migrate run unchanged on top of a local SQLite file. Only the
+parts of the connector API the app uses are provided (connect, the exception classes, cursors
+with qmark parameters) and the MariaDB-only SQL the app and the migrations use is rewritten:
+FOR UPDATE and FULLTEXT indexes are dropped (run the app with SEARCH_BACKEND=like), INSERT
+IGNORE, ON DUPLICATE KEY UPDATE, AUTO_INCREMENT, inline KEY clauses, prefix index lengths and
+INTERVAL arithmetic are translated. Statements are not grouped into transactions (see
+Connection). Timings measure the app's own overhead plus SQLite, not MariaDB.
+"""
+import re
+import sqlite3
+import threading
+
+
+class Error(Exception):
+    errno = None
+
+
+class InterfaceError(Error):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class DataError(DatabaseError):
+    pass
+
+
+class NotSupportedError(DatabaseError):
+    pass
+
+
+# MariaDB error numbers the app looks at
+_ERRNO = {"NOT NULL constraint failed": 1048, "UNIQUE constraint failed": 1062}
+
+_REWRITES = [
+    (re.compile(r"\s+FOR UPDATE\b", re.I), ""),
+    (re.compile(r"\bINSERT IGNORE\b", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"\b(?:BIG|TINY|SMALL|MEDIUM)?INT\s+(?:NOT NULL\s+)?AUTO_INCREMENT\s+PRIMARY KEY", re.I),
+     "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r",\s*(?:UNIQUE\s+)?KEY\s+\w+\s*\([^)]*\)", re.I), ""),
+    (re.compile(r"\)\s*ENGINE\s*=\s*\w+", re.I), ")"),
+    (re.compile(r"CURRENT_TIMESTAMP\s*-\s*INTERVAL\s+\?\s+SECOND", re.I), "datetime('now', '-' || ? || ' seconds')"),
+]
+_PREFIX_LENGTH_RE = re.compile(r"(\w+)\(\d+\)")
+_UPSERT_RE = re.compile(r"\bON DUPLICATE KEY UPDATE\b(.*)$", re.I | re.S)
+_UPSERT_VALUES_RE = re.compile(r"\bVALUES\((\w+)\)", re.I)
+_translated = {}
+_translate_lock = threading.Lock()
+
+
+def translate(sql):
+    """ SQLite version of a MariaDB statement, or None if it has no equivalent and can be skipped. """
+    result = _translated.get(sql)
+    if result is None:
+        stripped = sql.lstrip().upper()
+        if stripped.startswith("CREATE FULLTEXT INDEX") or stripped.startswith("ANALYZE TABLE"):
+            result = ""
+        else:
+            result = sql
+            for pattern, replacement in _REWRITES:
+                result = pattern.sub(replacement, result)
+            result = _UPSERT_RE.sub(lambda m: "ON CONFLICT DO UPDATE SET" + _UPSERT_VALUES_RE.sub(r"excluded.\1", m.group(1)), result)
+            if stripped.startswith(("CREATE INDEX", "CREATE UNIQUE INDEX")):
+                head, _, columns = result.partition(" ON ")
+                result = head + " ON " + _PREFIX_LENGTH_RE.sub(r"\1", columns)
+        with _translate_lock:
+            _translated[sql] = result
+    return result or None
+
+
+def _convert_error(e):
+    if isinstance(e, sqlite3.IntegrityError):
+        error = IntegrityError(str(e))
+    elif isinstance(e, sqlite3.OperationalError):
+        error = OperationalError(str(e))
+    elif isinstance(e, sqlite3.ProgrammingError):
+        error = ProgrammingError(str(e))
+    else:
+        error = DatabaseError(str(e))
+    for message, errno in _ERRNO.items():
+        if message in str(e):
+            error.errno = errno
+    return error
+
+
+class Cursor:
+    def __init__(self, connection, **kwargs):
+        self._cursor = connection._db.cursor()
+        self.closed = False
+
+    def execute(self, sql, data=()):
+        translated = translate(sql)
+        if translated is None:
+            return
+        try:
+            self._cursor.execute(translated, tuple(data or ()))
+        except sqlite3.Error as e:
+            raise _convert_error(e) from e
+
+    def executemany(self, sql, data):
+        translated = translate(sql)
+        if translated is None:
+            return
+        try:
+            self._cursor.executemany(translated, [tuple(row) for row in data])
+        except sqlite3.Error as e:
+            raise _convert_error(e) from e
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self.closed = True
+        self._cursor.close()
+
+
+class Connection:
+    """
+    Runs every statement in its own SQLite transaction: commit() and rollback() are no-ops. Under
+    concurrent load that avoids SQLite's lock-upgrade failures (which MariaDB's row locks don't
+    have); the app's rollbacks only matter on error paths, which a benchmark should not hit.
+    """
+
+    def __init__(self, database):
+        self._db = sqlite3.connect(database, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self.autocommit = False
+
+    def cursor(self, **kwargs):
+        return Cursor(self, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def ping(self):
+        self._db.execute("SELECT 1")
+
+    def close(self):
+        self._db.close()
+
+
+# Set by bench_app.py; connect() ignores host/user/password and opens this file
+DATABASE = ":memory:"
+
+
+def connect(database=None, **kwargs):
+    return Connection(DATABASE)
@@ -0,0 +1,494 @@
+"""
+Content-addressed, deduplicating store for uploaded files.
+
+Every file is stored once under its SHA-256 digest (blobs/ab/cd/<digest>). Rows in
+gapfill_models reference a blob with a logical path of the form
+
+    cas/<digest>/<original file name>
+
+which keeps the original name for display and downloads while the bytes are shared by
+every row that uploaded the same content. Two uploads with the same name but different
+content no longer collide, and re-uploading identical bytes costs no extra disk space.
+
+Blobs can optionally be stored compressed (gzip, or zstd if the 'zstandard' package is
+installed) as <digest>.gz / <digest>.zst. The digest is always that of the original
+bytes, so links and ETags do not depend on how a blob happens to be stored.
+
+A blob can also be stored as a delta against another blob (<digest>.delta), e.g. a model
+version against its parent: a gzipped list of line ranges copied from the base plus the
+inserted lines. Deltas are rebuilt while streaming, reading the base front to back, so opening
+one costs no more memory than opening a full blob. Bases may themselves be deltas, up to
+MAX_DELTA_DEPTH levels.
+"""
+import difflib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError: # Optional dependency, only needed for UPLOAD_COMPRESSION=zstd
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError: # Not on Windows; store_delta() then relies on running in a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Content-Encoding token -> file suffix of blobs stored with that encoding
+ENCODING_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# Blobs stored as a delta against another blob; never sent as a Content-Encoding
+DELTA_ENCODING = "delta"
+DELTA_SUFFIX = ".delta"
+# Longest chain of deltas (delta of a delta of ...) that store_delta() will create
+MAX_DELTA_DEPTH = 8
+# A delta is only kept if it is at most this fraction of the blob's full size
+DELTA_MAX_RATIO = 0.5
+
+LINK_PREFIX = "cas"
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def make_link(digest, filename):
+    """ Logical path stored in the DB for a blob plus the name it was uploaded under. """
+    return f"{LINK_PREFIX}/{digest}/{filename}"
+
+
+def parse_link(rel_path):
+    """ Returns (digest, filename) for a 'cas/<digest>/<name>' path, or None for a legacy upload path. """
+    parts = rel_path.split("/")
+    if len(parts) == 3 and parts[0] == LINK_PREFIX and _DIGEST_RE.match(parts[1]) and parts[2]:
+        return parts[1], parts[2]
+    return None
+
+
+class BlobStore:
+    """
+    Stores file contents by SHA-256 digest under ``root``.
+    ``compression`` (None, 'gzip' or 'zstd') applies to blobs written from now on.
+    """
+
+    def __init__(self, root, chunk_size=1024 * 1024, compression=None, compression_level=None):
+        if compression not in (None, *ENCODING_SUFFIXES):
+            raise ValueError(f"Unsupported blob compression '{compression}'.")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression requested but the 'zstandard' package is not installed.")
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_level = compression_level
+        self.tmp_dir = self.root / ".tmp"
+
+    def path_for(self, digest, encoding=None):
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob digest '{digest}'.")
+        suffix = DELTA_SUFFIX if encoding == DELTA_ENCODING else ENCODING_SUFFIXES.get(encoding, "")
+        return self.root / digest[:2] / digest[2:4] / (digest + suffix)
+
+    def locate(self, digest):
+        """
+        Returns (path, encoding) of a stored blob (encoding None = stored raw, 'delta' = stored as a
+        delta, only readable through open()), or (None, None).
+        """
+        for encoding in (None, *ENCODING_SUFFIXES, DELTA_ENCODING):
+            path = self.path_for(digest, encoding)
+            if path.is_file():
+                return path, encoding
+        return None, None
+
+    def exists(self, digest):
+        return self.locate(digest)[0] is not None
+
+    def touch(self, digest, _depth=0):
+        """
+        Marks a stored blob (and the base of a delta) as just used, so collect_garbage()'s grace
+        period starts again: called whenever an upload is stored as this blob, which is
+        referenced only once the upload's row is committed. Returns False if it is not stored.
+        """
+        path, encoding = self.locate(digest)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError: # Deleted, or just re-stored as a delta (a new file, so a fresh mtime)
+            return self.exists(digest)
+        if encoding == DELTA_ENCODING and _depth < MAX_DELTA_DEPTH:
+            base = self.delta_base(digest)
+            if base is not None:
+                self.touch(base, _depth + 1)
+        return True
+
+    def open(self, digest, _depth=0):
+        """ Opens a blob for reading its original (decompressed) bytes. Raises FileNotFoundError if missing. """
+        path, encoding = self.locate(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob {digest} not found.")
+        if encoding == "gzip":
+            return gzip.open(path, "rb")
+        if encoding == "zstd":
+            if zstandard is None:
+                raise RuntimeError(f"Blob {digest} is zstd-compressed but 'zstandard' is not installed.")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        if encoding == DELTA_ENCODING:
+            return self._open_delta(path, _depth)
+        return open(path, "rb")
+
+    def _open_delta(self, path, depth=0):
+        if depth >= MAX_DELTA_DEPTH:
+            raise ValueError(f"Delta chain at {path} is longer than {MAX_DELTA_DEPTH} blobs.")
+        delta = gzip.open(path, "rb")
+        try:
+            header = json.loads(delta.readline())
+            base = self.open(header["base"], depth + 1)
+        except BaseException:
+            delta.close()
+            raise
+        return io.BufferedReader(_DeltaReader(delta, base), buffer_size=self.chunk_size)
+
+    def delta_base(self, digest):
+        """ The digest a delta blob is stored against, or None if the blob is stored in full (or missing). """
+        path, encoding = self.locate(digest)
+        if encoding != DELTA_ENCODING:
+            return None
+        with gzip.open(path, "rb") as delta:
+            return json.loads(delta.readline())["base"]
+
+    def store_delta(self, digest, base_digest, max_size=64 * 1024 * 1024):
+        """
+        Re-stores blob ``digest`` as a line-based delta against ``base_digest`` if that saves at
+        least half of its size. Both blobs are read into memory to be compared, so blobs larger
+        than ``max_size`` are left alone. The delta is verified against the digest before it
+        replaces the full copy. Returns True if the blob is now stored as a delta.
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        # One delta at a time per store: two concurrent calls could otherwise each make their
+        # blob a delta of the other's
+        with open(self.tmp_dir / "delta.lock", "wb") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            return self._store_delta(digest, base_digest, max_size)
+
+    def _store_delta(self, digest, base_digest, max_size):
+        path, encoding = self.locate(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob {digest} not found.")
+        if encoding == DELTA_ENCODING or digest == base_digest or not self.exists(base_digest):
+            return False
+        # Refuse chains that are too long or would loop back to this blob
+        chain, depth = base_digest, 1
+        while chain is not None:
+            if chain == digest or depth >= MAX_DELTA_DEPTH:
+                return False
+            chain, depth = self.delta_base(chain), depth + 1
+
+        with self.open(digest) as f: # Lines split on b"\n" only, like readline() when the delta is rebuilt
+            new_lines = io.BytesIO(f.read(max_size + 1)).readlines()
+        size = sum(len(line) for line in new_lines)
+        if size > max_size:
+            return False
+        with self.open(base_digest) as f:
+            base_lines = io.BytesIO(f.read(max_size + 1)).readlines()
+        if sum(len(line) for line in base_lines) > max_size:
+            return False
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as raw_out, gzip.GzipFile(fileobj=raw_out, mode="wb", mtime=0) as out:
+                out.write(json.dumps({"base": base_digest}).encode() + b"\n")
+                matcher = difflib.SequenceMatcher(None, base_lines, new_lines)
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                    if tag == "equal":
+                        out.write(f"C {i1} {i2 - i1}\n".encode())
+                    elif j2 > j1: # 'replace' / 'insert'; 'delete' needs no op, copies just skip ahead
+                        inserted = b"".join(new_lines[j1:j2])
+                        out.write(f"I {len(inserted)}\n".encode())
+                        out.write(inserted)
+            del base_lines, new_lines
+            if os.path.getsize(tmp_name) > size * DELTA_MAX_RATIO:
+                os.unlink(tmp_name)
+                return False
+            hasher = hashlib.sha256()
+            with self._open_delta(tmp_name) as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    hasher.update(chunk)
+            if hasher.hexdigest() != digest:
+                raise ValueError(f"Delta of blob {digest} does not reproduce it; keeping the full copy.")
+            os.replace(tmp_name, self.path_for(digest, DELTA_ENCODING))
+        except BaseException:
+            try: os.unlink(tmp_name)
+            except OSError: pass
+            raise
+        path.unlink() # Remove the full copy only after the verified delta is in place
+        return True
+
+    def _compressing_writer(self, raw_out):
+        """ Wraps a binary file so writes are compressed with the store's compression (if any). """
+        if self.compression == "gzip":
+            level = self.compression_level or 6
+            return gzip.GzipFile(fileobj=raw_out, mode="wb", compresslevel=level, mtime=0)
+        if self.compression == "zstd":
+            level = self.compression_level or 3
+            return zstandard.ZstdCompressor(level=level).stream_writer(raw_out, closefd=False)
+        return None
+
+    def _hash_stream(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+
+    def put_stream(self, stream):
+        """
+        Stores the contents of a binary stream. Returns (digest, size, created) where created is
+        False if identical content was already stored.
+
+        Seekable streams (Werkzeug spools uploads to memory or a temp file) are hashed first, so a
+        duplicate is detected before anything is written. Non-seekable streams are copied to a temp
+        file in the store while hashing and moved into place only if the blob is new.
+        """
+        if _is_seekable(stream):
+            start = stream.tell()
+            digest, size = self._hash_stream(stream)
+            if self.touch(digest):
+                return digest, size, False
+            stream.seek(start)
+            written_digest, _ = self._write_new(stream)
+            if written_digest != digest: # Stream changed underneath us; trust what was written
+                digest = written_digest
+            return digest, size, True
+
+        digest, size = self._write_new(stream)
+        return digest, size, True
+
+    def _write_new(self, stream):
+        """
+        Copies a stream into a temp file while hashing (compressing it on the way if configured),
+        then atomically moves it to its blob path.
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as raw_out:
+                writer = self._compressing_writer(raw_out)
+                out = writer or raw_out
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                if writer is not None:
+                    writer.close() # Flushes the compressed trailer; raw_out stays open until the with exits
+            digest = hasher.hexdigest()
+            dest = self.path_for(digest, self.compression)
+            if self.touch(digest):
+                os.unlink(tmp_name) # Lost a race with an identical upload; keep the existing copy
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, dest)
+            return digest, size
+        except BaseException:
+            try: os.unlink(tmp_name)
+            except OSError: pass
+            raise
+
+    def put_file(self, path):
+        """ Stores an existing file (used when importing legacy uploads). """
+        with open(path, "rb") as f:
+            return self.put_stream(f)
+
+    def adopt_file(self, path):
+        """
+        Stores a finished staging file without copying it when possible: raw blobs are hard-linked
+        into place, so the caller can delete the staging file once it no longer needs it (e.g. after
+        the DB commit) and a failed commit can be retried. ``path`` must be on the store's filesystem.
+        Returns (digest, size, created).
+        """
+        path = Path(path)
+        with open(path, "rb") as f:
+            digest, size = self._hash_stream(f)
+        if self.touch(digest):
+            return digest, size, False
+        if self.compression is None:
+            dest = self.path_for(digest)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, dest)
+            except FileExistsError:
+                self.touch(digest)
+                return digest, size, False # Identical upload finished first
+            except OSError:
+                with open(path, "rb") as f: # No hard links here (e.g. another filesystem); copy instead
+                    self._write_new(f)
+            else:
+                os.utime(dest) # A link keeps the staging file's mtime, which may be older than the GC grace period
+        else:
+            with open(path, "rb") as f:
+                self._write_new(f)
+        return digest, size, True
+
+    def recompress(self, digest):
+        """
+        Rewrites a stored blob with the store's current compression. Returns True if it was
+        rewritten, False if it was already stored that way.
+        """
+        path, encoding = self.locate(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob {digest} not found.")
+        if encoding == self.compression or encoding == DELTA_ENCODING: # Deltas are already gzipped
+            return False
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            hasher = hashlib.sha256()
+            with self.open(digest) as src, os.fdopen(fd, "wb") as raw_out:
+                writer = self._compressing_writer(raw_out)
+                out = writer or raw_out
+                while True:
+                    chunk = src.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                if writer is not None:
+                    writer.close()
+            if hasher.hexdigest() != digest:
+                raise ValueError(f"Blob {digest} is corrupt (content hash mismatch); left unchanged.")
+            os.replace(tmp_name, self.path_for(digest, self.compression))
+        except BaseException:
+            try: os.unlink(tmp_name)
+            except OSError: pass
+            raise
+        path.unlink() # Remove the old representation only after the new one is in place
+        return True
+
+    def iter_digests(self):
+        """ Yields (digest, path) for every stored blob. """
+        for path in self.root.glob("??/??/*"):
+            digest = path.name.split(".", 1)[0]
+            if path.is_file() and _DIGEST_RE.match(digest):
+                yield digest, path
+
+    def collect_garbage(self, referenced, grace_seconds=3600):
+        """
+        Deletes blobs whose digest is not in ``referenced`` and that are older than the grace
+        period (so blobs of uploads still in flight are kept). The bases of referenced delta blobs
+        count as referenced. Returns the deleted digests.
+        """
+        referenced = set(referenced)
+        pending = list(referenced)
+        while pending:
+            base = self.delta_base(pending.pop())
+            if base is not None and base not in referenced:
+                referenced.add(base)
+                pending.append(base)
+        cutoff = time.time() - grace_seconds
+        deleted = []
+        for digest, path in self.iter_digests():
+            if digest in referenced:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    deleted.append(digest)
+            except OSError as e:
+                logger.warning("Could not remove unreferenced blob %s: %s", digest, e)
+        return deleted
+
+
+def store_blob_delta(root, digest, base_digest, max_size=64 * 1024 * 1024):
+    """ Job entry point (runs in a worker process): BlobStore(root).store_delta(), reported as a small dict. """
+    store = BlobStore(root)
+    path, _ = store.locate(digest)
+    size_before = path.stat().st_size if path is not None else None
+    stored = store.store_delta(digest, base_digest, max_size)
+    return {
+        "sha256": digest,
+        "base": base_digest,
+        "delta": stored,
+        "size_before": size_before,
+        "size_after": store.locate(digest)[0].stat().st_size if stored else size_before,
+    }
+
+
+class _DeltaReader(io.RawIOBase):
+    """ Rebuilds a delta blob from its ops and a base stream that is read once, front to back. """
+
+    def __init__(self, delta, base):
+        self._delta = delta
+        # Raw and gzip files read lines themselves; zstd readers need a buffer for readline()
+        self._base = base if hasattr(base, "peek") else io.BufferedReader(base)
+        self._chunks = self._generate()
+        self._pending = b""
+
+    def _generate(self):
+        base_line = 0
+        while True:
+            op = self._delta.readline()
+            if not op:
+                return
+            kind, *args = op.split()
+            if kind == b"C":
+                start, count = int(args[0]), int(args[1])
+                while base_line < start: # Lines deleted from the base
+                    if not self._base.readline():
+                        raise ValueError("Delta refers past the end of its base blob.")
+                    base_line += 1
+                for _ in range(count):
+                    line = self._base.readline()
+                    if not line:
+                        raise ValueError("Delta refers past the end of its base blob.")
+                    base_line += 1
+                    yield line
+            elif kind == b"I":
+                size = int(args[0])
+                data = self._delta.read(size)
+                if len(data) != size:
+                    raise ValueError("Delta blob is truncated.")
+                yield data
+            else:
+                raise ValueError(f"Invalid delta op {op[:20]!r}.")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._delta.close()
+            self._base.close()
+        super().close()
+
+
+def _is_seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
@@ -0,0 +1,110 @@
+"""
+Streaming zip / tar archives for model bundles (/api/models/<id>/bundle and /api/models/bundle).
+
+Archives are written into a small in-memory sink that the response generator drains after
+every chunk, so a bundle of any size is produced with constant memory and no temp files.
+Zip members are deflated and written with data descriptors (their sizes follow the data);
+tar needs each member's size in its header, so members of unknown size (compressed or delta
+blobs) are read twice, once to count. Timestamps are fixed, so the same bundle is
+byte-identical every time it is built and can carry a strong ETag.
+"""
+import gzip
+import tarfile
+import zipfile
+
+# ?format= -> (mimetype, file name suffix)
+BUNDLE_FORMATS = {
+    "zip":    ("application/zip", ".zip"),
+    "tar":    ("application/x-tar", ".tar"),
+    "tar.gz": ("application/gzip", ".tar.gz"),
+}
+# 1980-01-01, the earliest timestamp zip can store
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_TAR_MTIME = 315532800
+
+
+class _Sink:
+    """ Write-only, non-seekable file object that collects output until it is drained. """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._parts:
+            data = b"".join(self._parts)
+            self._parts = []
+            if data:
+                yield data
+
+
+def stream_archive(fmt, members, chunk_size=1024 * 1024):
+    """
+    Yields the bytes of a ``fmt`` archive ('zip', 'tar' or 'tar.gz') of ``members``, an iterable
+    of (archive name, size or None, opener) where opener() returns a binary stream.
+    """
+    if fmt not in BUNDLE_FORMATS:
+        raise ValueError(f"Unsupported bundle format '{fmt}'.")
+    sink = _Sink()
+    if fmt == "zip":
+        yield from _stream_zip(sink, members, chunk_size)
+    else:
+        yield from _stream_tar(sink, members, chunk_size, compress=fmt == "tar.gz")
+
+
+def _stream_zip(sink, members, chunk_size):
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, size, opener in members:
+            info = zipfile.ZipInfo(name, date_time=_ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            if size is not None:
+                info.file_size = size # Lets zipfile decide whether the member needs zip64 fields
+            with opener() as src, archive.open(info, "w", force_zip64=size is None) as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dest.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain() # Central directory
+
+
+def _stream_tar(sink, members, chunk_size, compress):
+    out = gzip.GzipFile(fileobj=sink, mode="wb", mtime=0) if compress else sink
+    total = 0 # Uncompressed bytes written, for the final record padding
+    for name, size, opener in members:
+        if size is None:
+            with opener() as src:
+                size = sum(len(chunk) for chunk in iter(lambda: src.read(chunk_size), b""))
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = _TAR_MTIME
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        out.write(header)
+        total += len(header)
+        written = 0
+        with opener() as src:
+            while written < size:
+                chunk = src.read(min(chunk_size, size - written))
+                if not chunk:
+                    break
+                out.write(chunk)
+                written += len(chunk)
+                yield from sink.drain()
+        if written != size:
+            raise OSError(f"'{name}' changed size while it was being archived.")
+        padding = -size % tarfile.BLOCKSIZE
+        out.write(tarfile.NUL * padding)
+        total += size + padding
+    # End of archive: two zero blocks, padded to a full record like tarfile does
+    end = tarfile.BLOCKSIZE * 2
+    out.write(tarfile.NUL * (end + -(total + end) % tarfile.RECORDSIZE))
+    if compress:
+        out.close()
+    yield from sink.drain()
@@ -0,0 +1,177 @@
+"""
+Resumable chunked uploads.
+
+Protocol (see the /api/uploads routes in app2.py):
+
+    POST   /api/uploads                 initiate -> upload_id
+    PUT    /api/uploads/<id>            append a chunk at Upload-Offset (or ?offset=)
+    HEAD   /api/uploads/<id>            current offset, so an interrupted client can resume
+    POST   /api/uploads/<id>/finalize   hash + store the file and insert the model row
+    DELETE /api/uploads/<id>            abandon
+
+Chunks are streamed straight from the request body into a staging file, so memory use does
+not depend on chunk or file size. The staging file's size on disk is the authoritative
+offset; a chunk is only accepted if it starts exactly there. Writing a chunk and finalizing
+both take an exclusive flock on the staging file, so a file is never stored while a chunk is
+still being appended to it.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """ Client-visible error in the upload protocol; ``status`` is the HTTP status to return. """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadSessions:
+    """ Staging area for in-progress chunked uploads: <id>.part (data) + <id>.json (metadata). """
+
+    def __init__(self, staging_dir, max_size, chunk_size=1024 * 1024, ttl_seconds=24 * 3600):
+        self.staging_dir = Path(staging_dir)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.ttl_seconds = ttl_seconds
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            raise UploadError("Unknown upload id.", status=404)
+        return self.staging_dir / f"{upload_id}.part", self.staging_dir / f"{upload_id}.json"
+
+    def create(self, filename, total_size=None):
+        """ Starts a new upload session and returns its metadata dict. """
+        if total_size is not None and not 0 < total_size <= self.max_size:
+            raise UploadError(f"Upload size must be between 1 byte and {self.max_size} bytes.", status=413)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {"upload_id": upload_id, "filename": filename, "total_size": total_size, "created": time.time()}
+        part_path.touch()
+        meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        return meta
+
+    def status(self, upload_id):
+        """ Returns the session metadata plus the current offset (bytes received so far). """
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta["offset"] = part_path.stat().st_size
+        except FileNotFoundError:
+            raise UploadError("Unknown or expired upload id.", status=404)
+        return meta
+
+    def write_chunk(self, upload_id, offset, stream, length=None):
+        """
+        Appends the body of ``stream`` at ``offset`` and returns the new offset.
+        The staging file is locked while writing, so two clients can't interleave chunks.
+        """
+        meta = self.status(upload_id)
+        part_path, _ = self._paths(upload_id)
+        limit = meta["total_size"] or self.max_size
+        if length is not None and offset + length > limit:
+            raise UploadError(f"Chunk would exceed the upload size of {limit} bytes.", status=413, offset=meta["offset"])
+
+        with open(part_path, "r+b") as part:
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("Another chunk for this upload is being written.", status=409, offset=meta["offset"])
+            part_stat = os.fstat(part.fileno())
+            if part_stat.st_nlink > 1:
+                # finalize() hard-linked this file into the blob store; it must never change again
+                raise UploadError("Upload has already been finalized.", status=409, offset=part_stat.st_size)
+            current = part_stat.st_size
+            if offset != current:
+                raise UploadError(f"Chunk offset {offset} does not match the current offset {current}.",
+                                  status=409, offset=current)
+            part.seek(current)
+            written = 0
+            try:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if current + written + len(chunk) > limit:
+                        raise UploadError(f"Upload exceeds {limit} bytes.", status=413)
+                    part.write(chunk)
+                    written += len(chunk)
+            except BaseException:
+                # Drop the partial chunk so the offset stays at the last complete one
+                part.truncate(current)
+                raise
+            return current + written
+
+    @contextmanager
+    def locked(self, upload_id):
+        """
+        Holds the lock write_chunk() takes for the duration of the block, so the staging file can't
+        change while it is read (finalize: hash it into the blob store). Raises UploadError (409)
+        if a chunk is being written right now.
+        """
+        part_path, _ = self._paths(upload_id)
+        try:
+            part = open(part_path, "rb")
+        except FileNotFoundError:
+            raise UploadError("Unknown or expired upload id.", status=404)
+        with part:
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("A chunk for this upload is still being written.", status=409,
+                                  offset=os.fstat(part.fileno()).st_size)
+            yield
+
+    def complete(self, upload_id):
+        """ Checks the upload is complete and returns (staging file path, metadata); call it under locked(). """
+        meta = self.status(upload_id)
+        if meta["total_size"] is not None and meta["offset"] != meta["total_size"]:
+            raise UploadError(
+                f"Upload incomplete: received {meta['offset']} of {meta['total_size']} bytes.",
+                status=409, offset=meta["offset"]
+            )
+        if meta["offset"] == 0:
+            raise UploadError("Upload is empty.", status=400, offset=0)
+        part_path, _ = self._paths(upload_id)
+        return part_path, meta
+
+    def discard(self, upload_id):
+        """ Removes a session's staging files (after finalize, or when the client abandons it). """
+        for path in self._paths(upload_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def cleanup_expired(self):
+        """ Deletes sessions older than the TTL. Returns the number removed. """
+        if not self.staging_dir.is_dir():
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for meta_path in self.staging_dir.glob("*.json"):
+            part_path = meta_path.with_suffix(".part")
+            try:
+                # The .part file's mtime moves with every chunk, so active uploads are not expired
+                last_activity = max(meta_path.stat().st_mtime,
+                                    part_path.stat().st_mtime if part_path.exists() else 0)
+                if last_activity < cutoff:
+                    self.discard(meta_path.stem)
+                    removed += 1
+            except (OSError, UploadError) as e:
+                logger.warning("Could not remove expired upload %s: %s", meta_path.stem, e)
+        return removed
@@ -0,0 +1,74 @@
+"""
+Minimal schema migration runner for the gapfill database.
+
+Migrations are plain SQL files in migrations/ named NNN_description.sql. They are
+applied in file-name order and recorded in the schema_migrations table, so running
+the command again only applies new files. Run it through the Flask CLI:
+
+    flask --app app2 db-migrate
+"""
+import logging
+from pathlib import Path
+
+import mariadb
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent.resolve() / "migrations"
+
+
+def split_statements(sql_text):
+    """ Splits a migration file into statements on ';' line endings, dropping '--' comment lines. """
+    statements, current = [], []
+    for line in sql_text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("--"):
+            continue
+        current.append(line)
+        if stripped.endswith(";"):
+            statements.append("\n".join(current).rstrip().rstrip(";"))
+            current = []
+    if current:
+        statements.append("\n".join(current))
+    return statements
+
+
+def pending_migrations(conn, migrations_dir=MIGRATIONS_DIR):
+    """ Returns the migration files that have not been recorded in schema_migrations yet. """
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version VARCHAR(255) NOT NULL PRIMARY KEY,"
+            " applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+    finally:
+        cur.close()
+    return [p for p in sorted(Path(migrations_dir).glob("*.sql")) if p.stem not in applied]
+
+
+def apply_migrations(conn, migrations_dir=MIGRATIONS_DIR):
+    """
+    Applies every pending migration in order and returns the list of applied versions.
+    DDL auto-commits in MariaDB, so a migration that fails half way must be written to be
+    re-runnable (IF NOT EXISTS); it is only recorded once all its statements succeed.
+    """
+    applied = []
+    for path in pending_migrations(conn, migrations_dir):
+        logger.info("Applying migration %s", path.name)
+        cur = conn.cursor()
+        try:
+            for statement in split_statements(path.read_text(encoding="utf-8")):
+                cur.execute(statement)
+            cur.execute("INSERT INTO schema_migrations (version) VALUES (?)", (path.stem,))
+            conn.commit()
+        except mariadb.Error:
+            conn.rollback()
+            logger.error("Migration %s failed; later migrations were not applied.", path.name)
+            raise
+        finally:
+            cur.close()
+        applied.append(path.stem)
+    return applied
@@ -0,0 +1,292 @@
+"""
+Thread-safe MariaDB connection pool shared by app.py and app2.py.
+
+Each request checks a connection out of the pool, uses it for the lifetime of
+the request and hands it back in the Flask teardown hook. Connections are only
+pinged when they have been sitting idle for longer than the health-check
+interval, so a busy worker does not pay a ping round-trip on every request.
+
+Creating a pool opens nothing. Just before the process forks (pre-forking
+servers, multiprocessing), every pool closes its idle connections, so the child
+never inherits a session it could end or corrupt; the parent reopens them on
+demand. Connections checked out at that moment stay with the threads using them:
+don't fork from inside `with pool.connection()`, as the child would share that
+socket with the parent. The child starts with an empty pool of its own.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+import mariadb
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(mariadb.OperationalError):
+    """ Raised when no connection could be checked out before the timeout expired. """
+
+
+_pools = weakref.WeakSet()
+
+
+def _close_idle_before_fork():
+    for pool in list(_pools):
+        pool._close_idle_before_fork()
+
+
+def _reset_pools_after_fork():
+    for pool in list(_pools):
+        pool._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_close_idle_before_fork, after_in_child=_reset_pools_after_fork)
+
+
+class ConnectionPool:
+    """
+    A bounded pool of MariaDB connections.
+
+    Connections are opened lazily (up to ``size``) and reused LIFO so the most
+    recently used - and therefore most likely still alive - connection is
+    handed out first. Every connection is rolled back when it is returned,
+    which ends any open transaction/read snapshot before the next request
+    sees it.
+    """
+
+    def __init__(self, db_config, size=5, timeout=10.0, health_check_interval=30.0,
+                 autocommit=False, connect=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.db_config = dict(db_config)
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.autocommit = autocommit
+        self._connect = connect or mariadb.connect
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (connection, monotonic time it was returned)
+        self._open = 0         # connections created and not yet closed
+        self._waiting = 0
+        self._closed = False
+        self._pid = os.getpid()
+        self._inherited = []   # Parent's idle connections after a fork that bypassed the hooks
+        _pools.add(self)
+
+        self._stats = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "connect_failures": 0,
+            "health_checks": 0,
+            "health_check_failures": 0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+            "total_wait_seconds": 0.0,
+        }
+
+    # --- Connection lifecycle ---
+
+    def _new_connection(self):
+        """ Opens a connection in the slot acquire() reserved; on any failure the slot is freed again. """
+        conn = None
+        try:
+            conn = self._connect(**self.db_config)
+            conn.autocommit = self.autocommit
+        except BaseException: # Not only mariadb.Error: a bad config (TypeError) must not leak the slot either
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.debug("Error closing half-configured connection: %s", e)
+            with self._cond:
+                self._open -= 1
+                self._stats["connect_failures"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["connections_created"] += 1
+        logger.info("Opened new pooled MariaDB connection (%d/%d open).", self._open, self.size)
+        return conn
+
+    def _discard(self, conn):
+        """ Closes a connection and frees its slot in the pool. """
+        try:
+            conn.close()
+        except mariadb.Error as e:
+            logger.debug("Error closing discarded connection: %s", e)
+        with self._cond:
+            self._open -= 1
+            self._stats["connections_discarded"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, idle_since):
+        """ Pings a connection only if it has been idle longer than the health-check interval. """
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        with self._cond:
+            self._stats["health_checks"] += 1
+        try:
+            conn.ping()
+            return True
+        except mariadb.Error as e:
+            logger.warning("Idle pooled connection failed health check: %s", e)
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _close_idle_before_fork(self):
+        """ Called in the parent just before a fork: closes the idle connections so the child can't inherit them. """
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def _reset_after_fork(self):
+        """
+        Called in a forked child: starts with an empty pool. Connections still open in the parent
+        at fork time belong to the parent and are never used or closed here. Checked-out ones stay
+        referenced by the parent's threads, which don't exist in the child. Idle ones only
+        remain if the fork bypassed os.register_at_fork (e.g. a fork in C code). They are kept
+        referenced in ``_inherited`` so that garbage collection does not close them; the
+        connector may still send them a quit when the child's interpreter exits.
+        """
+        if self._pid == os.getpid():
+            return
+        in_use = self._open - len(self._idle)
+        if self._idle or in_use:
+            logger.warning("Forked with %d idle and %d checked-out pooled connection(s) of process %d;"
+                           " they are not used in process %d.", len(self._idle), in_use, self._pid, os.getpid())
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._pid = os.getpid()
+        self._cond = threading.Condition() # The parent's lock may have been held at fork time
+        self._idle = deque()
+        self._open = 0
+        self._waiting = 0
+
+    # --- Checkout / return ---
+
+    def acquire(self, timeout=None):
+        """ Checks a connection out of the pool, blocking up to ``timeout`` seconds. """
+        timeout = self.timeout if timeout is None else timeout
+        if self._pid != os.getpid(): # Forked without the at-fork hook (e.g. by a C extension)
+            self._reset_after_fork()
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = idle_since = None
+            with self._cond:
+                if self._closed:
+                    raise mariadb.InterfaceError("Connection pool is closed.")
+                self._waiting += 1
+                try:
+                    while not self._idle and self._open >= self.size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeoutError(
+                                f"Timed out after {timeout:.1f}s waiting for a database connection "
+                                f"(pool size {self.size})."
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._open += 1 # Reserve the slot before connecting outside the lock
+
+            if conn is None:
+                conn = self._new_connection()
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue # Try the next idle connection or open a fresh one
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["total_wait_seconds"] += time.monotonic() - started
+                in_use = self._open - len(self._idle)
+                if in_use > self._stats["peak_in_use"]:
+                    self._stats["peak_in_use"] = in_use
+            return conn
+
+    def release(self, conn, discard=False):
+        """ Returns a connection to the pool, rolling back any uncommitted work first. """
+        if conn is None:
+            return
+        if not discard:
+            try:
+                conn.rollback()
+            except mariadb.Error as e:
+                logger.warning("Discarding pooled connection that failed rollback on release: %s", e)
+                discard = True
+
+        with self._cond:
+            closed = self._closed
+            if not discard and not closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """ Context manager that checks a connection out and always returns it. """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except (mariadb.InterfaceError, mariadb.OperationalError):
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def warm(self, count=1):
+        """ Opens up to ``count`` connections ahead of time so the first requests don't pay for it. """
+        conns = []
+        try:
+            for _ in range(min(count, self.size)):
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+
+    def close_all(self):
+        """ Closes every idle connection and refuses further checkouts. """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # --- Introspection ---
+
+    def stats(self):
+        """ Returns a snapshot of the pool counters as a plain dict. """
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiting": self._waiting,
+            })
+        checkouts = snapshot["checkouts"]
+        snapshot["avg_wait_ms"] = round(1000 * snapshot.pop("total_wait_seconds") / checkouts, 3) if checkouts else 0.0
+        return snapshot
@@ -0,0 +1,260 @@
+"""
+Flux balance analysis of uploaded SBML models.
+
+read_fba_problem() streams an SBML file (ElementTree.iterparse, elements dropped as soon as
+they are read) into the stoichiometry, flux bounds and objective; solve_fba() maximises (or
+minimises) the objective with SciPy's HiGHS LP solver. SciPy is an optional dependency, imported
+on the first solve: without it, FBA jobs fail with a clear error and the rest of the app is
+unaffected.
+
+run_fba_job() and run_fba_blob_job() are the entry points executed in the job runner's worker
+processes, so they only take picklable arguments and never touch the database.
+
+Bounds follow the fbc package (lowerFluxBound/upperFluxBound parameters) or, for COBRA Level 2
+files, the LOWER_BOUND/UPPER_BOUND/OBJECTIVE_COEFFICIENT kinetic law parameters. Boundary
+species are left out of the steady-state constraints.
+"""
+import gzip
+import math
+import xml.etree.ElementTree as ET
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from blob_store import BlobStore
+
+DEFAULT_BOUND = 1000.0
+# Objective values at or below this count as "no growth"
+GROWTH_THRESHOLD = 1e-6
+# Fluxes reported in a job result (largest absolute values first)
+MAX_REPORTED_FLUXES = 25
+
+
+class FBAError(Exception):
+    """ The model can't be turned into an LP, or no solver is available. """
+
+
+def _local(name):
+    return name.rsplit("}", 1)[-1]
+
+
+def _attr(elem, name):
+    value = elem.get(name)
+    if value is not None:
+        return value
+    for key, value in elem.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+def _float(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def read_fba_problem(source):
+    """
+    Parses an SBML document (path or binary file object) into a dict with 'species'
+    (non-boundary species ids), 'reactions' ([{id, lb, ub, stoichiometry: {species: coeff}}]),
+    'objective' ({reaction id: coefficient}) and 'sense' ('maximize' / 'minimize').
+    """
+    parameters = {}
+    boundary_species = set()
+    species = []
+    reactions = []
+    fbc_objectives = {}
+    active_objective = None
+    current_objective = None
+    legacy_objective = {}
+    reaction = None
+    side = None # 'reactants' / 'products' while inside a species reference list
+    stack = []
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "end":
+            if tag == "reaction":
+                reactions.append(reaction)
+                reaction = None
+            elif tag in ("listOfReactants", "listOfProducts"):
+                side = None
+            elif tag == "objective":
+                current_objective = None
+            stack.pop()
+            if stack:
+                del stack[-1][-1]
+            continue
+
+        if not stack and tag != "sbml":
+            raise FBAError(f"Not an SBML document (root element is <{tag}>).")
+        stack.append(elem)
+        if tag == "species":
+            if elem.get("boundaryCondition") == "true":
+                boundary_species.add(elem.get("id"))
+            else:
+                species.append(elem.get("id"))
+        elif tag == "parameter":
+            if reaction is None:
+                parameters[elem.get("id")] = _float(elem.get("value"))
+            else: # COBRA Level 2 kinetic law parameters
+                name, value = elem.get("id"), _float(elem.get("value"))
+                if name == "LOWER_BOUND" and value is not None:
+                    reaction["lb"] = value
+                elif name == "UPPER_BOUND" and value is not None:
+                    reaction["ub"] = value
+                elif name == "OBJECTIVE_COEFFICIENT" and value:
+                    legacy_objective[reaction["id"]] = value
+        elif tag == "reaction":
+            reversible = elem.get("reversible", "true") != "false"
+            lower, upper = _attr(elem, "lowerFluxBound"), _attr(elem, "upperFluxBound")
+            reaction = {
+                "id": elem.get("id"),
+                "lb": parameters.get(lower) if lower else None,
+                "ub": parameters.get(upper) if upper else None,
+                "stoichiometry": {},
+            }
+            if reaction["lb"] is None:
+                reaction["lb"] = -DEFAULT_BOUND if reversible else 0.0
+            if reaction["ub"] is None:
+                reaction["ub"] = DEFAULT_BOUND
+        elif tag in ("listOfReactants", "listOfProducts") and reaction is not None:
+            side = tag
+        elif tag == "speciesReference" and reaction is not None and side:
+            coefficient = _float(elem.get("stoichiometry"), 1.0)
+            sign = -1.0 if side == "listOfReactants" else 1.0
+            species_id = elem.get("species")
+            reaction["stoichiometry"][species_id] = reaction["stoichiometry"].get(species_id, 0.0) + sign * coefficient
+        elif tag == "listOfObjectives":
+            active_objective = _attr(elem, "activeObjective")
+        elif tag == "objective":
+            current_objective = _attr(elem, "id")
+            fbc_objectives[current_objective] = (_attr(elem, "type") or "maximize", {})
+        elif tag == "fluxObjective" and current_objective is not None:
+            fbc_objectives[current_objective][1][_attr(elem, "reaction")] = _float(_attr(elem, "coefficient"), 1.0)
+
+    if fbc_objectives:
+        sense, objective = fbc_objectives.get(active_objective) or next(iter(fbc_objectives.values()))
+    else:
+        sense, objective = "maximize", legacy_objective
+    return {
+        "species": [s for s in species if s not in boundary_species],
+        "reactions": reactions,
+        "objective": objective,
+        "sense": "minimize" if sense.lower().startswith("min") else "maximize",
+    }
+
+
+def solve_fba(problem, bound_overrides=None):
+    """
+    Solves the FBA linear program S.v = 0, lb <= v <= ub, optimising the objective.
+    ``bound_overrides`` maps reaction id -> [lb, ub] (e.g. to set a medium).
+    Returns a JSON-serialisable result dict.
+    """
+    # Imported here, in the job worker, so importing this module (the web app does) stays cheap
+    try:
+        import numpy as np
+        from scipy.optimize import linprog
+        from scipy.sparse import coo_matrix
+    except ImportError: # Optional dependency, only needed to run FBA jobs
+        raise FBAError("FBA needs SciPy (pip install scipy); it is not installed on this server.")
+    reactions = problem["reactions"]
+    if not reactions:
+        raise FBAError("Model has no reactions.")
+    if not problem["objective"]:
+        raise FBAError("Model has no objective.")
+
+    bound_overrides = bound_overrides or {}
+    reaction_index = {r["id"]: j for j, r in enumerate(reactions)}
+    species_index = {s: i for i, s in enumerate(problem["species"])}
+    rows, cols, values = [], [], []
+    for j, r in enumerate(reactions):
+        for species_id, coefficient in r["stoichiometry"].items():
+            i = species_index.get(species_id)
+            if i is not None and coefficient:
+                rows.append(i)
+                cols.append(j)
+                values.append(coefficient)
+    stoichiometry = coo_matrix((values, (rows, cols)), shape=(len(species_index), len(reactions))).tocsr()
+
+    bounds = []
+    for r in reactions:
+        lb, ub = bound_overrides.get(r["id"], (r["lb"], r["ub"]))
+        bounds.append((_finite_or_none(lb), _finite_or_none(ub)))
+
+    sign = -1.0 if problem["sense"] == "maximize" else 1.0 # linprog minimises
+    c = np.zeros(len(reactions))
+    missing = [rid for rid in problem["objective"] if rid not in reaction_index]
+    if missing:
+        raise FBAError(f"Objective refers to unknown reaction(s): {', '.join(missing[:5])}.")
+    for rid, coefficient in problem["objective"].items():
+        c[reaction_index[rid]] = sign * coefficient
+
+    solution = linprog(
+        c,
+        A_eq=stoichiometry if len(species_index) else None,
+        b_eq=np.zeros(len(species_index)) if len(species_index) else None,
+        bounds=bounds,
+        method="highs",
+    )
+    status = {0: "optimal", 1: "iteration_limit", 2: "infeasible", 3: "unbounded"}.get(solution.status, "failed")
+    result = {
+        "status": status,
+        "solver": "scipy-highs",
+        "sense": problem["sense"],
+        "n_reactions": len(reactions),
+        "n_metabolites": len(species_index),
+        "objective_value": None,
+        "growth": False,
+        "objective_fluxes": {},
+        "top_fluxes": {},
+    }
+    if status == "optimal":
+        fluxes = solution.x
+        objective_value = float(sign * solution.fun) + 0.0 # + 0.0 turns -0.0 into 0.0
+        result["objective_value"] = objective_value
+        result["growth"] = objective_value > GROWTH_THRESHOLD
+        result["objective_fluxes"] = {rid: float(fluxes[reaction_index[rid]]) + 0.0 for rid in problem["objective"]}
+        order = np.argsort(-np.abs(fluxes))[:MAX_REPORTED_FLUXES]
+        result["top_fluxes"] = {reactions[j]["id"]: float(fluxes[j]) for j in order if abs(fluxes[j]) > 1e-9}
+    else:
+        result["message"] = solution.message
+    return result
+
+
+def _finite_or_none(value):
+    return None if value is None or math.isinf(value) else float(value)
+
+
+def _open(path, encoding=None):
+    if encoding == "gzip":
+        return gzip.open(path, "rb")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise FBAError("Model is zstd-compressed but 'zstandard' is not installed.")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def run_fba_job(path, encoding=None, bound_overrides=None):
+    """ Worker-process entry point: reads the SBML file at ``path`` (stored with ``encoding``) and runs FBA. """
+    with _open(path, encoding) as f:
+        return _run_fba(f, bound_overrides)
+
+
+def run_fba_blob_job(blob_root, digest, bound_overrides=None):
+    """ Worker-process entry point for a blob-store file, however it is stored (compressed, or as a delta). """
+    with BlobStore(blob_root).open(digest) as f:
+        return _run_fba(f, bound_overrides)
+
+
+def _run_fba(stream, bound_overrides):
+    try:
+        problem = read_fba_problem(stream)
+    except ET.ParseError as e:
+        raise FBAError(f"Model is not valid XML: {e}")
+    return solve_fba(problem, bound_overrides)
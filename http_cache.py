@@ -0,0 +1,58 @@
+"""
+Helpers for HTTP conditional requests (ETag / Last-Modified) and per-route Cache-Control.
+
+Routes compute a cheap validator first (a catalogue version, a stored content hash, a file
+mtime) and call not_modified() before doing any real work, so a matching If-None-Match or
+If-Modified-Since is answered with a bare 304 without fetching rows or opening files.
+"""
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+
+def not_modified(etag=None, last_modified=None):
+    """
+    Returns a 304 response if the request's validators match, otherwise None.
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110, section 13.2.2).
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    if request.if_none_match:
+        matched = etag is not None and request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        matched = _to_utc(last_modified).replace(microsecond=0) <= _to_utc(request.if_modified_since)
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = Response(status=304)
+    add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag=None, last_modified=None):
+    """ Sets the ETag (strong) and Last-Modified headers on a response. """
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _to_utc(last_modified)
+    return response
+
+
+def apply_cache_control(response, policies, endpoint):
+    """
+    Sets Cache-Control from the per-endpoint policy table. The table wins over per-response
+    defaults (send_file() always sets its own 'no-cache' when no max_age is given).
+    """
+    policy = policies.get(endpoint)
+    if policy:
+        response.headers["Cache-Control"] = policy
+    return response
+
+
+def _to_utc(value):
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
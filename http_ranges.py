@@ -0,0 +1,168 @@
+"""
+Byte-range responses (RFC 9110, section 14) and front-end server offload for file downloads.
+
+Werkzeug's send_file() answers a single range but rejects multi-range requests with a 416,
+and always pushes the bytes through the Python worker. range_response() serves one range as
+a plain 206 and several as multipart/byteranges, streaming each slice from the file (seeking
+when the stream allows it, otherwise reading forward). offload_response() hands a file to the
+front-end server instead (X-Sendfile for Apache mod_xsendfile / lighttpd, X-Accel-Redirect
+for nginx), which then does the transfer, ranges included, with zero-copy sendfile().
+"""
+import os
+from urllib.parse import quote
+from uuid import uuid4
+
+from flask import Response, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+OFFLOAD_MODES = ("none", "x-sendfile", "x-accel-redirect")
+# More ranges than this (or ranges that would cost more than the whole file) are answered with the full file
+MAX_RANGES = 32
+
+
+def requested_ranges(size, etag=None, last_modified=None, max_ranges=MAX_RANGES):
+    """
+    Returns the byte ranges of a Range request as sorted, merged (start, stop) pairs, or None
+    if the whole file should be sent: no or unparseable Range header, an If-Range that no
+    longer matches, or too many ranges. Raises RequestedRangeNotSatisfiable if no range overlaps
+    the file.
+    """
+    byte_range = request.range
+    if byte_range is None or byte_range.units != "bytes":
+        return None
+    if_range = request.if_range
+    raw_if_range = request.headers.get("If-Range", "").strip()
+    # Werkzeug drops the W/ of a weak entity-tag (or yields neither etag nor date for it, depending
+    # on the version); a weak or unparseable validator never allows a partial response
+    if raw_if_range and (raw_if_range.startswith("W/") or (if_range.etag is None and if_range.date is None)):
+        return None
+    if if_range.etag is not None and (etag is None or if_range.etag != etag):
+        return None # Changed since the client's partial copy (If-Range requires a strong match)
+    if if_range.date is not None and (last_modified is None or int(_timestamp(last_modified)) > if_range.date.timestamp()):
+        return None
+    if len(byte_range.ranges) > max_ranges:
+        return None
+
+    ranges = []
+    for start, stop in byte_range.ranges:
+        if start < 0: # Suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    if not ranges:
+        raise RequestedRangeNotSatisfiable(length=size)
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, stop in ranges[1:]:
+        if start <= merged[-1][1]: # Overlapping or adjacent: one part instead of two
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    if sum(stop - start for start, stop in merged) >= size:
+        return None # Cheaper to send the file once
+    return merged
+
+
+def _timestamp(value):
+    return value if isinstance(value, (int, float)) else value.timestamp()
+
+
+def range_response(opener, size, ranges, mimetype, chunk_size=1024 * 1024):
+    """
+    206 response for ``ranges`` (from requested_ranges()) of a ``size``-byte file; ``opener()``
+    returns a binary stream of it. Validators and Content-Disposition are left to the caller.
+    """
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(_read_ranges(opener, ranges, chunk_size), status=206, mimetype=mimetype)
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        response.content_length = stop - start
+    else:
+        boundary = uuid4().hex
+        part_headers = [
+            (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+             f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode("latin-1")
+            for start, stop in ranges
+        ]
+        trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+        def generate():
+            slices = _read_ranges(opener, ranges, chunk_size, separate=True)
+            for i, header in enumerate(part_headers):
+                yield (b"\r\n" if i else b"") + header
+                for chunk in next(slices):
+                    yield chunk
+            yield trailer
+
+        response = Response(generate(), status=206, mimetype=f"multipart/byteranges; boundary={boundary}")
+        response.content_length = (
+            sum(len(h) for h in part_headers) + 2 * (len(ranges) - 1)
+            + sum(stop - start for start, stop in ranges) + len(trailer)
+        )
+    response.accept_ranges = "bytes"
+    return response
+
+
+def _read_ranges(opener, ranges, chunk_size, separate=False):
+    """
+    Yields the bytes of each (sorted) range; with ``separate`` yields one generator per range.
+    Seekable streams jump to each range; others (decompressing readers) are read forward.
+    """
+    def one_range(src, state, start, stop):
+        if state["pos"] != start:
+            if _seekable(src):
+                src.seek(start)
+            else:
+                while state["pos"] < start:
+                    skipped = src.read(min(chunk_size, start - state["pos"]))
+                    if not skipped:
+                        raise OSError("File is shorter than expected.")
+                    state["pos"] += len(skipped)
+            state["pos"] = start
+        while state["pos"] < stop:
+            chunk = src.read(min(chunk_size, stop - state["pos"]))
+            if not chunk:
+                raise OSError("File is shorter than expected.")
+            state["pos"] += len(chunk)
+            yield chunk
+
+    def generate():
+        with opener() as src:
+            state = {"pos": 0}
+            for start, stop in ranges:
+                if separate:
+                    part = one_range(src, state, start, stop)
+                    yield part
+                    for _ in part: # Make sure the part was consumed before moving on
+                        pass
+                else:
+                    yield from one_range(src, state, start, stop)
+
+    return generate()
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def offload_response(path, mode, root=None, accel_prefix="/_uploads/", mimetype="application/octet-stream"):
+    """
+    Empty response telling the front-end server to send ``path`` itself. 'x-sendfile' passes
+    the absolute path; 'x-accel-redirect' passes ``accel_prefix`` + the path relative to
+    ``root``, which nginx must map to ``root`` in an `internal` location.
+    """
+    response = Response(mimetype=mimetype)
+    if mode == "x-sendfile":
+        response.headers["X-Sendfile"] = os.fspath(path)
+    elif mode == "x-accel-redirect":
+        relative = os.path.relpath(os.fspath(path), os.fspath(root)).replace(os.sep, "/")
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(relative)
+    else:
+        raise ValueError(f"Unknown download offload mode '{mode}'.")
+    response.content_length = None
+    return response
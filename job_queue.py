@@ -0,0 +1,298 @@
+"""
+Database-backed job queue with a bounded process pool runner.
+
+Jobs are rows in the `jobs` table (migrations/005_jobs.sql). Request handlers only insert a
+row and return; a JobRunner (a daemon thread in the web process, or `flask --app app2 jobs-worker`
+as a separate process) claims queued rows, runs the CPU-heavy part in a ProcessPoolExecutor
+and writes the outcome back. Claiming is an atomic `UPDATE ... WHERE status = 'queued'`, so any
+number of runners in any number of processes can share one queue.
+
+Each job kind has a JobHandler:
+    prepare(cur, job)         -> (function, args) to run in a worker process (picklable)
+    apply(cur, job, result)   -> writes the result back, in the transaction that finishes the job
+    cleanup(job)              -> optional; runs once the job has succeeded or failed for good
+    retry                     -> if true, a failed job goes back to the queue until it has been
+                                 attempted max_attempts times (JobError still fails it at once)
+"""
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+JOB_COLUMNS = ("id", "kind", "model_id", "status", "payload", "result", "error", "attempts",
+               "worker", "created_at", "started_at", "finished_at")
+
+JobHandler = namedtuple("JobHandler", "prepare apply cleanup retry", defaults=(None, False))
+
+
+class JobError(Exception):
+    """ A job can't be run (bad payload, missing model file, ...); it fails without retrying. """
+
+
+def job_from_row(row):
+    """ Turns a SELECT of JOB_COLUMNS into a dict with payload/result decoded from JSON. """
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ("payload", "result"):
+        if job[key]:
+            job[key] = json.loads(job[key])
+    return job
+
+
+class JobQueue:
+    """ Inserts, claims and finishes rows of the jobs table. """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def enqueue(self, cur, kind, model_id=None, payload=None):
+        """ Adds a job in the caller's transaction (so it is only visible once the caller commits). Returns its id. """
+        cur.execute(
+            "INSERT INTO jobs (kind, model_id, status, payload) VALUES (?, ?, 'queued', ?)",
+            (kind, model_id, json.dumps(payload) if payload is not None else None)
+        )
+        return cur.lastrowid
+
+    def get(self, cur, job_id):
+        cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        row = cur.fetchone()
+        return job_from_row(row) if row else None
+
+    def find_active(self, cur, kind, model_id):
+        """ The queued or running job of this kind for a model, if any (to avoid duplicate work). """
+        cur.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+            " WHERE kind = ? AND model_id = ? AND status IN ('queued', 'running') ORDER BY id LIMIT 1",
+            (kind, model_id)
+        )
+        row = cur.fetchone()
+        return job_from_row(row) if row else None
+
+    def claim(self, worker, kinds):
+        """ Atomically marks the oldest queued job of the given kinds as running for ``worker``; None if there is none. """
+        placeholders = ", ".join("?" * len(kinds))
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                for _ in range(5): # Another runner may claim the row we picked first; try the next one
+                    cur.execute(
+                        f"SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) ORDER BY id LIMIT 1",
+                        tuple(kinds)
+                    )
+                    row = cur.fetchone()
+                    if not row:
+                        conn.rollback()
+                        return None
+                    cur.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,"
+                        " started_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+                        (worker, row[0])
+                    )
+                    claimed = cur.rowcount == 1
+                    conn.commit()
+                    if claimed:
+                        return self.get(cur, row[0])
+                return None
+            finally:
+                cur.close()
+
+    def finish(self, job, result=None, error=None, apply=None, on_commit=None, retry=False, cleanup=None):
+        """
+        Records a job's outcome. On success ``apply(cur, job, result)`` runs in the same transaction,
+        so the write-back and the 'succeeded' status are committed together; if it raises, the job
+        has failed instead. A failed job is queued again if ``retry`` is true (keeping the error of
+        this attempt), and marked failed otherwise. ``cleanup(job)`` runs after the commit once the
+        job is final, succeeded or failed. Returns the job's new status.
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                if error is None and apply is not None:
+                    try:
+                        apply(cur, job, result)
+                    except Exception as e:
+                        conn.rollback()
+                        logger.error("Writing back result of job %s failed: %s", job["id"], e, exc_info=True)
+                        error = f"Could not store result: {e}"
+                if error and retry:
+                    status = "queued"
+                    cur.execute(
+                        "UPDATE jobs SET status = 'queued', worker = NULL, error = ? WHERE id = ?",
+                        (str(error)[:1024], job["id"])
+                    )
+                else:
+                    status = "failed" if error else "succeeded"
+                    cur.execute(
+                        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        (status,
+                         json.dumps(result) if result is not None and not error else None,
+                         str(error)[:1024] if error else None,
+                         job["id"])
+                    )
+                conn.commit()
+            finally:
+                cur.close()
+        if status == "queued":
+            logger.warning("Job %s failed on attempt %s and was queued again: %s", job["id"], job["attempts"], error)
+        elif cleanup is not None:
+            cleanup(job)
+        if on_commit is not None and status == "succeeded":
+            on_commit()
+        return status
+
+    def requeue_stale(self, older_than, max_attempts, on_failed=None):
+        """
+        Puts 'running' jobs whose runner died (started more than ``older_than`` seconds ago) back in
+        the queue, or fails them after ``max_attempts``; ``on_failed(job)`` is called for each job
+        failed here, after the commit. Returns the number of jobs touched.
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(
+                    f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+                    " WHERE status = 'running' AND started_at < CURRENT_TIMESTAMP - INTERVAL ? SECOND AND attempts >= ?"
+                    " FOR UPDATE",
+                    (int(older_than), max_attempts)
+                )
+                failed = [job_from_row(row) for row in cur.fetchall()]
+                for job in failed:
+                    cur.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Runner stopped while the job was running.',"
+                        " finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+                        (job["id"],)
+                    )
+                touched = len(failed)
+                cur.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL"
+                    " WHERE status = 'running' AND started_at < CURRENT_TIMESTAMP - INTERVAL ? SECOND",
+                    (int(older_than),)
+                )
+                touched += cur.rowcount
+                conn.commit()
+            finally:
+                cur.close()
+        if on_failed is not None:
+            for job in failed:
+                on_failed(job)
+        return touched
+
+
+class JobRunner:
+    """
+    Claims jobs and runs them in a bounded process pool. At most ``max_workers`` jobs run at a
+    time; everything else stays queued in the database. Worker processes are started with the
+    'spawn' method so they never inherit the web process's threads or DB connections.
+    """
+
+    def __init__(self, queue, handlers, max_workers=2, poll_interval=2.0, stale_after=3600,
+                 max_attempts=3, on_commit=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.on_commit = on_commit
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def start(self):
+        """ Starts the dispatcher thread (once per process). """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run_forever, name="job-runner", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """ Tells the dispatcher a job was just queued, so it doesn't wait for the next poll. """
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_forever(self):
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        running = {} # future -> job
+        last_stale_check = 0.0
+        logger.info("Job runner %s started with %d worker process(es)", self.worker_name, self.max_workers)
+        try:
+            while not self._stop.is_set():
+                try:
+                    if time.monotonic() - last_stale_check > 60:
+                        last_stale_check = time.monotonic()
+                        if self.queue.requeue_stale(self.stale_after, self.max_attempts, self._cleanup):
+                            logger.warning("Requeued or failed stale running jobs")
+                    while len(running) < self.max_workers:
+                        job = self.queue.claim(self.worker_name, list(self.handlers))
+                        if job is None:
+                            break
+                        future = self._submit(executor, job)
+                        if future is not None:
+                            running[future] = job
+                except Exception as e: # DB down etc.: keep the runner alive and retry on the next poll
+                    logger.error("Job runner error: %s", e, exc_info=True)
+
+                if running:
+                    done, _ = wait(list(running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._complete(running.pop(future), future)
+                else:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, executor, job):
+        handler = self.handlers[job["kind"]]
+        try:
+            with self.queue.pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    function, args = handler.prepare(cur, job)
+                finally:
+                    cur.close()
+            return executor.submit(function, *args)
+        except Exception as e:
+            logger.warning("Job %s (%s) could not be started: %s", job["id"], job["kind"], e)
+            self.queue.finish(job, error=str(e), retry=self._may_retry(job, e), cleanup=handler.cleanup)
+            return None
+
+    def _complete(self, job, future):
+        handler = self.handlers[job["kind"]]
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning("Job %s (%s) failed: %s", job["id"], job["kind"], e)
+            self.queue.finish(job, error=f"{type(e).__name__}: {e}", retry=self._may_retry(job, e),
+                              cleanup=handler.cleanup)
+            return
+        status = self.queue.finish(job, result=result, apply=handler.apply, on_commit=self.on_commit,
+                                   retry=self._may_retry(job), cleanup=handler.cleanup)
+        logger.info("Job %s (%s) finished: %s", job["id"], job["kind"], status)
+
+    def _may_retry(self, job, error=None):
+        """ Whether a failure of this attempt should queue the job again. """
+        return (self.handlers[job["kind"]].retry and not isinstance(error, JobError)
+                and job["attempts"] < self.max_attempts)
+
+    def _cleanup(self, job):
+        handler = self.handlers.get(job["kind"])
+        if handler is not None and handler.cleanup is not None:
+            handler.cleanup(job)
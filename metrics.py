@@ -0,0 +1,122 @@
+"""
+In-process metrics with a Prometheus text endpoint (GET /metrics in app2.py).
+
+Counters and histograms live in plain dicts behind one lock; values that other components
+already count (connection pool, query cache) are read by collectors at scrape time instead of
+being counted twice. When metrics are disabled nothing is timed: the request hooks return
+immediately and no statement observer is registered, so the only cost left is one attribute
+check per request.
+
+Metrics are per process. Under a multi-worker server (mod_wsgi, gunicorn) each worker exposes
+its own numbers; scrape them individually or sum them in Prometheus.
+"""
+import threading
+from bisect import bisect_left
+
+# Latency buckets in seconds (the Prometheus client defaults)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    """
+    Registry of counters and histograms keyed by name and a tuple of (label, value) pairs.
+    Collectors are functions returning (name, kind, help, labels, value) samples at scrape time.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {} # name -> (kind, help)
+        self._counters = {}
+        self._histograms = {} # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, labels=(), amount=1):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        if not self.enabled:
+            return
+        key = (name, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """ The Prometheus text exposition format (version 0.0.4) of every metric. """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        samples = {} # name -> list of (suffix, labels, value)
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(("", labels, value))
+        for (name, labels), values in histograms.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                samples.setdefault(name, []).append(("_bucket", labels + (("le", le),), cumulative))
+            samples[name].append(("_sum", labels, values[-1]))
+            samples[name].append(("_count", labels, cumulative))
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                self._meta.setdefault(name, (kind, help_text))
+                samples.setdefault(name, []).append(("", labels, value))
+
+        lines = []
+        for name in sorted(samples):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples[name]:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# --- Database timing ---
+def statement_observer(metrics):
+    """ Statement listener (see query_log.traced_connect) recording query timings and row counts. """
+    def observe(statement):
+        labels = (("statement", statement["label"]),)
+        metrics.observe("db_query_duration_seconds", statement["execute_seconds"], labels)
+        if statement["rows"]:
+            metrics.observe("db_fetch_duration_seconds", statement["fetch_seconds"], labels)
+            metrics.inc("db_rows_fetched_total", labels, statement["rows"])
+        if statement["convert_seconds"]:
+            metrics.observe("db_convert_duration_seconds", statement["convert_seconds"], labels)
+    return observe
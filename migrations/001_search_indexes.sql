@@ -0,0 +1,20 @@
+-- Indexes backing the multi-field model search (model_search.py).
+--
+-- One FULLTEXT index per searchable field so each field can be matched on its own
+-- (MATCH() must name exactly the columns of a FULLTEXT index), plus one covering all
+-- stored file names/paths. The B-tree prefix indexes serve exact-value and `col LIKE 'term%'`
+-- lookups of these columns. Search words shorter than innodb_ft_min_token_size are matched
+-- as substrings (`LIKE '%w%'`), which no index can serve; see model_search.py.
+
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_growth_media ON gapfill_models (growth_media);
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_gapfill_algorithm ON gapfill_models (gapfill_algorithm);
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_annotation_tool ON gapfill_models (annotation_tool);
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_growth_data ON gapfill_models (growth_data);
+CREATE FULLTEXT INDEX IF NOT EXISTS ft_file_names
+    ON gapfill_models (file_name, growth_file, biomass_file_5mM, biomass_file_20mM);
+
+CREATE INDEX IF NOT EXISTS ix_growth_media_prefix ON gapfill_models (growth_media(64));
+CREATE INDEX IF NOT EXISTS ix_gapfill_algorithm_prefix ON gapfill_models (gapfill_algorithm(64));
+CREATE INDEX IF NOT EXISTS ix_annotation_tool_prefix ON gapfill_models (annotation_tool(64));
+CREATE INDEX IF NOT EXISTS ix_growth_data_prefix ON gapfill_models (growth_data(64));
+CREATE INDEX IF NOT EXISTS ix_file_name_prefix ON gapfill_models (file_name(64));
@@ -0,0 +1,22 @@
+-- Validators for conditional GETs (ETag / If-None-Match).
+--
+-- upload_files records the SHA-256 of legacy uploads (blob-store links carry theirs in the
+-- path, see 008_upload_file_mtime.sql), so /download can answer If-None-Match without reading
+-- the file. catalogue_state holds a single change counter that every catalogue write bumps in
+-- the same transaction; together with MAX(id) and COUNT(*) it forms the ETag of the catalogue
+-- listings.
+
+CREATE TABLE IF NOT EXISTS upload_files (
+    rel_path VARCHAR(512) NOT NULL PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY ix_upload_files_sha256 (sha256)
+);
+
+CREATE TABLE IF NOT EXISTS catalogue_state (
+    id TINYINT NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT IGNORE INTO catalogue_state (id, version) VALUES (1, 0);
@@ -0,0 +1,29 @@
+-- SBML metadata extracted from each uploaded model (see sbml_metadata.py).
+--
+-- One row per gapfill_models row whose main file is SBML, written in the same transaction
+-- as the upload; `flask --app app2 sbml-backfill` fills it in for models uploaded earlier.
+-- The count columns are indexed together with model_id so that filtering and sorting by
+-- model size in /api/models/sbml, including its keyset pagination, stay index-driven.
+
+CREATE TABLE IF NOT EXISTS model_sbml_meta (
+    model_id INT NOT NULL PRIMARY KEY,
+    sbml_model_id VARCHAR(255) NULL,
+    model_name VARCHAR(255) NULL,
+    sbml_level TINYINT NULL,
+    sbml_version TINYINT NULL,
+    reaction_count INT NOT NULL DEFAULT 0,
+    metabolite_count INT NOT NULL DEFAULT 0,
+    gene_count INT NOT NULL DEFAULT 0,
+    compartment_count INT NOT NULL DEFAULT 0,
+    compartments VARCHAR(1024) NULL,
+    objective VARCHAR(1024) NULL,
+    objective_sense VARCHAR(16) NULL,
+    parse_error VARCHAR(512) NULL,
+    extracted_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_sbml_meta_reactions ON model_sbml_meta (reaction_count, model_id);
+CREATE INDEX IF NOT EXISTS ix_sbml_meta_metabolites ON model_sbml_meta (metabolite_count, model_id);
+CREATE INDEX IF NOT EXISTS ix_sbml_meta_genes ON model_sbml_meta (gene_count, model_id);
+CREATE INDEX IF NOT EXISTS ix_sbml_meta_compartments ON model_sbml_meta (compartment_count, model_id);
+CREATE INDEX IF NOT EXISTS ix_sbml_meta_sbml_model_id ON model_sbml_meta (sbml_model_id);
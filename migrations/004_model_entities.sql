@@ -0,0 +1,16 @@
+-- Inverted index from reaction / metabolite / gene ids to the models that contain them.
+--
+-- Filled from the same streaming SBML parse as model_sbml_meta (sbml_metadata.py), in the
+-- upload's transaction; `flask --app app2 sbml-backfill --all` indexes existing models.
+-- Ids are stored without their conventional R_/M_/G_ prefix. The primary key answers
+-- "which models contain X" as a single index range scan; ix_model_entities_model serves
+-- re-indexing and the per-model listing.
+
+CREATE TABLE IF NOT EXISTS model_entities (
+    entity_type VARCHAR(16) NOT NULL,
+    entity_id VARCHAR(255) NOT NULL,
+    model_id INT NOT NULL,
+    PRIMARY KEY (entity_type, entity_id, model_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_model_entities_model ON model_entities (model_id, entity_type);
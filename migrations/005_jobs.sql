@@ -0,0 +1,24 @@
+-- Background job queue (job_queue.py), first used for FBA growth predictions.
+--
+-- Request handlers insert 'queued' rows; job runners claim them with an atomic
+-- UPDATE ... WHERE status = 'queued', run them in a process pool and store the result.
+-- ix_jobs_status_id serves the runners' "oldest queued job" lookup; ix_jobs_model
+-- finds a model's jobs for the status endpoints.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(32) NOT NULL,
+    model_id INT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    payload TEXT NULL,
+    result MEDIUMTEXT NULL,
+    error VARCHAR(1024) NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    worker VARCHAR(255) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_status_id ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_model ON jobs (model_id, kind, id);
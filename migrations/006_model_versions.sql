@@ -0,0 +1,37 @@
+-- Model versions: lineage of successive uploads of the same model, and cached structural diffs
+-- (see model_versions.py).
+--
+-- A model uploaded with parent_id gets a model_versions row; its lineage is that of the parent
+-- (the lineage id is the id of the first version) and version_number counts up within the
+-- lineage. Parents uploaded before versioning get their row (version 1) when their first child
+-- arrives. sha256 is the digest of the version's main file at upload.
+--
+-- model_diffs is keyed by the two file digests, so a diff is computed once per pair of
+-- contents no matter how many rows share them; the counts are kept as columns for listings,
+-- the full diff as JSON.
+
+CREATE TABLE IF NOT EXISTS model_versions (
+    model_id INT NOT NULL PRIMARY KEY,
+    parent_id INT NULL,
+    lineage_id INT NOT NULL,
+    version_number INT NOT NULL,
+    sha256 CHAR(64) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_model_versions_lineage ON model_versions (lineage_id, version_number);
+CREATE INDEX IF NOT EXISTS ix_model_versions_parent ON model_versions (parent_id);
+
+CREATE TABLE IF NOT EXISTS model_diffs (
+    from_sha256 CHAR(64) NOT NULL,
+    to_sha256 CHAR(64) NOT NULL,
+    reactions_added INT NOT NULL DEFAULT 0,
+    reactions_removed INT NOT NULL DEFAULT 0,
+    metabolites_added INT NOT NULL DEFAULT 0,
+    metabolites_removed INT NOT NULL DEFAULT 0,
+    bounds_changed INT NOT NULL DEFAULT 0,
+    stoichiometry_changed INT NOT NULL DEFAULT 0,
+    diff MEDIUMTEXT NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (from_sha256, to_sha256)
+);
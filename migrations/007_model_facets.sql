@@ -0,0 +1,17 @@
+-- Facet counts for GET /api/facets (model_facets.py).
+--
+-- One row per distinct combination of growth_media, gapfill_algorithm, annotation_tool and
+-- growth_data with the number of models that have it, so facet counts are computed from the
+-- combinations (their number is bounded by the distinct values) and never scan gapfill_models.
+-- Catalogue writes adjust the counts in their own transaction; NULL is stored as ''. The key
+-- is the SHA-256 of the four values because an index over the four full columns would exceed
+-- InnoDB's key length limit. `flask --app app2 facets-rebuild` recounts from scratch.
+
+CREATE TABLE IF NOT EXISTS model_facet_counts (
+    combo_sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    growth_media VARCHAR(255) NOT NULL DEFAULT '',
+    gapfill_algorithm VARCHAR(255) NOT NULL DEFAULT '',
+    annotation_tool VARCHAR(255) NOT NULL DEFAULT '',
+    growth_data VARCHAR(255) NOT NULL DEFAULT '',
+    model_count INT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,8 @@
+-- Digests of legacy uploads (paths outside the blob store) in upload_files.
+--
+-- Blob-store links carry their digest in the path; legacy files are hashed once, on first use
+-- or by `flask --app app2 uploads-digests`, and recorded here. mtime_ns and size_bytes identify
+-- the file contents the digest was taken from: a file replaced on disk no longer matches its
+-- row and is hashed again.
+
+ALTER TABLE upload_files ADD COLUMN IF NOT EXISTS mtime_ns BIGINT NULL;
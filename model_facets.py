@@ -0,0 +1,109 @@
+"""
+Facet counts for the catalogue (GET /api/facets): how many models there are per growth_media,
+gapfill_algorithm, annotation_tool and growth_data value, optionally restricted to models with
+given values ("how many CarveMe models grew on M9").
+
+The counts live in model_facet_counts (migrations/007_model_facets.sql), one row per distinct
+combination of the four values. Every catalogue write adjusts them in its own transaction, after
+bump_catalogue_version(), so answering a facet query reads the combinations only; the work is
+proportional to the number of distinct combinations, not to the number of models. rebuild_facets()
+recounts everything from gapfill_models.
+
+Values are compared exactly (NULL and '' are the same value), both when counting and when
+filtering.
+"""
+import hashlib
+from collections import Counter
+
+FACET_COLUMNS = ("growth_media", "gapfill_algorithm", "annotation_tool", "growth_data")
+
+_UPSERT_SQL = (
+    f"INSERT INTO model_facet_counts (combo_sha256, {', '.join(FACET_COLUMNS)}, model_count)"
+    f" VALUES (?, {', '.join('?' * len(FACET_COLUMNS))}, ?)"
+    " ON DUPLICATE KEY UPDATE model_count = model_count + VALUES(model_count)"
+)
+
+
+def facet_values(row):
+    """ The facet combination of a gapfill_models row dict (None -> ''). """
+    return tuple(row.get(column) or "" for column in FACET_COLUMNS)
+
+
+def combo_key(values):
+    return hashlib.sha256("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def _write_counts(cur, counts):
+    changes = [(combo_key(values), *values, delta) for values, delta in counts.items() if delta]
+    if not changes:
+        return
+    cur.executemany(_UPSERT_SQL, changes)
+    if any(change[-1] < 0 for change in changes):
+        cur.execute("DELETE FROM model_facet_counts WHERE model_count <= 0")
+
+
+def count_new_models(cur, rows):
+    """ Counts newly inserted gapfill_models rows (dicts, e.g. from build_model_meta); call in the inserting transaction. """
+    _write_counts(cur, Counter(facet_values(row) for row in rows))
+
+
+def recount_model(cur, old_row, new_row):
+    """ Moves one model's count from its old facet values to its new ones (e.g. after growth_data changed). """
+    old, new = facet_values(old_row), facet_values(new_row)
+    if old != new:
+        _write_counts(cur, {old: -1, new: 1})
+
+
+def rebuild_facets(cur, fetch_size=5000):
+    """
+    Recounts model_facet_counts from gapfill_models in the caller's transaction; call it after
+    bump_catalogue_version(), whose row lock holds back concurrent writers until the commit.
+    Counted in Python, with the same exact comparison as the incremental updates (a GROUP BY would
+    merge values that only differ in case under MariaDB's default collation). Returns
+    (models, combinations).
+    """
+    cur.execute(f"SELECT {', '.join(FACET_COLUMNS)} FROM gapfill_models")
+    counts = Counter()
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            break
+        counts.update(tuple(value or "" for value in row) for row in rows)
+    cur.execute("DELETE FROM model_facet_counts")
+    _write_counts(cur, counts)
+    return sum(counts.values()), len(counts)
+
+
+def load_facet_combinations(cur):
+    """ Every (values tuple, model_count) row of model_facet_counts. """
+    cur.execute(f"SELECT {', '.join(FACET_COLUMNS)}, model_count FROM model_facet_counts WHERE model_count > 0")
+    return [(tuple(row[:-1]), row[-1]) for row in cur.fetchall()]
+
+
+def summarize_facets(combinations, filters=None, limit=None):
+    """
+    Facet counts over the combinations matching ``filters`` ({column: exact value}). Each facet is
+    counted with the filters on the other facets only, so a filtered facet still lists its
+    alternatives. Returns {"total", "facets": {column: [{"value", "count"}, ...]}}, largest first;
+    '' is reported as None.
+    """
+    filters = {column: value for column, value in (filters or {}).items() if column in FACET_COLUMNS}
+    positions = {column: i for i, column in enumerate(FACET_COLUMNS)}
+    total = 0
+    counts = {column: Counter() for column in FACET_COLUMNS}
+    for values, count in combinations:
+        mismatched = [column for column, value in filters.items() if values[positions[column]] != value]
+        if not mismatched:
+            total += count
+            for i, column in enumerate(FACET_COLUMNS):
+                counts[column][values[i]] += count
+        elif len(mismatched) == 1: # Counts toward the alternatives of the one facet it misses
+            column = mismatched[0]
+            counts[column][values[positions[column]]] += count
+    return {
+        "total": total,
+        "facets": {
+            column: [{"value": value or None, "count": count} for value, count in counter.most_common(limit)]
+            for column, counter in counts.items()
+        },
+    }
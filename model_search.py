@@ -0,0 +1,118 @@
+"""
+Multi-field model search for gapfill_models.
+
+Builds a parameterised WHERE clause from per-field search terms combined with AND/OR.
+The default "fulltext" backend uses the FULLTEXT indexes created by
+migrations/001_search_indexes.sql, so lookups of ordinary words stay index-driven as the
+table grows. Words shorter than the index's minimum token size ('M9', 'LB') are still matched
+as substrings with LIKE '%w%'; a term made only of such words scans the table, like the
+"like" backend does. (MariaDB has no ngram parser, and innodb_ft_min_token_size is a server
+setting that a migration can't change.)
+The "like" backend is the original `LIKE '%term%'` behaviour (full table scan); it is
+kept for databases that have not been migrated yet and as the benchmark baseline.
+"""
+import re
+
+# Search field -> columns it matches. The column tuples must match a FULLTEXT index exactly.
+SEARCH_FIELDS = {
+    "growth_media":      ("growth_media",),
+    "gapfill_algorithm": ("gapfill_algorithm",),
+    "annotation_tool":   ("annotation_tool",),
+    "growth_data":       ("growth_data",),
+    "file_name":         ("file_name", "growth_file", "biomass_file_5mM", "biomass_file_20mM"),
+}
+SEARCH_MODES = ("and", "or")
+SEARCH_BACKENDS = ("fulltext", "like")
+
+# InnoDB does not index words shorter than innodb_ft_min_token_size (default 3)
+FT_MIN_TOKEN_SIZE = 3
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def parse_search_args(values):
+    """
+    Reads search filters from a request values/args dict.
+    Returns ({field: term}, mode); raises ValueError for an invalid mode.
+    The legacy 'media_search' form field is accepted as an alias for growth_media.
+    """
+    filters = {}
+    for field in SEARCH_FIELDS:
+        term = (values.get(field) or "").strip()
+        if term:
+            if not _WORD_RE.search(term):
+                raise ValueError(f"Search term '{term}' for {field.replace('_', ' ')} has no letters or digits.")
+            filters[field] = term
+    legacy_term = (values.get("media_search") or "").strip()
+    if legacy_term and "growth_media" not in filters:
+        filters["growth_media"] = legacy_term
+    mode = (values.get("mode") or "and").strip().lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Invalid search mode '{mode}'. Use 'and' or 'or'.")
+    return filters, mode
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _any_column(columns, predicate):
+    """ ORs one predicate (containing a single '?') across several columns. """
+    if len(columns) == 1:
+        return f"{columns[0]} {predicate}"
+    return "(" + " OR ".join(f"{col} {predicate}" for col in columns) + ")"
+
+
+def _like_clause(columns, term):
+    pattern = f"%{_escape_like(term)}%"
+    return _any_column(columns, "LIKE ?"), [pattern] * len(columns)
+
+
+def _fulltext_clause(columns, term):
+    """
+    Turns a term into MATCH() AGAINST() in boolean mode, requiring every word as a prefix
+    (+word*). Words too short for the FULLTEXT index are matched as substrings ('%w%', any of
+    the columns): as residual filters on the MATCH candidates when there are indexed words,
+    otherwise on their own, which means a table scan.
+    """
+    words = _WORD_RE.findall(term)
+    if not words:
+        raise ValueError(f"Search term '{term}' has no letters or digits.")
+    long_words = [w for w in words if len(w) >= FT_MIN_TOKEN_SIZE]
+    short_words = [w for w in words if len(w) < FT_MIN_TOKEN_SIZE]
+
+    parts, params = [], []
+    if long_words:
+        parts.append(f"MATCH({', '.join(columns)}) AGAINST (? IN BOOLEAN MODE)")
+        params.append(" ".join(f"+{w}*" for w in long_words))
+    for word in short_words:
+        parts.append(_any_column(columns, "LIKE ?"))
+        params.extend([f"%{_escape_like(word)}%"] * len(columns))
+    clause = parts[0] if len(parts) == 1 else "(" + " AND ".join(parts) + ")"
+    return clause, params
+
+
+def build_search(filters, mode="and", backend="fulltext"):
+    """
+    Returns (where, params) for the given {field: term} filters, or (None, ()) if there are none.
+    Field clauses are joined with AND or OR according to ``mode``.
+    """
+    if backend not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend '{backend}'.")
+    clause_for = _fulltext_clause if backend == "fulltext" else _like_clause
+    clauses, params = [], []
+    for field, term in filters.items():
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f"Unknown search field '{field}'.")
+        clause, clause_params = clause_for(SEARCH_FIELDS[field], term)
+        clauses.append(clause)
+        params.extend(clause_params)
+    if not clauses:
+        return None, ()
+    joiner = " AND " if mode == "and" else " OR "
+    return joiner.join(f"({c})" for c in clauses), tuple(params)
+
+
+def describe_search(filters, mode="and"):
+    """ Human-readable summary of the filters for page headings, e.g. 'growth media: M9 AND ...'. """
+    joiner = " AND " if mode == "and" else " OR "
+    return joiner.join(f"{field.replace('_', ' ')}: {term}" for field, term in filters.items())
@@ -0,0 +1,126 @@
+"""
+Model versions: structural snapshots of SBML models and the diff between two of them.
+
+A snapshot is the part of a model that gap-filling changes: every reaction with its flux
+bounds and stoichiometry, the metabolite ids and the objective. It is extracted once per file
+content (streaming, with fba.read_fba_problem) and cached as gzipped JSON under the file's
+digest, so diffing two versions never re-parses SBML. Diffs between a model and its parent
+are computed at upload and stored in model_diffs (migrations/006_model_versions.sql); any
+other pair is computed from the cached snapshots on first request and stored too.
+"""
+import gzip
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from fba import read_fba_problem
+
+logger = logging.getLogger(__name__)
+
+# Counted in model_diffs and returned as the diff summary
+DIFF_COUNTS = ("reactions_added", "reactions_removed", "metabolites_added", "metabolites_removed",
+               "bounds_changed", "stoichiometry_changed")
+_BOUND_TOLERANCE = 1e-9
+
+
+def snapshot_from_sbml(source):
+    """ Reads the structural snapshot of an SBML document (path or binary file object). """
+    problem = read_fba_problem(source)
+    return {
+        "reactions": {r["id"]: [r["lb"], r["ub"], r["stoichiometry"]] for r in problem["reactions"]},
+        "metabolites": sorted(problem["species"]),
+        "objective": problem["objective"],
+        "sense": problem["sense"],
+    }
+
+
+def diff_snapshots(old, new):
+    """
+    Structural diff from ``old`` to ``new``: reactions and metabolites added or removed, reactions
+    whose bounds or stoichiometry changed, and objective changes. Lists are sorted.
+    """
+    old_reactions, new_reactions = old["reactions"], new["reactions"]
+    common = sorted(old_reactions.keys() & new_reactions.keys())
+    bounds_changed = []
+    stoichiometry_changed = []
+    for rid in common:
+        old_lb, old_ub, old_stoich = old_reactions[rid]
+        new_lb, new_ub, new_stoich = new_reactions[rid]
+        if not (_same_bound(old_lb, new_lb) and _same_bound(old_ub, new_ub)):
+            bounds_changed.append({"id": rid, "old": [old_lb, old_ub], "new": [new_lb, new_ub]})
+        if old_stoich != new_stoich:
+            stoichiometry_changed.append(rid)
+    old_metabolites, new_metabolites = set(old["metabolites"]), set(new["metabolites"])
+    diff = {
+        "reactions_added": sorted(new_reactions.keys() - old_reactions.keys()),
+        "reactions_removed": sorted(old_reactions.keys() - new_reactions.keys()),
+        "metabolites_added": sorted(new_metabolites - old_metabolites),
+        "metabolites_removed": sorted(old_metabolites - new_metabolites),
+        "bounds_changed": bounds_changed,
+        "stoichiometry_changed": stoichiometry_changed,
+        "objective_changed": None,
+    }
+    if old["objective"] != new["objective"] or old["sense"] != new["sense"]:
+        diff["objective_changed"] = {"old": old["objective"], "new": new["objective"],
+                                     "old_sense": old["sense"], "new_sense": new["sense"]}
+    diff["summary"] = {key: len(diff[key]) for key in DIFF_COUNTS}
+    return diff
+
+
+def _same_bound(a, b):
+    if a is None or b is None:
+        return a is b
+    return abs(a - b) <= _BOUND_TOLERANCE
+
+
+def reverse_diff(diff):
+    """ The diff from new to old, derived from the stored old -> new diff. """
+    reversed_diff = {
+        "reactions_added": diff["reactions_removed"],
+        "reactions_removed": diff["reactions_added"],
+        "metabolites_added": diff["metabolites_removed"],
+        "metabolites_removed": diff["metabolites_added"],
+        "bounds_changed": [{"id": b["id"], "old": b["new"], "new": b["old"]} for b in diff["bounds_changed"]],
+        "stoichiometry_changed": diff["stoichiometry_changed"],
+        "objective_changed": None,
+    }
+    change = diff.get("objective_changed")
+    if change:
+        reversed_diff["objective_changed"] = {"old": change["new"], "new": change["old"],
+                                              "old_sense": change["new_sense"], "new_sense": change["old_sense"]}
+    reversed_diff["summary"] = {key: len(reversed_diff[key]) for key in DIFF_COUNTS}
+    return reversed_diff
+
+
+class SnapshotCache:
+    """ Structural snapshots stored under ``root`` by the content digest of the SBML file. """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path_for(self, digest):
+        return self.root / digest[:2] / f"{digest}.json.gz"
+
+    def get(self, digest, opener):
+        """ Returns the snapshot for ``digest``, extracting it from ``opener()`` (a binary stream) if not cached. """
+        path = self.path_for(digest)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        with opener() as stream:
+            snapshot = snapshot_from_sbml(stream)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+            os.replace(tmp_name, path)
+        except BaseException:
+            try: os.unlink(tmp_name)
+            except OSError: pass
+            raise
+        return snapshot
@@ -0,0 +1,148 @@
+"""
+In-process read-through cache for catalogue query results.
+
+Entries are keyed by a query name plus its exact parameters and tagged with the
+generation counter that was current when they were loaded. A successful write bumps the
+generation, which makes every older entry a miss without having to find and delete it.
+Entries also expire after a TTL, which bounds staleness for writes made outside the app.
+
+With a shared backend (Redis, optional) the generation counter lives in Redis instead of
+in process memory, so an insert handled by one worker invalidates the caches of all of them.
+Cached values themselves always stay in process memory.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError: # Optional dependency, only needed for CACHE_REDIS_URL
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class LocalGeneration:
+    """ Generation counter for a single process. """
+
+    name = "local"
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._value
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class RedisGeneration:
+    """ Generation counter shared by every worker through a Redis key. """
+
+    name = "redis"
+
+    def __init__(self, url, key="gapfill:query_cache:generation"):
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL is set but the 'redis' package is not installed.")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._key = key
+
+    def get(self):
+        return int(self._client.get(self._key) or 0)
+
+    def bump(self):
+        return int(self._client.incr(self._key))
+
+
+class QueryCache:
+    """ Thread-safe LRU + TTL cache of query results, invalidated by a generation counter. """
+
+    def __init__(self, max_entries=256, ttl=60.0, generation=None, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.generation = generation or LocalGeneration()
+        self._entries = OrderedDict() # key -> (generation, expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "backend_errors": 0}
+
+    @staticmethod
+    def make_key(name, params):
+        """
+        Turns parameters into a cache key, independent of key order and of unset (None/empty)
+        parameters. Values are compared exactly: a file path, a LIKE pattern or a cursor that
+        differs only in case or spacing can select different rows, so it gets its own entry.
+        Callers normalise search terms themselves where that is safe (see parse_search_args).
+        """
+        params = {k: v for k, v in (params or {}).items() if v not in (None, "", {})}
+        return f"{name}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    def _current_generation(self):
+        try:
+            return self.generation.get()
+        except Exception as e:
+            # A shared backend that is down must not take the site down; treat it as a miss
+            with self._lock:
+                self._stats["backend_errors"] += 1
+            logger.warning("Query cache generation backend unavailable: %s", e)
+            return None
+
+    def get_or_load(self, name, params, loader):
+        """ Returns the cached value for (name, params), calling loader() and caching its result on a miss. """
+        if not self.enabled:
+            return loader()
+        key = self.make_key(name, params)
+        generation = self._current_generation()
+        now = time.monotonic()
+        if generation is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] == generation and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[2]
+        with self._lock:
+            self._stats["misses"] += 1
+
+        value = loader()
+        if generation is not None:
+            with self._lock:
+                self._entries[key] = (generation, now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self):
+        """ Bumps the generation so every cached entry is treated as stale. """
+        with self._lock:
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+        try:
+            self.generation.bump()
+        except Exception as e:
+            with self._lock:
+                self._stats["backend_errors"] += 1
+            logger.error("Could not bump shared query cache generation: %s", e)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+        snapshot.update({
+            "enabled": self.enabled,
+            "backend": self.generation.name,
+            "generation": self._current_generation(),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        })
+        return snapshot
@@ -0,0 +1,311 @@
+"""
+Statement tracing for pooled connections and a sampled slow-query log with EXPLAIN plans.
+
+traced_connect() wraps a connect function so every cursor it hands out records, per statement,
+the execute time, the time spent fetching rows, the number of rows fetched and (when the caller
+reports it, as dict_rows does) the time spent converting rows. A statement's record is finished
+when its cursor runs the next statement or is closed, or when the connection commits or rolls
+back (the pool rolls back on every release), and is passed to each listener.
+
+QueryLog is such a listener. Every statement over the threshold is counted per statement label;
+a sample of them (``sample_rate``, and at most ``max_per_minute``) is logged and kept in a ring
+buffer, and for SELECT/UPDATE/DELETE statements the EXPLAIN plan is fetched by a background
+thread on a separate connection, so requests never wait for it.
+"""
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+_PARAM_REPR_LIMIT = 200
+
+
+# --- Statement labels ---
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO)\s+`?(\w+)", re.IGNORECASE)
+_statement_labels = {}
+
+
+def statement_label(sql):
+    """ Low-cardinality label for a statement: its verb and first table, e.g. 'SELECT gapfill_models'. """
+    label = _statement_labels.get(sql)
+    if label is None:
+        words = sql.split(None, 2)
+        verb = words[0].upper() if words else "?"
+        if verb == "UPDATE" and len(words) > 1:
+            table = words[1].strip("`")
+        else:
+            match = _TABLE_RE.search(sql)
+            table = match.group(1) if match else ""
+        label = f"{verb} {table}".strip()
+        if len(_statement_labels) < 4096: # SQL built with a variable number of placeholders stays bounded
+            _statement_labels[sql] = label
+    return label
+
+
+# --- Tracing wrappers ---
+class TracedCursor:
+    """ Cursor proxy that times execute()/executemany() and the fetch calls of the current statement. """
+
+    def __init__(self, cursor, listeners):
+        self._cursor = cursor
+        self._listeners = listeners
+        self._statement = None
+
+    def _start(self, sql, params, run, *args, **kwargs):
+        self.finish_statement()
+        started = time.perf_counter()
+        statement = {"sql": sql, "params": params, "label": statement_label(sql), "started_at": time.time(),
+                     "execute_seconds": 0.0, "fetch_seconds": 0.0, "convert_seconds": 0.0, "rows": 0, "error": None}
+        try:
+            return run(sql, *args, **kwargs)
+        except Exception as e:
+            statement["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            statement["execute_seconds"] = time.perf_counter() - started
+            self._statement = statement
+            if statement["error"]:
+                self.finish_statement()
+
+    def execute(self, sql, *args, **kwargs):
+        return self._start(sql, args[0] if args else kwargs.get("data"), self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._start(sql, None, self._cursor.executemany, *args, **kwargs)
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        statement = self._statement
+        if statement is not None:
+            statement["fetch_seconds"] += time.perf_counter() - started
+            if isinstance(result, list):
+                statement["rows"] += len(result)
+            elif result is not None:
+                statement["rows"] += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def add_convert_time(self, seconds):
+        """ Called by row converters (dict_rows) to attribute their time to the current statement. """
+        if self._statement is not None:
+            self._statement["convert_seconds"] += seconds
+
+    def finish_statement(self):
+        statement, self._statement = self._statement, None
+        if statement is None:
+            return
+        statement["total_seconds"] = statement["execute_seconds"] + statement["fetch_seconds"] + statement["convert_seconds"]
+        for listener in self._listeners:
+            try:
+                listener(statement)
+            except Exception: # Tracing must never break a query
+                logger.exception("Statement listener failed.")
+
+    def close(self):
+        self.finish_statement()
+        return self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """ Connection proxy whose cursors are TracedCursors; everything else is passed through. """
+
+    def __init__(self, connection, listeners):
+        object.__setattr__(self, "_connection", connection)
+        object.__setattr__(self, "_listeners", listeners)
+        object.__setattr__(self, "_cursors", [])
+
+    def cursor(self, *args, **kwargs):
+        cursor = TracedCursor(self._connection.cursor(*args, **kwargs), self._listeners)
+        self._cursors.append(cursor)
+        return cursor
+
+    def _finish_cursors(self):
+        cursors = self._cursors[:]
+        del self._cursors[:]
+        for cursor in cursors:
+            cursor.finish_statement()
+
+    def commit(self):
+        self._finish_cursors()
+        return self._connection.commit()
+
+    def rollback(self):
+        self._finish_cursors()
+        return self._connection.rollback()
+
+    def close(self):
+        self._finish_cursors()
+        return self._connection.close()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value): # e.g. conn.autocommit = False
+        setattr(self._connection, name, value)
+
+
+def traced_connect(connect, listeners):
+    """ Wraps a connect function (e.g. mariadb.connect) so its connections pass every statement to ``listeners``. """
+    def wrapper(**kwargs):
+        return TracedConnection(connect(**kwargs), listeners)
+    return wrapper
+
+
+# --- Slow-query log ---
+class QueryLog:
+    """
+    Statement listener that collects statements slower than ``threshold_ms``. ``explain_connection``
+    is a context manager factory (e.g. ConnectionPool.connection) used by the EXPLAIN thread.
+    """
+
+    def __init__(self, threshold_ms=500, sample_rate=1.0, max_per_minute=30, max_entries=200,
+                 explain_connection=None):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.max_per_minute = max_per_minute
+        self.explain_connection = explain_connection
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_entries)
+        self._summary = {} # label -> {count, total_seconds, max_seconds}
+        self._stats = {"slow": 0, "sampled": 0, "skipped": 0, "explained": 0, "explain_errors": 0, "explain_dropped": 0}
+        self._window_start = 0.0
+        self._window_count = 0
+        self._explain_queue = queue.Queue(maxsize=max(max_per_minute, 1))
+        self._explain_thread = None
+
+    def __call__(self, statement):
+        total = statement["total_seconds"]
+        if total < self.threshold or statement["sql"].lstrip()[:7].upper() == "EXPLAIN":
+            return
+        label = statement["label"]
+        with self._lock:
+            self._stats["slow"] += 1
+            summary = self._summary.setdefault(label, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            summary["count"] += 1
+            summary["total_seconds"] += total
+            summary["max_seconds"] = max(summary["max_seconds"], total)
+            if not self._take_sample():
+                self._stats["skipped"] += 1
+                return
+            self._stats["sampled"] += 1
+            entry = {
+                "statement": label,
+                "sql": " ".join(statement["sql"].split()),
+                "params": _params_repr(statement["params"]),
+                "at": statement["started_at"],
+                "total_ms": round(total * 1000, 3),
+                "execute_ms": round(statement["execute_seconds"] * 1000, 3),
+                "fetch_ms": round(statement["fetch_seconds"] * 1000, 3),
+                "convert_ms": round(statement["convert_seconds"] * 1000, 3),
+                "rows": statement["rows"],
+                "error": statement["error"],
+                "explain": None,
+            }
+            self._entries.append(entry)
+        logger.warning("Slow query (%.1f ms: execute %.1f, fetch %.1f, convert %.1f; %d rows): %s",
+                       entry["total_ms"], entry["execute_ms"], entry["fetch_ms"], entry["convert_ms"],
+                       entry["rows"], entry["sql"])
+        if self.explain_connection is not None and label.split(" ", 1)[0] in EXPLAINABLE:
+            self._queue_explain(entry, statement["sql"], statement["params"])
+
+    def _take_sample(self):
+        """ Sampling decision; called with the lock held. """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._window_start, self._window_count = now, 0
+        if self._window_count >= self.max_per_minute:
+            return False
+        self._window_count += 1
+        return True
+
+    def _queue_explain(self, entry, sql, params):
+        try:
+            self._explain_queue.put_nowait((entry, sql, params))
+        except queue.Full:
+            with self._lock:
+                self._stats["explain_dropped"] += 1
+            return
+        if self._explain_thread is None or not self._explain_thread.is_alive():
+            with self._lock:
+                if self._explain_thread is None or not self._explain_thread.is_alive():
+                    self._explain_thread = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+                    self._explain_thread.start()
+
+    def _explain_loop(self):
+        while True:
+            entry, sql, params = self._explain_queue.get()
+            try:
+                with self.explain_connection() as conn:
+                    cur = conn.cursor()
+                    try:
+                        cur.execute("EXPLAIN " + sql, params or ())
+                        columns = [d[0] for d in cur.description or ()]
+                        plan = [dict(zip(columns, row)) for row in cur.fetchall()]
+                    finally:
+                        cur.close()
+                with self._lock:
+                    entry["explain"] = plan
+                    self._stats["explained"] += 1
+            except Exception as e:
+                with self._lock:
+                    entry["explain"] = {"error": str(e)}
+                    self._stats["explain_errors"] += 1
+                logger.warning("EXPLAIN failed for slow query %s: %s", entry["statement"], e)
+
+    def report(self, limit=None):
+        """ Counters, per-statement summary (slowest total first) and the most recent sampled entries. """
+        with self._lock:
+            entries = list(self._entries)
+            summary = [dict(statement=label, **values) for label, values in self._summary.items()]
+            stats = dict(self._stats)
+        summary.sort(key=lambda s: s["total_seconds"], reverse=True)
+        for s in summary:
+            s["avg_ms"] = round(1000 * s["total_seconds"] / s["count"], 3)
+            s["max_ms"] = round(1000 * s.pop("max_seconds"), 3)
+            s["total_ms"] = round(1000 * s.pop("total_seconds"), 3)
+        entries.reverse()
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "sample_rate": self.sample_rate,
+            "max_per_minute": self.max_per_minute,
+            "stats": stats,
+            "statements": summary,
+            "entries": entries[:limit] if limit else entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._summary.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+
+
+def _params_repr(params):
+    if params is None:
+        return None
+    text = repr(tuple(params) if isinstance(params, list) else params)
+    return text if len(text) <= _PARAM_REPR_LIMIT else text[:_PARAM_REPR_LIMIT] + "..."
@@ -0,0 +1,78 @@
+"""
+Compact "columns + rows" JSON for catalogue listings (?format=compact on /api/models,
+/api/search and /api/models/export).
+
+The default record format turns every cursor row into a dict and lets jsonify serialise it,
+repeating each column name once per row. The compact format keeps the cursor's row tuples as
+they are, sends the column names once and serialises with orjson when it is installed:
+
+    {"columns": ["id", "growth_media", ...], "rows": [[42, "M9", ...], ...], ...}
+
+Values are encoded like jsonify encodes them (dates as HTTP dates, Decimals as strings), so a
+client can zip columns and rows back into the records it would otherwise have received.
+benchmarks/bench_rows.py measures the CPU time, memory and response size of both formats.
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError: # Optional dependency; the stdlib encoder produces the same output, slower
+    orjson = None
+
+ROW_FORMATS = ("records", "compact")
+
+
+def _default(o):
+    """ Same conversions as Flask's default JSON provider. """
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(obj):
+    """ Compact JSON as bytes, with the standard library encoder. """
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """ Compact JSON as bytes. """
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+else:
+    dumps = dumps_stdlib
+
+
+def parse_row_format(args, default="records"):
+    """ Reads ?format= from request args; raises ValueError for an unknown format. """
+    fmt = (args.get("format") or default).strip().lower()
+    if fmt not in ROW_FORMATS:
+        raise ValueError(f"Invalid format '{fmt}'. Use one of: {', '.join(ROW_FORMATS)}.")
+    return fmt
+
+
+def cursor_columns(cur):
+    return [d[0] for d in cur.description] if cur.description else []
+
+
+def records(columns, rows):
+    """ Row tuples -> list of dicts (the record format). """
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def encode_rows(rows):
+    """ JSON array elements for a batch of row tuples, comma-joined (for streamed compact output). """
+    return dumps(rows)[1:-1]
@@ -0,0 +1,121 @@
+"""
+Pre-rendered HTML for the catalogue / search results table (templates/index.html).
+
+The template used to rebuild every row cell by cell, branching on the column name for each one.
+RowFragments renders a row's <tr> once and keeps it in an LRU keyed by the model id, the
+fragment schema version (FRAGMENT_VERSION plus the table's column list) and the row's values,
+so a changed row (e.g. new growth data from an FBA job) is simply a different key and never
+served stale. Header cells are computed once per column list.
+
+Fragments contain download URLs, so render() must run inside a request context (url_for).
+"""
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup, escape
+
+# Bump when the row markup below changes, so cached fragments of the old layout are not reused
+FRAGMENT_VERSION = 1
+
+HIDDEN_COLUMNS = ("file_name", "Biomass_RCH1")
+FILE_COLUMNS = ("file_link", "growth_file", "biomass_file_5mM", "biomass_file_20mM")
+HEADER_TITLES = {
+    "id": "Genome Model ID",
+    "growth_data": "Growth Result",
+    "file_link": "Model File",
+    "growth_file": "Growth File (TSV)",
+    "biomass_file_5mm": "Biomass 5mM (TSV)",
+    "biomass_file_20mm": "Biomass 20mM (TSV)",
+}
+
+_TH = '<th class="px-6 py-4 text-sm font-semibold text-gray-600 uppercase tracking-wide text-center whitespace-nowrap">'
+_TD = '<td class="px-6 py-4 whitespace-nowrap text-center">'
+_LINK = '<a href="{}" target="_blank" rel="noopener noreferrer" class="text-accent underline hover:text-accent-hover break-all">{}</a>'
+
+
+def header_title(column):
+    return HEADER_TITLES.get(column.lower()) or column.replace("_", " ").title()
+
+
+class RowFragments:
+    """ Thread-safe LRU of rendered table rows; ``link_for(path)`` returns a file's download URL. """
+
+    def __init__(self, link_for, max_entries=5000, enabled=True):
+        self.link_for = link_for
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict() # (id, schema, values) -> Markup
+        self._headers = {} # column tuple -> (visible columns, header Markup)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def layout(self, columns):
+        """ (visible columns, <th> cells) for a result set with the given column names. """
+        columns = tuple(columns)
+        layout = self._headers.get(columns)
+        if layout is None:
+            visible = tuple(c for c in columns if c not in HIDDEN_COLUMNS)
+            header = Markup("".join(f"{_TH}{escape(header_title(c))}</th>" for c in visible))
+            layout = self._headers[columns] = (visible, header)
+        return layout
+
+    def render_row(self, row, visible):
+        cells = []
+        for key in visible:
+            val = row[key]
+            if key in FILE_COLUMNS:
+                if val:
+                    name = row.get("file_name") if key == "file_link" else None
+                    text = name or val.rsplit("/", 1)[-1]
+                    cells.append(_LINK.format(escape(self.link_for(val)), escape(text)))
+                else:
+                    cells.append("N/A")
+            else:
+                cells.append("N/A" if val is None else str(escape(val)))
+        return Markup("<tr>" + "".join(f"{_TD}{cell}</td>" for cell in cells) + "</tr>")
+
+    def render(self, rows):
+        """ Returns (header cells, list of <tr> fragments) for a page of gapfill_models rows. """
+        if not rows:
+            return Markup(""), []
+        columns = tuple(rows[0].keys())
+        visible, header = self.layout(columns)
+        schema = (FRAGMENT_VERSION, columns)
+        fragments = []
+        for row in rows:
+            if not self.enabled:
+                fragments.append(self.render_row(row, visible))
+                continue
+            try:
+                key = (row.get("id"), schema, tuple(row.values()))
+                hash(key)
+            except TypeError: # Unhashable column value: render without caching
+                fragments.append(self.render_row(row, visible))
+                continue
+            with self._lock:
+                fragment = self._entries.get(key)
+                if fragment is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+            if fragment is None:
+                fragment = self.render_row(row, visible)
+                with self._lock:
+                    self._stats["misses"] += 1
+                    self._entries[key] = fragment
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats["evictions"] += 1
+            fragments.append(fragment)
+        return header, fragments
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), enabled=self.enabled)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._headers.clear()
@@ -0,0 +1,281 @@
+"""
+Streaming extraction of SBML model metadata.
+
+Uploaded models are parsed once with ElementTree.iterparse, and every element is dropped
+from the tree as soon as it has been read, so memory use does not grow with model size.
+The summary (model id, reaction/metabolite/gene counts, compartments, objective) is stored
+in model_sbml_meta (migrations/003_model_sbml_meta.sql), which the /api/models/sbml route
+filters and sorts without opening any file.
+
+With collect_entities=True the same pass also collects the reaction, metabolite (species)
+and gene ids of the model for the model_entities inverted index (migrations/004); those id
+sets are then the only part of the parse that grows with the model.
+
+Understands SBML Level 3 with the fbc package (geneProduct, objectives) as well as the older
+COBRA Level 2 conventions (GENE_ASSOCIATION notes, OBJECTIVE_COEFFICIENT kinetic law parameters).
+"""
+import re
+import xml.etree.ElementTree as ET
+
+# API sort key -> model_sbml_meta column
+SORT_COLUMNS = {
+    "id":          "m.model_id",
+    "reactions":   "m.reaction_count",
+    "metabolites": "m.metabolite_count",
+    "genes":       "m.gene_count",
+    "compartments": "m.compartment_count",
+}
+# API range filter prefix -> column (?min_reactions=&max_reactions=, ...)
+RANGE_FILTERS = {
+    "reactions":   "m.reaction_count",
+    "metabolites": "m.metabolite_count",
+    "genes":       "m.gene_count",
+}
+META_COLUMNS = (
+    "sbml_model_id", "model_name", "sbml_level", "sbml_version", "reaction_count",
+    "metabolite_count", "gene_count", "compartment_count", "compartments",
+    "objective", "objective_sense", "parse_error",
+)
+
+ENTITY_TYPES = ("reaction", "metabolite", "gene")
+# SBML id prefix conventionally added to each entity type (BiGG/COBRA style), stripped when indexing
+_ENTITY_PREFIXES = {"reaction": "R_", "metabolite": "M_", "gene": "G_"}
+
+_GENE_ASSOCIATION_RE = re.compile(r"^\s*GENE[_ ]ASSOCIATION\s*:\s*(.*)$", re.IGNORECASE | re.DOTALL)
+_GENE_TOKEN_RE = re.compile(r"[^\s()]+")
+
+
+def _local(name):
+    """ Strips the '{namespace}' prefix from a tag or attribute name. """
+    return name.rsplit("}", 1)[-1]
+
+
+def _attr(elem, name):
+    """ Attribute by local name, whatever namespace prefix it was written with (e.g. fbc:reaction). """
+    value = elem.get(name)
+    if value is not None:
+        return value
+    for key, value in elem.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+def empty_summary(parse_error=None):
+    summary = {column: None for column in META_COLUMNS}
+    summary.update(reaction_count=0, metabolite_count=0, gene_count=0, compartment_count=0,
+                   parse_error=parse_error)
+    return summary
+
+
+def normalize_entity_id(entity_type, entity_id):
+    """ Index/lookup form of an id: the type's conventional prefix (R_, M_, G_) is dropped. """
+    entity_id = entity_id.strip()
+    prefix = _ENTITY_PREFIXES[entity_type]
+    if entity_id.startswith(prefix) and len(entity_id) > len(prefix):
+        return entity_id[len(prefix):]
+    return entity_id
+
+
+def extract_sbml_metadata(source, collect_entities=False):
+    """
+    Parses an SBML document (path or binary file object) and returns a dict with the
+    META_COLUMNS keys, plus 'entities' ({type: set of normalised ids}) if collect_entities.
+    Raises ET.ParseError for malformed XML and ValueError for XML that is not SBML.
+    """
+    summary = empty_summary()
+    entities = {entity_type: set() for entity_type in ENTITY_TYPES} if collect_entities else None
+    compartments = []
+    gene_products = 0
+    legacy_genes = set()
+    fbc_objectives = {} # objective id -> (type, [(reaction, coefficient)])
+    active_objective = None
+    current_objective = None
+    legacy_objective = []
+    current_reaction = None
+    stack = []
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if not stack and tag != "sbml":
+                raise ValueError(f"Not an SBML document (root element is <{tag}>).")
+            stack.append(elem)
+            if tag == "sbml":
+                summary["sbml_level"] = _int_or_none(elem.get("level"))
+                summary["sbml_version"] = _int_or_none(elem.get("version"))
+            elif tag == "model":
+                summary["sbml_model_id"] = elem.get("id")
+                summary["model_name"] = elem.get("name")
+            elif tag == "compartment":
+                compartments.append(elem.get("id") or elem.get("name") or "")
+            elif tag == "species":
+                summary["metabolite_count"] += 1
+                if entities is not None and elem.get("id"):
+                    entities["metabolite"].add(normalize_entity_id("metabolite", elem.get("id")))
+            elif tag == "reaction":
+                summary["reaction_count"] += 1
+                current_reaction = elem.get("id")
+                if entities is not None and current_reaction:
+                    entities["reaction"].add(normalize_entity_id("reaction", current_reaction))
+            elif tag == "geneProduct":
+                gene_products += 1
+                if entities is not None:
+                    # Prefer the label (the locus tag, e.g. b0001) over the SBML id (G_b0001)
+                    gene_id = _attr(elem, "label") or _attr(elem, "id")
+                    if gene_id:
+                        entities["gene"].add(normalize_entity_id("gene", gene_id))
+            elif tag == "listOfObjectives":
+                active_objective = _attr(elem, "activeObjective")
+            elif tag == "objective":
+                current_objective = _attr(elem, "id")
+                fbc_objectives[current_objective] = (_attr(elem, "type"), [])
+            elif tag == "fluxObjective" and current_objective is not None:
+                fbc_objectives[current_objective][1].append(
+                    (_attr(elem, "reaction"), _float_or_none(_attr(elem, "coefficient")))
+                )
+            elif tag == "parameter" and current_reaction and elem.get("id") == "OBJECTIVE_COEFFICIENT":
+                coefficient = _float_or_none(elem.get("value"))
+                if coefficient:
+                    legacy_objective.append((current_reaction, coefficient))
+            continue
+
+        # end event: text is complete now
+        if tag == "p" and not gene_products:
+            match = _GENE_ASSOCIATION_RE.match("".join(elem.itertext()))
+            if match:
+                legacy_genes.update(
+                    token for token in _GENE_TOKEN_RE.findall(match.group(1))
+                    if token.lower() not in ("and", "or")
+                )
+        elif tag == "reaction":
+            current_reaction = None
+        elif tag == "objective":
+            current_objective = None
+        stack.pop()
+        if stack:
+            # The element has been fully read; drop it so the tree never holds more than the open path
+            del stack[-1][-1]
+
+    summary["gene_count"] = gene_products or len(legacy_genes)
+    if entities is not None:
+        if not gene_products:
+            entities["gene"].update(normalize_entity_id("gene", gene) for gene in legacy_genes)
+        summary["entities"] = entities
+    summary["compartment_count"] = len(compartments)
+    summary["compartments"] = ",".join(compartments)[:1024] or None
+    if fbc_objectives:
+        sense, terms = fbc_objectives.get(active_objective) or next(iter(fbc_objectives.values()))
+        summary["objective_sense"] = sense
+    else:
+        sense, terms = ("maximize" if legacy_objective else None), legacy_objective
+        summary["objective_sense"] = sense
+    summary["objective"] = _format_objective(terms)
+    return summary
+
+
+def _format_objective(terms):
+    if not terms:
+        return None
+    text = " + ".join(reaction if coefficient in (None, 1.0) else f"{coefficient:g}*{reaction}"
+                      for reaction, coefficient in terms)
+    return text[:1024]
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_meta_query(values):
+    """
+    Reads ?min_<x>=/max_<x>= (x: reactions, metabolites, genes), ?compartment=, ?sbml_id=,
+    ?sort= (id, reactions, metabolites, genes, compartments) and ?order= (asc/desc) from a
+    request args dict. Returns (where clauses, params, sort column, order); raises ValueError.
+    """
+    clauses, params = [], []
+    for name, column in RANGE_FILTERS.items():
+        for bound, op in (("min", ">="), ("max", "<=")):
+            raw = values.get(f"{bound}_{name}")
+            if raw in (None, ""):
+                continue
+            try:
+                number = int(raw)
+            except ValueError:
+                raise ValueError(f"'{bound}_{name}' must be an integer.")
+            clauses.append(f"{column} {op} ?")
+            params.append(number)
+    compartment = (values.get("compartment") or "").strip()
+    if compartment:
+        # compartments is a comma-separated list; match whole entries only
+        clauses.append("CONCAT(',', m.compartments, ',') LIKE ?")
+        escaped = compartment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%,{escaped},%")
+    sbml_id = (values.get("sbml_id") or "").strip()
+    if sbml_id:
+        clauses.append("m.sbml_model_id = ?")
+        params.append(sbml_id)
+    if values.get("parsed") in ("1", "true", "yes"):
+        clauses.append("m.parse_error IS NULL")
+
+    sort = (values.get("sort") or "id").strip().lower()
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Invalid sort '{sort}'. Use one of: {', '.join(SORT_COLUMNS)}.")
+    order = (values.get("order") or "desc").strip().lower()
+    if order not in ("asc", "desc"):
+        raise ValueError(f"Invalid order '{order}'. Use 'asc' or 'desc'.")
+    return clauses, params, sort, order
+
+
+def parse_meta_cursor(token):
+    """ Decodes an ?after= keyset cursor '<sort value>:<model id>'; raises ValueError. """
+    value, _, model_id = (token or "").rpartition(":")
+    try:
+        return int(value), int(model_id)
+    except ValueError:
+        raise ValueError("Invalid 'after' cursor.")
+
+
+def parse_entity_args(values):
+    """
+    Reads ?reaction=, ?metabolite= and ?gene= (each repeatable, or comma-separated) plus
+    ?mode=and|or from a request args MultiDict. Returns ([(type, normalised id)], mode);
+    raises ValueError if no ids are given or the mode is invalid.
+    """
+    terms = []
+    for entity_type in ENTITY_TYPES:
+        for raw in values.getlist(entity_type):
+            for entity_id in raw.split(","):
+                if entity_id.strip():
+                    term = (entity_type, normalize_entity_id(entity_type, entity_id))
+                    if term not in terms:
+                        terms.append(term)
+    if not terms:
+        raise ValueError(f"Give at least one id with ?{'=, ?'.join(ENTITY_TYPES)}=.")
+    mode = (values.get("mode") or "and").strip().lower()
+    if mode not in ("and", "or"):
+        raise ValueError(f"Invalid mode '{mode}'. Use 'and' or 'or'.")
+    return terms, mode
+
+
+def build_entity_where(terms, mode="and"):
+    """
+    Returns (where, params) selecting gapfill_models rows that contain all (mode 'and') or any
+    (mode 'or') of the given (type, id) terms, answered from the model_entities primary key.
+    """
+    match = " OR ".join("(entity_type = ? AND entity_id = ?)" for _ in terms)
+    params = [value for term in terms for value in term]
+    sql = f"id IN (SELECT model_id FROM model_entities WHERE {match}"
+    if mode == "and" and len(terms) > 1:
+        sql += " GROUP BY model_id HAVING COUNT(*) = ?"
+        params.append(len(terms))
+    return sql + ")", tuple(params)
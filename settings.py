@@ -0,0 +1,54 @@
+"""
+Configuration lookup shared by app.py and app2.py.
+
+Every setting is named like an environment variable (DB_HOST, UPLOAD_FOLDER, QUERY_CACHE_TTL, ...)
+and read from the environment first. Settings can also be kept in a file named by GAPFILL_CONFIG,
+one NAME=value per line ('#' starts a comment line, values may be quoted), which is easier than
+setting a web server's environment under mod_wsgi. Values from the file are strings, exactly as
+they would be in the environment, so both sources are parsed the same way.
+"""
+import os
+
+CONFIG_FILE_VAR = "GAPFILL_CONFIG"
+
+
+def read_settings_file(path):
+    """ Parses a NAME=value settings file into a dict. Raises ValueError for malformed lines. """
+    values = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[len("export "):].lstrip()
+            name, sep, value = line.partition("=")
+            name, value = name.strip(), value.strip()
+            if not sep or not name:
+                raise ValueError(f"{path}:{number}: expected NAME=value.")
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            values[name] = value
+    return values
+
+
+class Settings:
+    """ Setting lookup: the environment, then the settings file, then the caller's default. """
+
+    def __init__(self, environ=None, file_values=None, path=None):
+        self.environ = os.environ if environ is None else environ
+        self.file_values = file_values or {}
+        self.path = path
+
+    def get(self, name, default=None):
+        value = self.environ.get(name)
+        if value is None:
+            value = self.file_values.get(name, default)
+        return value
+
+
+def load_settings(environ=None):
+    """ Settings from the environment and, if GAPFILL_CONFIG names one, its settings file. """
+    environ = os.environ if environ is None else environ
+    path = environ.get(CONFIG_FILE_VAR)
+    return Settings(environ, read_settings_file(path) if path else None, path)
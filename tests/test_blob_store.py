@@ -0,0 +1,37 @@
+"""
+Blob store garbage collection must not delete a blob an upload has just been stored as,
+even when the staging file or the existing blob is older than the grace period.
+
+    python -m pytest tests
+"""
+import io
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from blob_store import BlobStore  # noqa: E402
+
+OLD = (0, 0) # Long before any grace period
+
+
+def test_adopted_staging_file_is_not_collected(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    staged = tmp_path / "staged.xml"
+    staged.write_bytes(b"<sbml/>")
+    os.utime(staged, OLD) # Sat in the queue for a long time
+    digest, _, created = store.adopt_file(staged)
+    assert created
+    assert store.collect_garbage([], grace_seconds=3600) == []
+    assert store.exists(digest)
+
+
+def test_deduplicated_upload_refreshes_orphaned_blob(tmp_path):
+    store = BlobStore(tmp_path / "blobs", compression="gzip")
+    digest, _, _ = store.put_stream(io.BytesIO(b"a\tb\n1\t2\n"))
+    os.utime(store.locate(digest)[0], OLD) # Unreferenced leftover of a failed upload
+    assert store.put_stream(io.BytesIO(b"a\tb\n1\t2\n")) == (digest, 8, False)
+    assert store.collect_garbage([], grace_seconds=3600) == []
+
+    os.utime(store.locate(digest)[0], OLD)
+    assert store.collect_garbage([], grace_seconds=3600) == [digest]
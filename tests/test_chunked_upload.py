@@ -0,0 +1,75 @@
+"""
+Chunked uploads: finalizing must never store a staging file while a chunk is still being
+appended to it (chunked_upload.UploadSessions.locked).
+
+    python -m pytest tests
+"""
+import io
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from blob_store import BlobStore  # noqa: E402
+from chunked_upload import UploadError, UploadSessions  # noqa: E402
+
+
+class BlockingStream:
+    """ Request body that sends one chunk, then waits for ``release`` before sending the rest. """
+
+    def __init__(self, first, rest, release):
+        self.parts = [first, rest]
+        self.release = release
+        self.started = threading.Event()
+
+    def read(self, size=-1):
+        if not self.parts:
+            return b""
+        if len(self.parts) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return self.parts.pop(0)
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return UploadSessions(tmp_path / "uploads", max_size=1 << 20, chunk_size=4)
+
+
+def test_finalize_during_put_is_refused(sessions, tmp_path):
+    upload_id = sessions.create("model.xml")["upload_id"] # No total_size: any length completes it
+    release = threading.Event()
+    stream = BlockingStream(b"abcd", b"efgh", release)
+    put = threading.Thread(target=sessions.write_chunk, args=(upload_id, 0, stream))
+    put.start()
+    try:
+        assert stream.started.wait(5)
+        with pytest.raises(UploadError) as excinfo:
+            with sessions.locked(upload_id):
+                pass
+        assert excinfo.value.status == 409
+    finally:
+        release.set()
+        put.join(5)
+    assert sessions.status(upload_id)["offset"] == 8
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_put_during_finalize_is_refused(sessions, tmp_path, compression):
+    store = BlobStore(tmp_path / "blobs", compression=compression)
+    upload_id = sessions.create("model.xml")["upload_id"]
+    sessions.write_chunk(upload_id, 0, io.BytesIO(b"<sbml/>"))
+    with sessions.locked(upload_id):
+        part_path, _ = sessions.complete(upload_id)
+        with pytest.raises(UploadError) as excinfo:
+            sessions.write_chunk(upload_id, 7, io.BytesIO(b"tail"))
+        assert excinfo.value.status == 409
+        digest, size, _ = store.adopt_file(part_path)
+    with store.open(digest) as f:
+        assert f.read() == b"<sbml/>"
+    assert size == 7
+    if compression is None: # Hard-linked into the store: the staging file is frozen from now on
+        with pytest.raises(UploadError):
+            sessions.write_chunk(upload_id, 7, io.BytesIO(b"tail"))
@@ -0,0 +1,121 @@
+"""
+FBA on the bundled toy model (examples/toy_fba_model.xml, optimum 20) with SciPy's local HiGHS
+solver, and the write-back of a job result to growth_data.
+
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+from fba import FBAError, run_fba_job  # noqa: E402
+
+TOY_MODEL = REPO_DIR / "examples" / "toy_fba_model.xml"
+
+
+def test_toy_model_is_optimal():
+    pytest.importorskip("scipy")
+    result = run_fba_job(str(TOY_MODEL))
+    assert result["status"] == "optimal"
+    assert result["objective_value"] == pytest.approx(20.0)
+    assert result["growth"] is True
+    assert result["objective_fluxes"]["R_BIOMASS"] == pytest.approx(20.0)
+
+
+def test_bounds_override_can_make_model_infeasible():
+    pytest.importorskip("scipy")
+    # Biomass needs more pyruvate than the capped glucose uptake can supply
+    result = run_fba_job(str(TOY_MODEL), bound_overrides={"R_BIOMASS": [30, 1000]})
+    assert result["status"] == "infeasible"
+    assert result["objective_value"] is None
+    assert result["growth"] is False
+
+
+def test_bounds_override_without_glucose_means_no_growth():
+    pytest.importorskip("scipy")
+    result = run_fba_job(str(TOY_MODEL), bound_overrides={"R_EX_glc__D_e": [0, 1000]})
+    assert result["status"] == "optimal"
+    assert result["objective_value"] == pytest.approx(0.0)
+    assert result["growth"] is False
+
+
+@pytest.mark.parametrize("content, message", [
+    (b"<html><body>not a model</body></html>", "Not an SBML document"),
+    (b"<sbml><model", "not valid XML"),
+])
+def test_non_sbml_input_raises(tmp_path, content, message):
+    path = tmp_path / "model.xml"
+    path.write_bytes(content)
+    with pytest.raises(FBAError, match=message):
+        run_fba_job(str(path))
+
+
+class FakeCursor:
+    """ Records statements; SELECTs return ``row``, UPDATEs report ``rowcount`` changed rows. """
+
+    def __init__(self, row, rowcount=1):
+        self.row = row
+        self.rowcount = rowcount
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.statements.append((sql, list(rows)))
+
+    def fetchone(self):
+        return self.row
+
+
+@pytest.fixture
+def app2():
+    pytest.importorskip("mariadb")
+    import app2
+    return app2
+
+
+def fba_job(overwrite=False):
+    return {"id": 7, "model_id": 42, "payload": {"overwrite": overwrite}}
+
+
+def test_apply_fba_result_writes_growth(app2):
+    cur = FakeCursor(("M9", "CarveMe", "Prokka", None))
+    result = {"status": "optimal", "growth": True}
+    app2.apply_fba_result(cur, fba_job(), result)
+
+    assert result["growth_data_written"] is True
+    sql = [statement for statement, _ in cur.statements]
+    update = next(params for statement, params in cur.statements if statement.startswith("UPDATE gapfill_models"))
+    assert update == ("yes", 42)
+    assert "growth_data IS NULL" in next(s for s in sql if s.startswith("UPDATE gapfill_models"))
+    assert any("catalogue_state" in s for s in sql)
+    facet_rows = next(params for statement, params in cur.statements if "model_facet_counts" in statement)
+    assert sorted(row[-1] for row in facet_rows) == [-1, 1] # Moved from growth_data '' to 'yes'
+
+
+def test_apply_fba_result_keeps_typed_in_value(app2):
+    cur = FakeCursor(("M9", "CarveMe", "Prokka", "no"), rowcount=0) # growth_data already set: UPDATE matches nothing
+    result = {"status": "infeasible", "growth": False}
+    app2.apply_fba_result(cur, fba_job(), result)
+
+    assert result["growth_data_written"] is False
+    assert not any("catalogue_state" in statement or "model_facet_counts" in statement for statement, _ in cur.statements)
+
+
+def test_apply_fba_result_overwrite(app2):
+    cur = FakeCursor(("M9", "CarveMe", "Prokka", "no"))
+    app2.apply_fba_result(cur, fba_job(overwrite=True), {"status": "optimal", "growth": True})
+    update = next(statement for statement, _ in cur.statements if statement.startswith("UPDATE gapfill_models"))
+    assert "growth_data IS NULL" not in update
+
+
+def test_apply_fba_result_ignores_unsolved(app2):
+    cur = FakeCursor(None)
+    result = {"status": "unbounded", "growth": False}
+    app2.apply_fba_result(cur, fba_job(), result)
+    assert result["growth_data_written"] is False
+    assert cur.statements == []
@@ -0,0 +1,33 @@
+"""
+If-Range handling of requested_ranges(): a partial response only for a matching strong
+entity-tag or an unchanged Last-Modified date.
+
+    python -m pytest tests
+"""
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from http_ranges import requested_ranges  # noqa: E402
+
+LAST_MODIFIED = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("if_range, expected", [
+    (None, [(0, 10)]),
+    ('"abc"', [(0, 10)]),
+    ('"abd"', None),
+    ('W/"abc"', None), # Weak validators never allow a 206 (RFC 9110, 13.1.5)
+    ("Wed, 21 Oct 2015 07:28:00 GMT", [(0, 10)]),
+    ("Wed, 31 Dec 2014 07:28:00 GMT", None),
+])
+def test_if_range(if_range, expected):
+    headers = {"Range": "bytes=0-9"}
+    if if_range is not None:
+        headers["If-Range"] = if_range
+    with Flask(__name__).test_request_context(headers=headers):
+        assert requested_ranges(100, etag="abc", last_modified=LAST_MODIFIED) == expected
@@ -0,0 +1,330 @@
+"""
+Columnar cache for growth and biomass TSV files.
+
+Every TSV is parsed once (at upload, or on first use for older files) into one array per
+column and stored under its content digest, so identical files share a cache entry and an
+entry never goes stale. With NumPy (optional) each column is a .npy file that is memory-mapped
+on load: reading a few columns or a row range only touches those pages, and filters and
+statistics are vectorised. Without NumPy the columns are cached as JSON and computed in Python.
+
+A column is numeric if every non-empty value parses as a float (missing values become NaN);
+anything else is kept as text.
+"""
+import csv
+import io
+import json
+import logging
+import math
+import operator
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from importlib.util import find_spec
+from pathlib import Path
+
+# Optional dependency; without it tables are cached as JSON and computed in pure Python. Only
+# looked up here: numpy itself is imported by _numpy() when a table is first read or built, which
+# keeps it out of the app's import time.
+HAVE_NUMPY = find_spec("numpy") is not None
+_np = None
+
+logger = logging.getLogger(__name__)
+
+
+def _numpy():
+    global _np
+    if _np is None:
+        import numpy
+        _np = numpy
+    return _np
+
+STATS = ("count", "sum", "mean", "min", "max", "std")
+FILTER_OPS = {
+    ">=": operator.ge, "<=": operator.le, "!=": operator.ne,
+    "==": operator.eq, ">": operator.gt, "<": operator.lt, "=": operator.eq,
+}
+_FILTER_RE = re.compile(r"^(.+?)(>=|<=|!=|==|>|<|=)(.*)$")
+
+
+class TableError(ValueError):
+    """ Invalid column, filter or range in a table query (client error). """
+
+
+def parse_filters(raw_filters):
+    """ Parses ?filter= values like 'OD600>=0.5' or 'medium==M9' into (column, op, value) tuples. """
+    filters = []
+    for raw in raw_filters:
+        match = _FILTER_RE.match(raw.strip())
+        if not match:
+            raise TableError(f"Invalid filter '{raw}'. Use <column><op><value> with op one of >=, <=, >, <, ==, !=.")
+        filters.append((match.group(1).strip(), match.group(2), match.group(3).strip()))
+    return filters
+
+
+def parse_tsv(stream):
+    """ Reads a TSV (binary stream) into (column names, list of column value lists) in one pass. """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline=""), delimiter="\t")
+    header = next(reader, None)
+    if not header:
+        raise TableError("TSV file is empty.")
+    names = _unique_names(header)
+    columns = [[] for _ in names]
+    for row in reader:
+        if not row or (len(row) == 1 and not row[0].strip()):
+            continue
+        for i, column in enumerate(columns):
+            column.append(row[i].strip() if i < len(row) else "")
+    return names, columns
+
+
+def _unique_names(header):
+    names, seen = [], set()
+    for i, name in enumerate(header):
+        name = name.strip() or f"column_{i + 1}"
+        base, n = name, 2
+        while name in seen:
+            name, n = f"{base}_{n}", n + 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _as_numbers(values):
+    """ Returns the values as floats (NaN for empty), or None if any value is not a number. """
+    numbers = []
+    for value in values:
+        if value == "":
+            numbers.append(math.nan)
+            continue
+        try:
+            numbers.append(float(value))
+        except ValueError:
+            return None
+    return numbers
+
+
+class ColumnarTable:
+    """ A cached TSV: column names, kinds ('number' / 'text') and one array (or list) per column. """
+
+    def __init__(self, path, meta):
+        self.path = Path(path)
+        self.names = [c["name"] for c in meta["columns"]]
+        self.kinds = {c["name"]: c["kind"] for c in meta["columns"]}
+        self.n_rows = meta["rows"]
+        self._format = meta["format"]
+        self._columns = {}
+        self._lock = threading.Lock()
+        if self._format == "json":
+            with open(self.path / "columns.json", encoding="utf-8") as f:
+                data = json.load(f)
+            for name, values in zip(self.names, data):
+                if self.kinds[name] == "number":
+                    values = [math.nan if v is None else v for v in values]
+                self._columns[name] = values
+
+    def describe(self):
+        return {"rows": self.n_rows, "columns": [{"name": n, "kind": self.kinds[n]} for n in self.names]}
+
+    def column(self, name):
+        if name not in self.kinds:
+            raise TableError(f"Unknown column '{name}'.")
+        if name not in self._columns:
+            with self._lock:
+                if name not in self._columns:
+                    index = self.names.index(name)
+                    # Memory-mapped: only the pages actually read are loaded
+                    self._columns[name] = _numpy().load(self.path / f"{index}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def _mask(self, filters):
+        """ Row selection for the filters: a boolean array (NumPy) or a list of row indexes. """
+        if HAVE_NUMPY and self._format == "npy":
+            np = _numpy()
+            mask = np.ones(self.n_rows, dtype=bool)
+            for name, op, value in filters:
+                mask &= FILTER_OPS[op](self.column(name), self._filter_value(name, op, value))
+            return mask
+        rows = range(self.n_rows)
+        for name, op, value in filters:
+            column, compare, target = self.column(name), FILTER_OPS[op], self._filter_value(name, op, value)
+            rows = [i for i in rows if compare(column[i], target)]
+        return list(rows)
+
+    def _filter_value(self, name, op, value):
+        if self.kinds.get(name) == "number":
+            try:
+                return float(value)
+            except ValueError:
+                raise TableError(f"Column '{name}' is numeric; '{value}' is not a number.")
+        if op not in ("==", "=", "!="):
+            raise TableError(f"Column '{name}' is text; only == and != filters apply.")
+        return value
+
+    def _row_indexes(self, filters):
+        mask = self._mask(filters)
+        if HAVE_NUMPY and self._format == "npy":
+            return _numpy().flatnonzero(mask)
+        return mask
+
+    def select(self, columns=None, start=0, stop=None, filters=()):
+        """
+        Returns {'rows': matching row count, 'start', 'stop', 'data': {column: values}} for the
+        requested columns (all by default), filtered, then sliced to [start, stop).
+        """
+        columns = columns or self.names
+        for name in columns:
+            if name not in self.kinds:
+                raise TableError(f"Unknown column '{name}'.")
+        indexes = self._row_indexes(filters) if filters else None
+        total = len(indexes) if indexes is not None else self.n_rows
+        start = min(start, total)
+        stop = total if stop is None else min(max(stop, start), total)
+        if indexes is not None:
+            indexes = indexes[start:stop]
+        data = {}
+        for name in columns:
+            column = self.column(name)
+            if indexes is None:
+                values = column[start:stop]
+            elif HAVE_NUMPY and self._format == "npy":
+                values = column[indexes]
+            else:
+                values = [column[i] for i in indexes]
+            data[name] = _to_json_values(values, self.kinds[name])
+        return {"rows": total, "start": start, "stop": stop, "data": data}
+
+    def partial_stats(self, name, filters=()):
+        """ Mergeable statistics of a numeric column: count, sum, sum of squares, min, max. """
+        if self.kinds.get(name) != "number":
+            raise TableError(f"Column '{name}' is not numeric." if name in self.kinds else f"Unknown column '{name}'.")
+        column = self.column(name)
+        if HAVE_NUMPY and self._format == "npy":
+            np = _numpy()
+            values = column[self._mask(filters)] if filters else column
+            values = values[~np.isnan(values)]
+            if not values.size:
+                return {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None}
+            return {"count": int(values.size), "sum": float(values.sum()), "sumsq": float(np.dot(values, values)),
+                    "min": float(values.min()), "max": float(values.max())}
+        indexes = self._mask(filters) if filters else range(self.n_rows)
+        values = [column[i] for i in indexes if not math.isnan(column[i])]
+        if not values:
+            return {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None}
+        return {"count": len(values), "sum": math.fsum(values), "sumsq": math.fsum(v * v for v in values),
+                "min": min(values), "max": max(values)}
+
+
+def merge_stats(parts):
+    """ Combines partial_stats() results (e.g. of many models) into one. """
+    merged = {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None}
+    for part in parts:
+        if not part["count"]:
+            continue
+        merged["count"] += part["count"]
+        merged["sum"] += part["sum"]
+        merged["sumsq"] += part["sumsq"]
+        merged["min"] = part["min"] if merged["min"] is None else min(merged["min"], part["min"])
+        merged["max"] = part["max"] if merged["max"] is None else max(merged["max"], part["max"])
+    return merged
+
+
+def finish_stats(partial, stats=STATS):
+    """ Turns partial statistics into the requested final ones (count, sum, mean, min, max, std). """
+    count = partial["count"]
+    mean = partial["sum"] / count if count else None
+    result = {
+        "count": count,
+        "sum": partial["sum"] if count else None,
+        "mean": mean,
+        "min": partial["min"],
+        "max": partial["max"],
+        # Population standard deviation; clamp tiny negative rounding errors
+        "std": math.sqrt(max(partial["sumsq"] / count - mean * mean, 0.0)) if count else None,
+    }
+    return {stat: result[stat] for stat in stats}
+
+
+def _to_json_values(values, kind):
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    if kind == "number":
+        return [None if v != v else v for v in values] # NaN -> null
+    return list(values)
+
+
+class TableCache:
+    """ Columnar tables stored under ``root`` by content digest, with a small in-memory LRU of open tables. """
+
+    def __init__(self, root, max_open=64):
+        self.root = Path(root)
+        self.format = "npy" if HAVE_NUMPY else "json"
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path_for(self, digest):
+        return self.root / digest[:2] / f"{digest}.{self.format}"
+
+    def get(self, digest, opener):
+        """
+        Returns the ColumnarTable for ``digest``, parsing the file from ``opener()`` (a function
+        returning a binary stream) and caching it first if needed.
+        """
+        with self._lock:
+            table = self._open.get(digest)
+            if table is not None:
+                self._open.move_to_end(digest)
+                return table
+        path = self.path_for(digest)
+        if not (path / "meta.json").is_file():
+            with opener() as stream:
+                self.build(digest, stream)
+        with open(path / "meta.json", encoding="utf-8") as f:
+            table = ColumnarTable(path, json.load(f))
+        with self._lock:
+            self._open[digest] = table
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return table
+
+    def exists(self, digest):
+        return (self.path_for(digest) / "meta.json").is_file()
+
+    def build(self, digest, stream):
+        """ Parses a TSV stream and writes its columnar form (atomically: built aside, then renamed). """
+        names, raw_columns = parse_tsv(stream)
+        columns_meta, columns = [], []
+        for name, values in zip(names, raw_columns):
+            numbers = _as_numbers(values)
+            columns_meta.append({"name": name, "kind": "number" if numbers is not None else "text"})
+            columns.append(numbers if numbers is not None else values)
+        meta = {"columns": columns_meta, "rows": len(raw_columns[0]) if raw_columns else 0, "format": self.format}
+
+        dest = self.path_for(digest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=dest.parent, prefix=".build-"))
+        try:
+            if self.format == "npy":
+                np = _numpy()
+                for i, (column_meta, values) in enumerate(zip(columns_meta, columns)):
+                    dtype = np.float64 if column_meta["kind"] == "number" else np.str_
+                    np.save(tmp_dir / f"{i}.npy", np.asarray(values, dtype=dtype), allow_pickle=False)
+            else:
+                with open(tmp_dir / "columns.json", "w", encoding="utf-8") as f:
+                    json.dump([[None if isinstance(v, float) and v != v else v for v in values] for values in columns], f)
+            with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            try:
+                os.rename(tmp_dir, dest)
+            except OSError:
+                if not (dest / "meta.json").is_file():
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True) # Built concurrently by another request; keep theirs
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        logger.info("Cached columnar table %s (%d rows, %d columns, %s)", digest, meta["rows"], len(names), self.format)
+        return meta
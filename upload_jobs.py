@@ -0,0 +1,86 @@
+"""
+Worker-process half of asynchronous uploads (POST /api/models with UPLOAD_ASYNC=1).
+
+The request only writes the uploaded bytes to a staging directory and queues an 'upload' job
+(job_queue.py). process_upload() then does the slow part in a job worker process: it hashes
+each staged file into the blob store (hard-linking it into place when it can), extracts the
+main file's SBML metadata and entity index, builds the columnar cache of the TSVs and diffs a
+new version against its parent. The job's apply step in app2.py inserts the gapfill_models row
+from the result, so the catalogue only ever shows fully processed models.
+
+The staged files stay until the job is final (cleanup_staging(), the job's cleanup step): a job
+whose processing or insert failed is queued again and re-reads them, and adopting a file that is
+already in the blob store is a no-op.
+"""
+import logging
+import shutil
+import xml.etree.ElementTree as ET
+
+from blob_store import BlobStore, make_link
+from fba import FBAError
+from model_versions import SnapshotCache, diff_snapshots
+from sbml_metadata import extract_sbml_metadata, empty_summary
+from tsv_columns import TableCache, TableError
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_JOB_KIND = "upload"
+
+
+def process_upload(blob_root, compression, table_root, snapshot_root, files, parent=None):
+    """
+    Stores and processes the files of one staged upload. ``files`` maps the gapfill_models column
+    ('file_link', 'growth_file', ...) to {"name", "path"} of a staged file; ``parent`` is None or
+    {"id", "sha256", "link", "path"} of the model this upload is a new version of ('path' is set
+    for parents stored outside the blob store). Returns {"files", "summary", "diff", "warnings",
+    "parent_sha256"}. The staging directory is left in place; see cleanup_staging().
+    """
+    store = BlobStore(blob_root, compression=compression)
+    stored = {}
+    for column, staged in files.items():
+        digest, size, created = store.adopt_file(staged["path"])
+        stored[column] = {"link": make_link(digest, staged["name"]), "sha256": digest, "size": size, "created": created}
+
+    warnings = []
+    main = stored["file_link"]
+    summary = None
+    if main["link"].lower().endswith(".xml"):
+        try:
+            with store.open(main["sha256"]) as f:
+                summary = extract_sbml_metadata(f, collect_entities=True)
+        except (ET.ParseError, ValueError) as e:
+            # Not valid SBML: stored with the reason, like synchronous uploads
+            summary = empty_summary(parse_error=str(e)[:512])
+            warnings.append(f"Main file is not parseable SBML: {e}")
+
+    tables = TableCache(table_root)
+    for column, info in stored.items():
+        if info["link"].lower().endswith(".tsv"):
+            try:
+                tables.get(info["sha256"], lambda digest=info["sha256"]: store.open(digest))
+            except (TableError, OSError) as e:
+                warnings.append(f"Could not build columnar cache for {column}: {e}")
+
+    diff = None
+    if parent and parent.get("sha256") and (parent.get("link") or "").lower().endswith(".xml") \
+            and main["link"].lower().endswith(".xml"):
+        snapshots = SnapshotCache(snapshot_root)
+        try:
+            old = snapshots.get(parent["sha256"], lambda: open(parent["path"], "rb") if parent.get("path")
+                                else store.open(parent["sha256"]))
+            new = snapshots.get(main["sha256"], lambda: store.open(main["sha256"]))
+            diff = diff_snapshots(old, new)
+        except (ET.ParseError, FBAError, OSError, ValueError) as e:
+            warnings.append(f"Could not diff against parent model {parent['id']}: {e}")
+
+    for warning in warnings:
+        logger.warning("Upload processing: %s", warning)
+    return {"files": stored, "summary": summary, "diff": diff, "warnings": warnings,
+            "parent_sha256": parent.get("sha256") if parent else None}
+
+
+def cleanup_staging(job):
+    """ Job cleanup step: removes an upload job's staging directory once the job has succeeded or failed for good. """
+    staging_dir = (job.get("payload") or {}).get("staging")
+    if staging_dir:
+        shutil.rmtree(staging_dir, ignore_errors=True)